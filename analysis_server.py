@@ -0,0 +1,277 @@
+import asyncio
+import json
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from typing import Callable, Dict, Optional, Tuple
+
+# Requests larger than this are rejected before their body is read
+MAX_REQUEST_BYTES = 1024 * 1024
+
+
+class RequestError(Exception):
+    """
+    A client error reported back as an HTTP status and message
+    """
+    
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class AnalysisServer:
+    """
+    Long-running asyncio server around one PersonaDrivenAnalyzer, listening on a local TCP port or Unix socket.
+    Extracted document sets and persisted indexes are kept warm in an LRU keyed by file path, size and
+    modification time. Extraction and ranking run in a thread pool so the event loop keeps serving other requests.
+    The warm corpora live in this process, so requests share its GIL: their pure-Python parts (keyword scoring,
+    sub-section selection) run one at a time, and only the NumPy/scikit-learn work and extraction I/O overlap.
+    Run one server per core behind a load balancer to answer CPU-bound requests in parallel.
+    
+    Endpoints:
+      POST /analyze  {"persona", "job" (or "job_to_be_done"), and one of "input_dir", "documents" or "index_dir"}
+      GET  /health   server status and the number of warm corpora
+    """
+    
+    def __init__(self, analyzer, max_corpora: int = 8, request_workers: int = 4):
+        self.analyzer = analyzer
+        self.max_corpora = max_corpora
+        self.executor = ThreadPoolExecutor(max_workers=request_workers)
+        self.corpora = OrderedDict()
+        self._loading = {}
+    
+    async def serve(self, host: str = '127.0.0.1', port: int = 8080, unix_socket: Optional[str] = None):
+        """
+        Warm up the analyzer and serve requests until cancelled
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self.analyzer.warm_up)
+        
+        if unix_socket:
+            server = await asyncio.start_unix_server(self.handle_connection, path=unix_socket)
+            print(f"Analysis server listening on {unix_socket}")
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+            print(f"Analysis server listening on http://{host}:{port}")
+        
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.executor.shutdown(wait=False)
+            if unix_socket and os.path.exists(unix_socket):
+                os.remove(unix_socket)
+    
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Serve one HTTP request per connection
+        """
+        try:
+            method, path, body = await self._read_request(reader)
+            status, response = HTTPStatus.OK, await self.dispatch(method, path, body)
+        except RequestError as e:
+            status, response = e.status, {'error': str(e)}
+        except Exception as e:
+            print(f"Error handling request: {e}")
+            status, response = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': str(e)}
+        
+        payload = json.dumps(response, ensure_ascii=False).encode('utf-8')
+        writer.write(
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: close\r\n\r\n".encode('latin-1') + payload
+        )
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+    
+    async def dispatch(self, method: str, path: str, body: bytes) -> Dict:
+        """
+        Route a request to its handler and return the JSON response body
+        """
+        if path == '/health':
+            if method != 'GET':
+                raise RequestError(HTTPStatus.METHOD_NOT_ALLOWED, "Use GET /health")
+            health = {'status': 'ok', 'warm_corpora': len(self.corpora)}
+            if self.analyzer.metrics:
+                health['metrics'] = self.analyzer.metrics.to_dict()
+            return health
+        
+        if path == '/analyze':
+            if method != 'POST':
+                raise RequestError(HTTPStatus.METHOD_NOT_ALLOWED, "Use POST /analyze")
+            try:
+                request = json.loads(body or b'{}')
+            except ValueError:
+                raise RequestError(HTTPStatus.BAD_REQUEST, "Request body must be JSON")
+            return await self.analyze(request)
+        
+        raise RequestError(HTTPStatus.NOT_FOUND, f"Unknown path: {path}")
+    
+    async def analyze(self, request: Dict) -> Dict:
+        """
+        Answer a persona/job request against a warm (or newly loaded) corpus
+        """
+        self._check_request(request)
+        persona = request['persona']
+        job = request.get('job_to_be_done', request.get('job'))
+        
+        documents, sections, index = await self._corpus(request)
+        
+        documents_data = [{'filename': filename} for filename in documents]
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, self.analyzer.analyze_sections, documents_data, sections, persona, job, index
+        )
+    
+    @staticmethod
+    def _check_request(request: Dict):
+        """
+        Reject requests whose fields do not have the documented types
+        """
+        if not isinstance(request, dict):
+            raise RequestError(HTTPStatus.BAD_REQUEST, "Request body must be a JSON object")
+        
+        persona = request.get('persona')
+        job = request.get('job_to_be_done', request.get('job'))
+        if not persona or not job:
+            raise RequestError(HTTPStatus.BAD_REQUEST, "persona and job are required")
+        if not isinstance(persona, str) or not isinstance(job, str):
+            raise RequestError(HTTPStatus.BAD_REQUEST, "persona and job must be strings")
+        
+        documents = request.get('documents')
+        if documents is not None and not (isinstance(documents, list) and all(isinstance(path, str) for path in documents)):
+            raise RequestError(HTTPStatus.BAD_REQUEST, "documents must be a list of paths")
+        for name in ('input_dir', 'index_dir'):
+            if request.get(name) is not None and not isinstance(request[name], str):
+                raise RequestError(HTTPStatus.BAD_REQUEST, f"{name} must be a path")
+    
+    async def _corpus(self, request: Dict) -> Tuple:
+        """
+        (documents, sections, index) for the document set of a request, from the LRU when unchanged
+        """
+        key, loader = self._corpus_source(request)
+        
+        if key in self.corpora:
+            self.corpora.move_to_end(key)
+            return self.corpora[key]
+        
+        # Concurrent requests for the same corpus wait for a single load
+        if key not in self._loading:
+            loop = asyncio.get_running_loop()
+            self._loading[key] = asyncio.ensure_future(loop.run_in_executor(self.executor, loader))
+        future = self._loading[key]
+        try:
+            corpus = await asyncio.shield(future)
+        finally:
+            if future.done():
+                self._loading.pop(key, None)
+        
+        self.corpora[key] = corpus
+        while len(self.corpora) > self.max_corpora:
+            self.corpora.popitem(last=False)
+        
+        return corpus
+    
+    def _corpus_source(self, request: Dict) -> Tuple[Tuple, Callable]:
+        """
+        Cache key and loader for the document set named in a request
+        """
+        if request.get('index_dir'):
+            index_dir = os.path.abspath(request['index_dir'])
+            metadata_path = os.path.join(index_dir, 'index.json')
+            if not os.path.isfile(metadata_path):
+                raise RequestError(HTTPStatus.BAD_REQUEST, f"No index found in {request['index_dir']}")
+            
+            def load_index():
+                from corpus_index import load_index
+                index = load_index(index_dir)
+                index.sections.build_keyword_matchers()
+                return index.documents, index.sections, index
+            
+            return ('index',) + self._file_signature([metadata_path]), load_index
+        
+        if request.get('documents'):
+            pdf_paths = [os.path.abspath(path) for path in request['documents']]
+        elif request.get('input_dir'):
+            input_dir = request['input_dir']
+            if not os.path.isdir(input_dir):
+                raise RequestError(HTTPStatus.BAD_REQUEST, f"Not a directory: {input_dir}")
+            pdf_paths = [os.path.abspath(os.path.join(input_dir, name)) for name in self.analyzer.list_pdfs(input_dir)]
+        else:
+            raise RequestError(HTTPStatus.BAD_REQUEST, "One of input_dir, documents or index_dir is required")
+        
+        missing = [path for path in pdf_paths if not os.path.isfile(path)]
+        if missing:
+            raise RequestError(HTTPStatus.BAD_REQUEST, f"Documents not found: {', '.join(missing)}")
+        
+        documents = [os.path.basename(path) for path in pdf_paths]
+        
+        def load_documents():
+            sections, index = self.analyzer.build_corpus(documents, pdf_paths)
+            # A cached corpus answers many requests, so its keyword matchers are built once up front
+            sections.build_keyword_matchers()
+            return documents, sections, index
+        
+        return ('documents',) + self._file_signature(pdf_paths), load_documents
+    
+    @staticmethod
+    def _file_signature(paths) -> Tuple:
+        """
+        Identify files by path, size and modification time so edited files are reloaded
+        """
+        signature = []
+        for path in paths:
+            stat = os.stat(path)
+            signature.append((path, stat.st_size, stat.st_mtime_ns))
+        return tuple(signature)
+    
+    @staticmethod
+    async def _read_request(reader: asyncio.StreamReader) -> Tuple[str, str, bytes]:
+        """
+        Parse the request line, headers and body of an HTTP/1.x request
+        """
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            raise RequestError(HTTPStatus.BAD_REQUEST, "Malformed request")
+        
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, _ = lines[0].split(' ', 2)
+        except ValueError:
+            raise RequestError(HTTPStatus.BAD_REQUEST, "Malformed request line")
+        
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise RequestError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+        if length > MAX_REQUEST_BYTES:
+            raise RequestError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Request body too large")
+        
+        try:
+            body = await reader.readexactly(length) if length else b''
+        except asyncio.IncompleteReadError:
+            raise RequestError(HTTPStatus.BAD_REQUEST, "Incomplete request body")
+        return method.upper(), target.split('?', 1)[0], body
+
+
+def run(analyzer, host: str = '127.0.0.1', port: int = 8080, unix_socket: Optional[str] = None,
+        max_corpora: int = 8, request_workers: int = 4):
+    """
+    Run the analysis server until interrupted
+    """
+    server = AnalysisServer(analyzer, max_corpora, request_workers)
+    try:
+        asyncio.run(server.serve(host, port, unix_socket))
+    except KeyboardInterrupt:
+        print("Analysis server stopped")
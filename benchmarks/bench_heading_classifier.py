@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for heading classification over the lines of the sample PDFs.
+
+Compares the precompiled single-pass classifier against the original
+per-line regex implementation and checks that both agree.
+
+Usage: python benchmarks/bench_heading_classifier.py [--repeat N] [pdf ...]
+"""
+
+import argparse
+import glob
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pdfplumber
+from persona_analyzer import classify_heading
+
+
+def legacy_is_heading(line):
+    """
+    Original heading detection: six patterns compiled and matched per line
+    """
+    line = line.strip()
+    heading_patterns = [
+        r'^\d+\.\s+[A-Z]',
+        r'^\d+\.\d+\s+[A-Z]',
+        r'^[A-Z][A-Z\s]+$',
+        r'^[A-Z][a-z]+(\s+[A-Z][a-z]+)*$',
+        r'^Chapter\s+\d+',
+        r'^Section\s+\d+',
+    ]
+    return any(re.match(pattern, line) for pattern in heading_patterns)
+
+
+def legacy_clean_heading(heading):
+    """
+    Original heading cleanup: three substitutions per heading
+    """
+    heading = re.sub(r'^\d+(\.\d+)*\s+', '', heading)
+    heading = re.sub(r'^Chapter\s+\d+:?\s*', '', heading, flags=re.IGNORECASE)
+    heading = re.sub(r'^Section\s+\d+:?\s*', '', heading, flags=re.IGNORECASE)
+    return heading.strip()
+
+
+def legacy_classify(line):
+    if legacy_is_heading(line):
+        return legacy_clean_heading(line)
+    return None
+
+
+def load_lines(pdf_paths):
+    """
+    Extract the non-empty lines of every page, as the section extractor sees them
+    """
+    lines = []
+    for pdf_path in pdf_paths:
+        with pdfplumber.open(pdf_path) as pdf:
+            for page in pdf.pages:
+                text = page.extract_text() or ''
+                lines.extend(line.strip() for line in text.split('\n') if line.strip())
+    return lines
+
+
+def time_lines_per_sec(classify, lines, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for line in lines:
+            classify(line)
+        best = min(best, time.perf_counter() - start)
+    return len(lines) / best
+
+
+def main():
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('pdfs', nargs='*', default=sorted(glob.glob(os.path.join(repo_root, 'input', '*.pdf'))))
+    parser.add_argument('--repeat', type=int, default=5, help="Timing repetitions (best run is reported)")
+    args = parser.parse_args()
+    
+    lines = load_lines(args.pdfs)
+    print(f"Lines: {len(lines)} from {len(args.pdfs)} PDFs")
+    
+    mismatches = 0
+    for line in lines:
+        new = classify_heading(line)
+        if (new[0] if new else None) != legacy_classify(line):
+            mismatches += 1
+    print(f"Mismatches against legacy classifier: {mismatches}")
+    
+    before = time_lines_per_sec(legacy_classify, lines, args.repeat)
+    after = time_lines_per_sec(classify_heading, lines, args.repeat)
+    print(f"Legacy:     {before:,.0f} lines/sec")
+    print(f"Classifier: {after:,.0f} lines/sec ({after / before:.1f}x)")
+    
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+End-to-end and per-method benchmark of PersonaDrivenAnalyzer on synthetic PDF corpora.
+
+Each scenario generates (or reuses) a deterministic corpus and runs in a fresh interpreter,
+so peak RSS is measured per scenario. Results are compared against a stored baseline:
+slower stages, lower throughput, higher memory or a changed analysis output fail the run.
+Timings depend on the machine, so they are only compared against a baseline recorded on the
+same kind of machine (CPU count, architecture, Python version); record one per machine.
+
+Usage: python benchmarks/bench_pipeline.py [--scenarios docs10,docs100,long] [--tolerance 0.5]
+                                           [--baseline FILE] [--update-baseline] [--ignore-machine]
+                                           [--output FILE]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from synthetic_pdfs import generate_corpus  # noqa: E402
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# Scenario name -> (documents, pages per document)
+SCENARIOS = {
+    'docs10': (10, 4),
+    'docs100': (100, 4),
+    'docs1000': (1000, 1),
+    'long': (1, 200),
+}
+DEFAULT_SCENARIOS = ('docs10', 'docs100', 'long')
+
+PERSONA = "PhD Researcher in Computational Biology"
+JOB = "Prepare a literature review of methods, datasets and benchmarks for drug discovery"
+
+# Differences below this many seconds are treated as noise, whatever the ratio
+NOISE_SECONDS = 0.05
+
+# Machine properties that must match the baseline's for timings to be compared
+MACHINE_KEYS = ('cpus', 'arch', 'python')
+
+
+def machine_info():
+    """
+    Description of this machine, stored with the results
+    """
+    return {'python': '.'.join(platform.python_version_tuple()[:2]), 'platform': platform.platform(),
+            'arch': platform.machine(), 'cpus': os.cpu_count()}
+
+
+def same_machine(first, second):
+    """
+    Whether timings recorded on two machines are comparable
+    """
+    return all(first.get(key) == second.get(key) for key in MACHINE_KEYS)
+
+
+def describe_machine(machine):
+    return ', '.join(f"{key} {machine.get(key)}" for key in MACHINE_KEYS)
+
+
+def best_of(function, repeat):
+    """
+    Best wall-clock seconds of several calls
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_scenario(corpus_dir, workers, repeat):
+    """
+    Benchmark one corpus in this process and return the results
+    """
+    from bm25_index import BM25Index
+    from corpus_index import CorpusIndex
+    from persona_analyzer import PersonaDrivenAnalyzer
+    from subsections import SubsectionEngine
+    
+    class RecordingAnalyzer(PersonaDrivenAnalyzer):
+        # Keeps the extracted sections so the per-method timings need no second extraction
+        def _write_analysis(self, output_file, documents_data, all_sections, *args, **kwargs):
+            self.sections = all_sections
+            return super()._write_analysis(output_file, documents_data, all_sections, *args, **kwargs)
+    
+    analyzer = RecordingAnalyzer(workers=workers, fast_start=True, collect_metrics=True)
+    analyzer.warm_up()
+    
+    with tempfile.TemporaryDirectory() as output_dir:
+        output_file = os.path.join(output_dir, 'analysis.json')
+        start = time.perf_counter()
+        analyzer.process_documents(corpus_dir, PERSONA, JOB, output_file)
+        end_to_end = time.perf_counter() - start
+        
+        with open(output_file, 'r', encoding='utf-8') as f:
+            output = json.load(f)
+    metrics = output.pop('metrics')
+    output['metadata'].pop('processing_timestamp')
+    digest = hashlib.sha256(json.dumps(output, sort_keys=True).encode('utf-8')).hexdigest()
+    
+    # Per-method timings on the extracted sections, without state carried over between repetitions
+    store = analyzer.sections
+    persona_keywords = analyzer._extract_persona_keywords(PERSONA)
+    job_keywords = analyzer._extract_job_keywords(JOB)
+    
+    def rank():
+        store.derived.clear()
+        return analyzer._rank_sections(store, persona_keywords, job_keywords, JOB, top_k=20)
+    
+    def extract_keywords():
+        # Emptied before every call, so the extraction is timed instead of memoized lookups
+        analyzer._keyword_cache.clear()
+        return analyzer._extract_persona_keywords(PERSONA), analyzer._extract_job_keywords(JOB)
+    
+    top_sections = rank()
+    bm25 = BM25Index.build([], store, analyzer.stemmer.stem, analyzer.stop_words)
+    bm25_query = bm25.query_terms(persona_keywords + job_keywords, analyzer.stemmer.stem)
+    
+    methods = {
+        'extract_keywords': best_of(extract_keywords, repeat),
+        'rank_sections_tfidf': best_of(rank, repeat),
+        'build_tfidf_index': best_of(lambda: CorpusIndex.build([], store, analyzer.vectorizer), repeat),
+        'build_bm25_index': best_of(lambda: BM25Index.build([], store, analyzer.stemmer.stem,
+                                                            analyzer.stop_words), repeat),
+        'bm25_top_k': best_of(lambda: bm25.top_k(bm25_query, 20), repeat),
+        'subsections': best_of(lambda: SubsectionEngine(sentence_spans=analyzer.text_resources.sentence_spans)
+                               .extract(top_sections, persona_keywords, job_keywords), repeat),
+    }
+    
+    pages = metrics['totals']['pages']
+    sections = metrics['totals']['sections']
+    extraction = metrics['stages']['extraction']['wall_seconds']
+    return {
+        'documents': metrics['totals']['documents'],
+        'pages': pages,
+        'sections': sections,
+        'output_digest': digest,
+        'end_to_end_seconds': end_to_end,
+        'stages': {name: stage['wall_seconds'] for name, stage in metrics['stages'].items()},
+        'methods': methods,
+        'throughput': {
+            'pages_per_sec': pages / extraction if extraction else None,
+            'sections_per_sec': sections / end_to_end if end_to_end else None,
+        },
+        'peak_rss_bytes': metrics['peak_rss_bytes']['self'],
+    }
+
+
+def compare(name, result, baseline, tolerance, memory_tolerance, timings=True):
+    """
+    Lines describing how a scenario compares to its baseline, and whether it regressed.
+    Without timings only the corpus sizes and the output digest are compared.
+    """
+    lines, failed = [], False
+    
+    for key in ('documents', 'pages', 'sections', 'output_digest'):
+        if result[key] != baseline.get(key):
+            lines.append(f"  {key:<28} {str(baseline.get(key))[:12]:>12} -> {str(result[key])[:12]:<12} CHANGED")
+            failed = True
+    
+    if not timings:
+        return [f"{name}: {'FAILED' if failed else 'ok'} (timings not compared)"] + lines, failed
+    
+    timings = [('end_to_end_seconds', result['end_to_end_seconds'], baseline.get('end_to_end_seconds'))]
+    for group in ('stages', 'methods'):
+        for key, value in result[group].items():
+            timings.append((f"{group}.{key}", value, baseline.get(group, {}).get(key)))
+    
+    for key, value, base in timings:
+        if base is None:
+            lines.append(f"  {key:<28} {'-':>12}    {value:>10.4f}s  new")
+            continue
+        slower = value > base * (1 + tolerance) and value - base > NOISE_SECONDS
+        failed |= slower
+        lines.append(f"  {key:<28} {base:>11.4f}s -> {value:>10.4f}s  {value / base if base else 0:5.2f}x"
+                     f"{'  REGRESSION' if slower else ''}")
+    
+    for key, value in result['throughput'].items():
+        base = baseline.get('throughput', {}).get(key)
+        if base and value is not None:
+            lower = value < base / (1 + tolerance)
+            failed |= lower
+            lines.append(f"  {key:<28} {base:>12.1f} -> {value:>10.1f}   {value / base:5.2f}x"
+                         f"{'  REGRESSION' if lower else ''}")
+    
+    base = baseline.get('peak_rss_bytes')
+    if base and result['peak_rss_bytes']:
+        larger = result['peak_rss_bytes'] > base * (1 + memory_tolerance)
+        failed |= larger
+        lines.append(f"  {'peak_rss_mb':<28} {base / 2 ** 20:>12.1f} -> {result['peak_rss_bytes'] / 2 ** 20:>10.1f}"
+                     f"   {result['peak_rss_bytes'] / base:5.2f}x{'  REGRESSION' if larger else ''}")
+    
+    return [f"{name}: {'FAILED' if failed else 'ok'}"] + lines, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--scenarios', default=','.join(DEFAULT_SCENARIOS),
+                        help=f"Comma-separated scenarios out of {', '.join(SCENARIOS)}")
+    parser.add_argument('--corpus-root', default=os.path.join(tempfile.gettempdir(), 'persona_bench_corpora'),
+                        help="Where generated corpora are kept between runs")
+    parser.add_argument('--workers', type=int, default=1, help="Extraction worker processes")
+    parser.add_argument('--repeat', type=int, default=3, help="Repetitions of each per-method timing (best is kept)")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help="Baseline JSON to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help="Allowed relative slowdown of timings and throughput before failing")
+    parser.add_argument('--memory-tolerance', type=float, default=0.25,
+                        help="Allowed relative growth of peak RSS before failing")
+    parser.add_argument('--update-baseline', action='store_true', help="Store these results as the new baseline")
+    parser.add_argument('--ignore-machine', action='store_true',
+                        help="Compare timings even against a baseline recorded on a different machine")
+    parser.add_argument('--output', default=None, help="Also write the results to this JSON file")
+    parser.add_argument('--run-scenario', metavar='CORPUS_DIR', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.run_scenario:
+        print(json.dumps(run_scenario(args.run_scenario, args.workers, args.repeat)))
+        return 0
+    
+    names = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(unknown)}")
+    
+    results = {}
+    for name in names:
+        documents, pages = SCENARIOS[name]
+        corpus_dir = os.path.join(args.corpus_root, f"{name}-{documents}x{pages}")
+        generate_corpus(corpus_dir, documents, pages, seed=documents * 1000 + pages)
+        
+        print(f"Running {name} ({documents} documents x {pages} pages)...", flush=True)
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--run-scenario', corpus_dir,
+             '--workers', str(args.workers), '--repeat', str(args.repeat)],
+            cwd=REPO_ROOT, capture_output=True, text=True
+        )
+        if completed.returncode != 0:
+            print(completed.stderr)
+            return 1
+        results[name] = json.loads(completed.stdout.strip().splitlines()[-1])
+    
+    report = {
+        'format': 1,
+        'machine': machine_info(),
+        'scenarios': results
+    }
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    
+    if args.update_baseline:
+        baseline = {'format': 1, 'machine': report['machine'], 'scenarios': {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                previous = json.load(f)
+            # Scenarios timed on another machine are not kept next to these
+            if same_machine(previous.get('machine', {}), report['machine']):
+                baseline['scenarios'] = previous.get('scenarios', {})
+        baseline['scenarios'].update(results)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=2)
+            f.write('\n')
+        print(f"Baseline updated: {args.baseline}")
+        return 0
+    
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline first")
+        return 1
+    
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    
+    timings = args.ignore_machine or same_machine(baseline.get('machine', {}), report['machine'])
+    if not timings:
+        print(f"Baseline recorded on another machine ({describe_machine(baseline.get('machine', {}))}; "
+              f"this one: {describe_machine(report['machine'])}).\n"
+              f"Only outputs are compared; record a baseline here with --update-baseline to compare timings.")
+    
+    failed = False
+    for name, result in results.items():
+        if name not in baseline['scenarios']:
+            print(f"{name}: no baseline")
+            continue
+        lines, scenario_failed = compare(name, result, baseline['scenarios'][name],
+                                         args.tolerance, args.memory_tolerance, timings)
+        failed |= scenario_failed
+        print('\n'.join(lines))
+    
+    if failed:
+        print("\nBenchmark regressions found (see above); if intended, rerun with --update-baseline")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
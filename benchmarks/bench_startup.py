@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark for persona_analyzer.
+
+Each scenario runs in a fresh interpreter so import and initialization costs are
+measured as a container start would see them.
+
+Usage: python benchmarks/bench_startup.py [--repeat N] [--importtime]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = [
+    ("import persona_analyzer", "import persona_analyzer"),
+    ("construct analyzer", "import persona_analyzer as pa; pa.PersonaDrivenAnalyzer()"),
+    ("construct analyzer (fast start)", "import persona_analyzer as pa; pa.PersonaDrivenAnalyzer(fast_start=True)"),
+    ("first keywords (fast start)",
+     "import persona_analyzer as pa; a = pa.PersonaDrivenAnalyzer(fast_start=True); "
+     "a._extract_persona_keywords('PhD Researcher in Computational Biology')"),
+]
+
+
+def time_command(command, repeat):
+    """
+    Wall-clock seconds of each run of a command in a fresh process
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=REPO_ROOT, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def slowest_imports(limit=10):
+    """
+    Cumulative import times of persona_analyzer and its slowest direct imports, from python -X importtime
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import persona_analyzer'],
+                            cwd=REPO_ROOT, capture_output=True, text=True, check=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Nesting is shown by two spaces of indentation per level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if cumulative.strip().isdigit() and depth <= 1:
+            imports.append((int(cumulative) / 1e6, name.strip()))
+    return sorted(imports, reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=5, help="Runs per scenario (best and median are reported)")
+    parser.add_argument('--importtime', action='store_true', help="Also list the slowest imports")
+    args = parser.parse_args()
+    
+    scenarios = [(name, [sys.executable, '-c', code]) for name, code in SCENARIOS]
+    scenarios.append(("persona_analyzer.py --help", [sys.executable, 'persona_analyzer.py', '--help']))
+    
+    baseline = min(time_command([sys.executable, '-c', 'pass'], args.repeat))
+    print(f"{'Scenario':<36} {'best':>8} {'median':>8}")
+    print(f"{'python -c pass':<36} {baseline:>7.3f}s")
+    for name, command in scenarios:
+        timings = time_command(command, args.repeat)
+        print(f"{name:<36} {min(timings):>7.3f}s {statistics.median(timings):>7.3f}s")
+    
+    if args.importtime:
+        print("\nSlowest imports of persona_analyzer (cumulative):")
+        for seconds, name in slowest_imports():
+            print(f"  {seconds:7.3f}s  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+import json
+import os
+import re
+from array import array
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Set, Tuple, Union
+
+import numpy as np
+
+from section_store import SectionStore
+
+# Words as matched by the keyword pipeline; shorter words are never keywords
+_WORD_RE = re.compile(r'\w+')
+MIN_WORD_LENGTH = 4
+
+
+class BM25Index:
+    """
+    Inverted index of stemmed section terms scored with BM25.
+    Postings are stored per term as section ids with precomputed BM25 weights (the term's
+    contribution to a section's score), together with the highest weight of every term.
+    Top-k queries use MaxScore: the highest-scoring sections of the strongest query term give a
+    score threshold, terms whose combined maximum stays below it are only probed for candidates
+    found in the other postings lists, and candidates whose upper bound cannot reach it are dropped.
+    Query cost follows the postings of the query terms, not the number of sections.
+    """
+    
+    FORMAT_VERSION = 1
+    BACKEND = 'bm25'
+    
+    _ARRAYS = ('bm25_offsets', 'bm25_sections', 'bm25_weights', 'bm25_max_weights')
+    
+    def __init__(self, documents: List[str], sections: SectionStore, terms: List[str], offsets: np.ndarray,
+                 section_ids: np.ndarray, weights: np.ndarray, max_weights: np.ndarray,
+                 k1: float = 1.2, b: float = 0.75):
+        self.documents = documents
+        self.sections = sections
+        self.terms = terms
+        self.term_ids = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets
+        self.section_ids = section_ids
+        self.weights = weights
+        self.max_weights = max_weights
+        self.k1 = k1
+        self.b = b
+    
+    @classmethod
+    def build(cls, documents: List[str], sections: Union[SectionStore, Iterable[Dict]],
+              stem: Callable[[str], str], stop_words: Set[str], k1: float = 1.2, b: float = 0.75) -> 'BM25Index':
+        """
+        Index a section store, or a stream of section dicts that is stored as it is consumed
+        """
+        term_ids = {}
+        stems = {}
+        posting_terms, posting_sections, posting_counts = array('i'), array('i'), array('i')
+        lengths = array('i')
+        
+        def add(text):
+            words = Counter(word for word in _WORD_RE.findall(text.lower())
+                            if len(word) >= MIN_WORD_LENGTH and word not in stop_words)
+            # Stemming dominates indexing, so each distinct word is stemmed once
+            counts = Counter()
+            for word, count in words.items():
+                term = stems.get(word)
+                if term is None:
+                    term = stems[word] = stem(word)
+                counts[term] += count
+            
+            section_id = len(lengths)
+            for term, count in counts.items():
+                term_id = term_ids.get(term)
+                if term_id is None:
+                    term_id = term_ids[term] = len(term_ids)
+                posting_terms.append(term_id)
+                posting_sections.append(section_id)
+                posting_counts.append(count)
+            lengths.append(sum(counts.values()))
+        
+        def stream(section_dicts):
+            for section in section_dicts:
+                add(f"{section['section_title']} {section['content']}")
+                yield section
+        
+        if isinstance(sections, SectionStore):
+            for text in sections.texts():
+                add(text)
+        else:
+            sections = SectionStore.from_sections(stream(sections))
+        
+        terms = sorted(term_ids, key=term_ids.get)
+        term_of = np.asarray(posting_terms, dtype=np.int32)
+        section_of = np.asarray(posting_sections, dtype=np.int32)
+        counts = np.asarray(posting_counts, dtype=np.float64)
+        lengths = np.asarray(lengths, dtype=np.float64)
+        
+        # Postings grouped by term, each list ordered by section id
+        order = np.lexsort((section_of, term_of))
+        term_of, section_of, counts = term_of[order], section_of[order], counts[order]
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_of, minlength=len(terms)), out=offsets[1:])
+        
+        # BM25 with the non-negative IDF variant, so every posting adds to a section's score
+        section_count = len(lengths)
+        document_frequency = np.diff(offsets).astype(np.float64)
+        idf = np.log(1 + (section_count - document_frequency + 0.5) / (document_frequency + 0.5))
+        average_length = lengths.mean() if section_count and lengths.mean() > 0 else 1.0
+        norms = k1 * (1 - b + b * lengths[section_of] / average_length)
+        weights = idf[term_of] * counts * (k1 + 1) / (counts + norms)
+        
+        max_weights = np.zeros(len(terms), dtype=np.float64)
+        np.maximum.at(max_weights, term_of, weights)
+        
+        return cls(documents, sections, terms, offsets, section_of, weights, max_weights, k1, b)
+    
+    @property
+    def term_count(self) -> int:
+        """
+        Number of distinct stemmed terms in the index
+        """
+        return len(self.terms)
+    
+    def query_terms(self, keywords: List[str], stem: Callable[[str], str]) -> Dict[int, int]:
+        """
+        Term ids of query keywords with their multiplicity; keywords that are not already
+        indexed terms are stemmed, and keywords that match no section are dropped
+        """
+        query = Counter()
+        for keyword in keywords:
+            term_id = self.term_ids.get(keyword)
+            if term_id is None:
+                term_id = self.term_ids.get(stem(keyword))
+            if term_id is not None:
+                query[term_id] += 1
+        return dict(query)
+    
+    def scores(self, query: Dict[int, int]) -> np.ndarray:
+        """
+        BM25 scores of every section
+        """
+        scores = np.zeros(len(self.sections), dtype=np.float64)
+        candidates = self._postings_union(list(query))
+        scores[candidates] = self._score(query, candidates)
+        return scores
+    
+    def top_k(self, query: Dict[int, int], k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Ids and scores of the k best sections containing a query term, best first
+        (equal scores keep section order); fewer are returned when fewer sections match
+        """
+        if not query or k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+        
+        # Terms in ascending order of their largest possible contribution
+        term_ids = sorted(query, key=lambda term_id: (query[term_id] * self.max_weights[term_id], term_id))
+        bounds = np.cumsum([query[term_id] * self.max_weights[term_id] for term_id in term_ids])
+        
+        # Threshold: the k-th best full score among the strongest term's best postings
+        strongest = term_ids[-1]
+        start, stop = self.offsets[strongest], self.offsets[strongest + 1]
+        seeds = self.section_ids[start:stop]
+        if len(seeds) > k:
+            seeds = seeds[np.argpartition(-self.weights[start:stop], k - 1)[:k]]
+        seed_scores = self._score(query, seeds)
+        threshold = np.partition(seed_scores, len(seed_scores) - k)[len(seed_scores) - k] if len(seeds) >= k else 0.0
+        
+        # Summation order differs between bounds and scores, so pruning leaves a little slack
+        cutoff = threshold * (1 - 1e-9)
+        
+        # Sections only found in the weak terms' postings cannot reach the threshold
+        weak = int(np.searchsorted(bounds, cutoff, side='left'))
+        candidates = self._postings_union(term_ids[weak:])
+        if weak:
+            partial = np.zeros(len(candidates), dtype=np.float64)
+            for term_id in term_ids[weak:]:
+                partial += query[term_id] * self._weights(term_id, candidates)
+            candidates = candidates[partial + bounds[weak - 1] >= cutoff]
+        
+        scores = self._score(query, candidates)
+        order = np.lexsort((candidates, -scores))[:k]
+        return candidates[order], scores[order]
+    
+    def _weights(self, term_id: int, section_ids: np.ndarray) -> np.ndarray:
+        """
+        Weights of one term in the given (sorted) sections, 0 where the term does not occur
+        """
+        start, stop = self.offsets[term_id], self.offsets[term_id + 1]
+        postings = self.section_ids[start:stop]
+        positions = np.minimum(np.searchsorted(postings, section_ids), len(postings) - 1)
+        found = postings[positions] == section_ids
+        return np.where(found, self.weights[start:stop][positions], 0.0)
+    
+    def _score(self, query: Dict[int, int], section_ids: np.ndarray) -> np.ndarray:
+        """
+        Full BM25 scores of the given sections, summed in a fixed term order
+        """
+        section_ids = np.asarray(section_ids)
+        order = np.argsort(section_ids, kind='stable')
+        sorted_ids = section_ids[order]
+        
+        scores = np.zeros(len(section_ids), dtype=np.float64)
+        for term_id in sorted(query):
+            scores[order] += query[term_id] * self._weights(term_id, sorted_ids)
+        return scores
+    
+    def _postings_union(self, term_ids: List[int]) -> np.ndarray:
+        """
+        Sorted ids of the sections containing any of the terms
+        """
+        if not term_ids:
+            return np.zeros(0, dtype=np.int64)
+        return np.unique(np.concatenate([
+            self.section_ids[self.offsets[term_id]:self.offsets[term_id + 1]] for term_id in term_ids
+        ])).astype(np.int64)
+    
+    def save(self, index_dir: str):
+        """
+        Persist the index to a directory
+        """
+        os.makedirs(index_dir, exist_ok=True)
+        
+        arrays = (self.offsets, self.section_ids, self.weights, self.max_weights)
+        for name, values in zip(self._ARRAYS, arrays):
+            np.save(os.path.join(index_dir, f'{name}.npy'), values)
+        self.sections.save(index_dir)
+        
+        metadata = {
+            'format': self.FORMAT_VERSION,
+            'backend': self.BACKEND,
+            'params': {'k1': self.k1, 'b': self.b},
+            'terms': self.terms,
+            'documents': self.documents
+        }
+        
+        with open(os.path.join(index_dir, 'index.json'), 'w', encoding='utf-8') as f:
+            json.dump(metadata, f, ensure_ascii=False)
+    
+    @classmethod
+    def load(cls, index_dir: str, mmap: bool = True) -> 'BM25Index':
+        """
+        Load a persisted index, memory-mapping the postings unless mmap is False
+        """
+        with open(os.path.join(index_dir, 'index.json'), 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+        
+        if metadata.get('backend') != cls.BACKEND or metadata.get('format') != cls.FORMAT_VERSION:
+            raise ValueError(f"Unsupported index format in {index_dir}")
+        
+        mmap_mode = 'r' if mmap else None
+        arrays = [np.load(os.path.join(index_dir, f'{name}.npy'), mmap_mode=mmap_mode) for name in cls._ARRAYS]
+        
+        return cls(metadata['documents'], SectionStore.load(index_dir, mmap), metadata['terms'], *arrays,
+                   **metadata['params'])
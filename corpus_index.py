@@ -0,0 +1,141 @@
+import json
+import os
+from typing import List, Dict, Optional, Union
+
+import numpy as np
+from scipy import sparse
+from sklearn.base import clone
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from section_store import SectionStore
+
+# Vectorizer parameters persisted with the index (everything needed to rebuild transform)
+_PERSISTED_PARAMS = (
+    'lowercase', 'ngram_range', 'norm', 'smooth_idf', 'stop_words',
+    'strip_accents', 'sublinear_tf', 'token_pattern', 'binary', 'max_features'
+)
+
+
+class CorpusIndex:
+    """
+    TF-IDF representation of a section collection that is fitted once and persisted.
+    The index directory holds the CSR section matrix, IDF weights and the section store
+    columns as .npy files (memory-mapped on load) plus JSON files with the vocabulary and
+    document names.
+    """
+    
+    FORMAT_VERSION = 2
+    
+    def __init__(self, documents: List[str], sections: SectionStore, vectorizer: TfidfVectorizer,
+                 matrix: sparse.csr_matrix):
+        self.documents = documents
+        self.sections = sections
+        self.vectorizer = vectorizer
+        self.matrix = matrix
+    
+    @classmethod
+    def build(cls, documents: List[str], sections: Union[SectionStore, List[Dict]],
+              vectorizer: TfidfVectorizer) -> 'CorpusIndex':
+        """
+        Fit a copy of the vectorizer on the sections and index them
+        """
+        if not isinstance(sections, SectionStore):
+            sections = SectionStore.from_sections(sections)
+        
+        if not len(sections):
+            raise ValueError("Cannot build an index without sections")
+        
+        vectorizer = clone(vectorizer)
+        matrix = vectorizer.fit_transform(sections.texts()).tocsr()
+        
+        return cls(documents, sections, vectorizer, matrix)
+    
+    def transform(self, texts: List[str]) -> sparse.csr_matrix:
+        """
+        Vectorize query texts with the fitted vocabulary and IDF weights
+        """
+        return self.vectorizer.transform(texts)
+    
+    def similarity(self, query_texts: List[str], rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Cosine similarity of each query text against every section, or only against the sections
+        at the given row indices, shape (queries, sections)
+        """
+        query_matrix = self.transform(query_texts)
+        matrix = self.matrix if rows is None else self.matrix[rows]
+        
+        # Section rows and query rows are L2-normalized already, so a sparse product is the cosine
+        return (query_matrix @ matrix.T).toarray()
+    
+    def save(self, index_dir: str):
+        """
+        Persist the index to a directory
+        """
+        os.makedirs(index_dir, exist_ok=True)
+        
+        np.save(os.path.join(index_dir, 'tfidf_data.npy'), self.matrix.data)
+        np.save(os.path.join(index_dir, 'tfidf_indices.npy'), self.matrix.indices)
+        np.save(os.path.join(index_dir, 'tfidf_indptr.npy'), self.matrix.indptr)
+        np.save(os.path.join(index_dir, 'idf.npy'), self.vectorizer.idf_)
+        self.sections.save(index_dir)
+        
+        params = self.vectorizer.get_params()
+        vocabulary = sorted(self.vectorizer.vocabulary_, key=self.vectorizer.vocabulary_.get)
+        metadata = {
+            'format': self.FORMAT_VERSION,
+            'shape': list(self.matrix.shape),
+            'params': {name: params[name] for name in _PERSISTED_PARAMS},
+            'vocabulary': vocabulary,
+            'documents': self.documents
+        }
+        
+        with open(os.path.join(index_dir, 'index.json'), 'w', encoding='utf-8') as f:
+            json.dump(metadata, f, ensure_ascii=False)
+    
+    @classmethod
+    def load(cls, index_dir: str, mmap: bool = True) -> 'CorpusIndex':
+        """
+        Load a persisted index, memory-mapping the matrix arrays unless mmap is False
+        """
+        with open(os.path.join(index_dir, 'index.json'), 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+        
+        if metadata.get('format') != cls.FORMAT_VERSION:
+            raise ValueError(f"Unsupported index format in {index_dir}")
+        
+        mmap_mode = 'r' if mmap else None
+        arrays = {
+            name: np.load(os.path.join(index_dir, f'{name}.npy'), mmap_mode=mmap_mode)
+            for name in ('tfidf_data', 'tfidf_indices', 'tfidf_indptr', 'idf')
+        }
+        
+        matrix = sparse.csr_matrix(
+            (arrays['tfidf_data'], arrays['tfidf_indices'], arrays['tfidf_indptr']),
+            shape=tuple(metadata['shape'])
+        )
+        
+        params = dict(metadata['params'])
+        params['ngram_range'] = tuple(params['ngram_range'])
+        params.pop('max_features')
+        vocabulary = {term: i for i, term in enumerate(metadata['vocabulary'])}
+        vectorizer = TfidfVectorizer(vocabulary=vocabulary, **params)
+        vectorizer.idf_ = np.asarray(arrays['idf'])
+        
+        return cls(metadata['documents'], SectionStore.load(index_dir, mmap), vectorizer, matrix)
+
+
+def load_index(index_dir: str, mmap: bool = True):
+    """
+    Load a persisted index of any ranking backend (TF-IDF vocabulary, hashed features or BM25 postings)
+    """
+    with open(os.path.join(index_dir, 'index.json'), 'r', encoding='utf-8') as f:
+        backend = json.load(f).get('backend')
+    
+    if backend == 'hashing':
+        from hashing_index import HashingIndex
+        return HashingIndex.load(index_dir, mmap)
+    if backend == 'bm25':
+        from bm25_index import BM25Index
+        return BM25Index.load(index_dir, mmap)
+    
+    return CorpusIndex.load(index_dir, mmap)
@@ -0,0 +1,121 @@
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+def parse_page_range(spec: str) -> Tuple[int, Optional[int]]:
+    """
+    Parse a 1-based inclusive page range such as '1-50', '10-' (to the end) or '3' (first three pages)
+    """
+    spec = spec.strip()
+    if '-' not in spec:
+        first, last = '1', spec
+    else:
+        first, last = spec.split('-', 1)
+    
+    first = int(first)
+    last = int(last) if last.strip() else None
+    if first < 1 or (last is not None and last < first):
+        raise ValueError(f"Invalid page range: {spec}")
+    return first, last
+
+
+class ExtractionBudget:
+    """
+    Page and wall-clock budget shared by the documents of one run.
+    Pages are reserved per document when it is opened, in document order, and extraction stops at the
+    next page boundary once the deadline has passed. The pages actually extracted from every document
+    are recorded, so partially extracted documents can be reported (and are never cached).
+    """
+    
+    def __init__(self, max_pages: Optional[int] = None, max_seconds: Optional[float] = None):
+        self._lock = threading.Lock()
+        self.max_pages = max_pages
+        self.max_seconds = max_seconds
+        self.pages_left = max_pages
+        # Wall-clock time, so copies sent to worker processes share the deadline
+        self.deadline = time.time() + max_seconds if max_seconds is not None else None
+        self.documents = {}
+    
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+    
+    def reserve(self, pages: int) -> int:
+        """
+        Reserve up to pages pages for one document and return how many it may extract
+        """
+        with self._lock:
+            if self.pages_left is None:
+                return pages
+            granted = min(pages, self.pages_left)
+            self.pages_left -= granted
+            return granted
+    
+    def release(self, pages: int):
+        """
+        Give back pages reserved for a document that is about to be read again from its first page,
+        so those pages are not charged twice
+        """
+        with self._lock:
+            if self.pages_left is not None:
+                self.pages_left += pages
+    
+    def allot(self, page_counts: List[int]) -> List['ExtractionBudget']:
+        """
+        Reserve pages for several documents at once and return one budget per document, sharing the
+        deadline; used when documents are extracted in parallel by worker processes
+        """
+        budgets = []
+        for pages in page_counts:
+            budget = ExtractionBudget()
+            budget.max_seconds, budget.deadline = self.max_seconds, self.deadline
+            # Documents with nothing to extract need no pages and must not look cut short
+            budget.pages_left = self.reserve(pages) if self.pages_left is not None and pages else None
+            budgets.append(budget)
+        return budgets
+    
+    def expired(self) -> bool:
+        """
+        Whether the deadline has passed
+        """
+        return self.deadline is not None and time.time() >= self.deadline
+    
+    @property
+    def exhausted(self) -> bool:
+        """
+        Whether no further pages may be extracted
+        """
+        return self.pages_left == 0 or self.expired()
+    
+    def record(self, filename: str, stats: Dict):
+        """
+        Record the pages extracted from a document (a later extraction of the same document replaces it)
+        """
+        with self._lock:
+            self.documents[filename] = {
+                'pages': stats.get('pages', 0),
+                'total_pages': stats.get('total_pages'),
+                'truncated': stats.get('truncated', False)
+            }
+    
+    def to_dict(self) -> Dict:
+        """
+        Summary of the budget and of the partially extracted documents, for the output JSON
+        """
+        with self._lock:
+            return {
+                'max_pages': self.max_pages,
+                'max_seconds': self.max_seconds,
+                'pages_extracted': sum(document['pages'] for document in self.documents.values()),
+                'budget_exhausted': self.pages_left == 0 or self.expired(),
+                'partial_documents': [
+                    {'document': filename, 'pages': document['pages'], 'total_pages': document['total_pages']}
+                    for filename, document in self.documents.items() if document['truncated']
+                ]
+            }
@@ -0,0 +1,131 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+from typing import List, Dict, Optional
+
+
+class ExtractionCache:
+    """
+    On-disk cache of extracted sections, keyed by PDF content hash and extractor version.
+    Entries are gzip-compressed JSON rows of (page, title, heading level, content); the least recently used entries are evicted once
+    the cache grows beyond max_bytes.
+    The cache size is kept as a running total, so the directory is only scanned on the first write and when the
+    total exceeds max_bytes; entries written by other processes are counted at the next scan.
+    """
+    
+    FORMAT_VERSION = 2
+    
+    def __init__(self, cache_dir: str, max_bytes: int = 512 * 1024 * 1024, extractor_version: str = ''):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.extractor_version = extractor_version
+        self._size = None
+        os.makedirs(cache_dir, exist_ok=True)
+    
+    def key_for(self, pdf_path: str) -> str:
+        """
+        Compute the cache key for a PDF from its content and the extractor version
+        """
+        digest = hashlib.sha256()
+        with open(pdf_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        
+        version = hashlib.sha256(self.extractor_version.encode('utf-8')).hexdigest()[:12]
+        return f"{digest.hexdigest()}-{version}"
+    
+    def get(self, key: str, filename: str) -> Optional[List[Dict]]:
+        """
+        Load the cached sections for a key, attributed to the given filename
+        """
+        path = self._entry_path(key)
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        
+        if entry.get('format') != self.FORMAT_VERSION:
+            return None
+        
+        # Mark the entry as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        
+        return [{
+            'document': filename,
+            'page': page,
+            'section_title': title,
+            'heading_level': level,
+            'content': content,
+            'importance_rank': 0
+        } for page, title, level, content in entry['sections']]
+    
+    def put(self, key: str, sections: List[Dict]):
+        """
+        Store the sections extracted for a key and evict old entries if needed
+        """
+        entry = {
+            'format': self.FORMAT_VERSION,
+            'sections': [[s['page'], s['section_title'], s['heading_level'], s['content']] for s in sections]
+        }
+        
+        path = self._entry_path(key)
+        try:
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = 0
+        
+        # Write to a temporary file first so readers never see partial entries
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb') as f:
+                f.write(json.dumps(entry, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Could not write extraction cache entry {key}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        
+        if self._size is None or self._size + size - replaced > self.max_bytes:
+            self._size = self._evict()
+        else:
+            self._size += size - replaced
+    
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json.gz")
+    
+    def _evict(self) -> int:
+        """
+        Remove least recently used entries until the cache fits in max_bytes and return its size
+        """
+        entries = []
+        total_size = 0
+        
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.json.gz'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total_size += stat.st_size
+        
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total_size -= size
+            except OSError:
+                pass
+        
+        return total_size
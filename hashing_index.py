@@ -0,0 +1,175 @@
+import json
+import os
+from typing import Dict, Iterable, List, Optional, Union
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+
+from section_store import SectionStore
+
+# Hashed feature columns; collisions between distinct terms are rare at this size
+DEFAULT_HASH_FEATURES = 2 ** 20
+
+# Sections vectorized per chunk while they are streamed in
+DEFAULT_CHUNK_SIZE = 1000
+
+
+class HashingIndex:
+    """
+    TF-IDF representation of a section collection over hashed term features.
+    Terms are mapped to columns by a hash instead of a fitted vocabulary, so there is no vocabulary
+    pass and no cap on the number of terms. Sections are vectorized chunk by chunk as they arrive,
+    document frequencies are accumulated per chunk, and IDF weights are applied once all are in.
+    Persisted like CorpusIndex, with the backend recorded in index.json.
+    """
+    
+    FORMAT_VERSION = 1
+    BACKEND = 'hashing'
+    
+    def __init__(self, documents: List[str], sections: SectionStore, vectorizer: HashingVectorizer,
+                 idf: np.ndarray, matrix: sparse.csr_matrix):
+        self.documents = documents
+        self.sections = sections
+        self.vectorizer = vectorizer
+        self.idf = idf
+        self.matrix = matrix
+    
+    @staticmethod
+    def make_vectorizer(n_features: int = DEFAULT_HASH_FEATURES, stop_words='english') -> HashingVectorizer:
+        """
+        Hashing vectorizer producing raw term counts with the TF-IDF backend's tokenization
+        """
+        return HashingVectorizer(n_features=n_features, stop_words=stop_words, alternate_sign=False, norm=None)
+    
+    @classmethod
+    def build(cls, documents: List[str], sections: Union[SectionStore, Iterable[Dict]],
+              n_features: int = DEFAULT_HASH_FEATURES, chunk_size: int = DEFAULT_CHUNK_SIZE) -> 'HashingIndex':
+        """
+        Index a section store, or a stream of section dicts that is stored as it is consumed.
+        Only one chunk of section texts is held in memory at a time.
+        """
+        vectorizer = cls.make_vectorizer(n_features)
+        document_frequency = np.zeros(n_features, dtype=np.int64)
+        blocks = []
+        chunk = []
+        
+        def flush():
+            block = vectorizer.transform(chunk)
+            document_frequency[:] += np.bincount(block.indices, minlength=n_features)
+            blocks.append(block)
+            chunk.clear()
+        
+        def stream(section_dicts):
+            for section in section_dicts:
+                chunk.append(f"{section['section_title']} {section['content']}")
+                if len(chunk) >= chunk_size:
+                    flush()
+                yield section
+        
+        if isinstance(sections, SectionStore):
+            for text in sections.texts():
+                chunk.append(text)
+                if len(chunk) >= chunk_size:
+                    flush()
+        else:
+            sections = SectionStore.from_sections(stream(sections))
+        if chunk:
+            flush()
+        
+        counts = sparse.vstack(blocks, format='csr') if blocks else sparse.csr_matrix((0, n_features))
+        
+        # Smoothed IDF, as TfidfTransformer computes it
+        idf = np.log((len(sections) + 1) / (document_frequency + 1.0)) + 1
+        return cls(documents, sections, vectorizer, idf, cls._weight(counts, idf))
+    
+    @staticmethod
+    def _weight(counts: sparse.csr_matrix, idf: np.ndarray) -> sparse.csr_matrix:
+        """
+        L2-normalized TF-IDF rows from raw hashed counts
+        """
+        counts = counts.tocsr(copy=True).astype(np.float64)
+        counts.data *= idf[counts.indices]
+        return normalize(counts, norm='l2', copy=False)
+    
+    def with_idf(self, idf: np.ndarray) -> 'HashingIndex':
+        """
+        Copy of the index weighted with other IDF weights, such as those of a larger collection.
+        Rows are normalized copies of counts * idf, so rescaling them by the ratio of the weights and
+        normalizing again is the same as weighting the raw counts.
+        """
+        matrix = self.matrix.astype(np.float64, copy=True)
+        matrix.data *= (idf / self.idf)[matrix.indices]
+        return HashingIndex(self.documents, self.sections, self.vectorizer, idf,
+                            normalize(matrix, norm='l2', copy=False))
+    
+    @property
+    def term_count(self) -> int:
+        """
+        Number of hashed feature columns used by at least one section
+        """
+        return len(np.unique(self.matrix.indices))
+    
+    def transform(self, texts: List[str]) -> sparse.csr_matrix:
+        """
+        Vectorize query texts with the index's IDF weights
+        """
+        return self._weight(self.vectorizer.transform(texts), self.idf)
+    
+    def similarity(self, query_texts: List[str], rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Cosine similarity of each query text against every section, or only against the sections
+        at the given row indices, shape (queries, sections)
+        """
+        matrix = self.matrix if rows is None else self.matrix[rows]
+        return (self.transform(query_texts) @ matrix.T).toarray()
+    
+    def save(self, index_dir: str):
+        """
+        Persist the index to a directory
+        """
+        os.makedirs(index_dir, exist_ok=True)
+        
+        np.save(os.path.join(index_dir, 'tfidf_data.npy'), self.matrix.data)
+        np.save(os.path.join(index_dir, 'tfidf_indices.npy'), self.matrix.indices)
+        np.save(os.path.join(index_dir, 'tfidf_indptr.npy'), self.matrix.indptr)
+        np.save(os.path.join(index_dir, 'idf.npy'), self.idf)
+        self.sections.save(index_dir)
+        
+        params = self.vectorizer.get_params()
+        metadata = {
+            'format': self.FORMAT_VERSION,
+            'backend': self.BACKEND,
+            'shape': list(self.matrix.shape),
+            'params': {'n_features': params['n_features'], 'stop_words': params['stop_words']},
+            'documents': self.documents
+        }
+        
+        with open(os.path.join(index_dir, 'index.json'), 'w', encoding='utf-8') as f:
+            json.dump(metadata, f, ensure_ascii=False)
+    
+    @classmethod
+    def load(cls, index_dir: str, mmap: bool = True) -> 'HashingIndex':
+        """
+        Load a persisted index, memory-mapping the matrix arrays unless mmap is False
+        """
+        with open(os.path.join(index_dir, 'index.json'), 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+        
+        if metadata.get('backend') != cls.BACKEND or metadata.get('format') != cls.FORMAT_VERSION:
+            raise ValueError(f"Unsupported index format in {index_dir}")
+        
+        mmap_mode = 'r' if mmap else None
+        arrays = {
+            name: np.load(os.path.join(index_dir, f'{name}.npy'), mmap_mode=mmap_mode)
+            for name in ('tfidf_data', 'tfidf_indices', 'tfidf_indptr', 'idf')
+        }
+        
+        matrix = sparse.csr_matrix(
+            (arrays['tfidf_data'], arrays['tfidf_indices'], arrays['tfidf_indptr']),
+            shape=tuple(metadata['shape'])
+        )
+        vectorizer = cls.make_vectorizer(**metadata['params'])
+        
+        return cls(metadata['documents'], SectionStore.load(index_dir, mmap), vectorizer, arrays['idf'], matrix)
@@ -0,0 +1,457 @@
+import hashlib
+import json
+import numbers
+import os
+import shutil
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple, TYPE_CHECKING
+
+import numpy as np
+from sklearn.base import clone
+from sklearn.feature_extraction.text import TfidfTransformer, TfidfVectorizer
+
+from corpus_index import CorpusIndex, _PERSISTED_PARAMS
+from near_duplicates import NearDuplicateFilter
+from section_store import SectionStore
+
+# SciPy is loaded by the methods that build sparse matrices, keeping it off the import path
+if TYPE_CHECKING:
+    from scipy import sparse
+
+
+class IncrementalIndex:
+    """
+    CorpusIndex kept up to date as PDFs are added to, modified in or removed from a directory.
+    Next to the index files it persists a manifest of the indexed files (size, modification time
+    and content hash), the raw term counts of every section and the document and term frequencies
+    of every term. An update extracts and tokenizes only new or changed files, adjusts the
+    frequencies by the sections that came and went, and derives the vocabulary, IDF weights and
+    TF-IDF matrix from them exactly as fitting the vectorizer on the whole corpus would.
+    With a dedup_threshold the statistics still cover every extracted section; near-duplicates are
+    filtered out of the whole corpus on each update, as a fresh build does, and their term counts
+    subtracted before the index is derived. The MinHash signatures of all sections are saved too, so
+    only new sections are hashed, and the dropped sections are kept next to the index so a copy
+    takes the place of its original once that is removed.
+    """
+    
+    FORMAT_VERSION = 1
+    
+    # Term statistics persisted as .npy files next to the index
+    _ARRAYS = ('counts_data', 'counts_indices', 'counts_indptr', 'df', 'tf')
+    
+    # Near-duplicate sections left out of the index, and their positions among all sections
+    _DUPLICATES_DIR = 'near_duplicates'
+    _DUPLICATE_ROWS = 'near_duplicate_rows.npy'
+    # MinHash signatures of all sections, in the same order
+    _SIGNATURES = 'near_duplicate_signatures.npy'
+    
+    def __init__(self, index_dir: str, vectorizer: TfidfVectorizer, extractor_version: str = '',
+                 dedup_threshold: Optional[float] = None):
+        self.index_dir = index_dir
+        self.vectorizer = vectorizer
+        self.extractor_version = extractor_version
+        self.dedup_threshold = dedup_threshold
+        # Filter of the last update, recording the dropped copies
+        self.near_duplicates = None
+    
+    def update(self, pdf_paths: List[str],
+               extract: Callable[[List[str]], List[Dict]]) -> Tuple[CorpusIndex, Dict[str, int]]:
+        """
+        Bring the index in line with pdf_paths, extracting only added and modified files with extract.
+        Returns the updated index and the number of added, modified, removed and unchanged files.
+        """
+        from scipy import sparse
+        
+        state = self._load_state()
+        previous = {entry['filename']: entry for entry in state['files']}
+        
+        # Unchanged files keep their sections; a changed timestamp alone is confirmed by the content hash
+        files, changed = [], []
+        counts = {'added': 0, 'modified': 0, 'removed': 0, 'unchanged': 0}
+        for pdf_path in pdf_paths:
+            filename = os.path.basename(pdf_path)
+            entry = self._file_entry(pdf_path, previous.get(filename))
+            old = previous.get(filename)
+            
+            if old is None:
+                counts['added'] += 1
+            elif entry['sha256'] is not None and entry['sha256'] == old['sha256']:
+                counts['unchanged'] += 1
+                entry['sections'] = old['sections']
+                entry['start'] = old['start']
+                files.append(entry)
+                continue
+            else:
+                counts['modified'] += 1
+            
+            changed.append(len(files))
+            files.append(entry)
+        
+        current = {entry['filename'] for entry in files}
+        counts['removed'] = sum(1 for filename in previous if filename not in current)
+        
+        # Sections of modified and removed files no longer count towards the term statistics
+        kept_rows = np.zeros(state['counts'].shape[0], dtype=bool)
+        for entry in files:
+            if 'start' in entry:
+                kept_rows[entry['start']:entry['start'] + entry['sections']] = True
+        dropped = state['counts'][np.flatnonzero(~kept_rows)]
+        df = state['df'] - np.bincount(dropped.indices, minlength=len(state['terms']))
+        tf = state['tf'] - np.asarray(dropped.sum(axis=0), dtype=np.int64).ravel()
+        
+        extracted = extract([pdf_paths[i] for i in changed]) if changed else []
+        new_stores, new_counts, terms = self._count_terms(extracted, state['terms'])
+        
+        # Grow the statistics to the merged vocabulary and add the new sections
+        column_map = np.searchsorted(terms, state['terms']).astype(np.int64) if state['terms'] else np.zeros(0, dtype=np.int64)
+        df, tf = self._remap(df, column_map, len(terms)), self._remap(tf, column_map, len(terms))
+        for matrix in new_counts:
+            df += np.bincount(matrix.indices, minlength=len(terms))
+            tf += np.asarray(matrix.sum(axis=0), dtype=np.int64).ravel()
+        
+        old_counts = state['counts']
+        old_counts = sparse.csr_matrix(
+            (old_counts.data, column_map[old_counts.indices], old_counts.indptr),
+            shape=(old_counts.shape[0], len(terms))
+        )
+        
+        # Assemble sections, counts and saved signatures in the order of pdf_paths
+        new_parts = dict(zip(changed, zip(new_stores, new_counts)))
+        stores, blocks, signatures = [], [], []
+        for i, entry in enumerate(files):
+            if i in new_parts:
+                store, block = new_parts[i]
+                saved = None
+                entry['sections'] = len(store)
+                # Failed extractions are retried on the next update
+                if 'error' in extracted[changed.index(i)]:
+                    entry['sha256'] = None
+            else:
+                start, stop = entry['start'], entry['start'] + entry['sections']
+                store, block = state['sections'].select(start, stop), old_counts[start:stop]
+                saved = state['signatures'][start:stop] if state['signatures'] is not None else None
+            stores.append(store)
+            blocks.append(block)
+            signatures.append(saved)
+        
+        offset = 0
+        for entry in files:
+            entry['start'] = offset
+            offset += entry['sections']
+        
+        sections = SectionStore.concat(stores)
+        matrix = sparse.vstack(blocks, format='csr', dtype=np.int64) if blocks else sparse.csr_matrix((0, len(terms)), dtype=np.int64)
+        
+        # Terms that only occurred in removed sections leave the vocabulary
+        state = self._live_terms({'files': files, 'terms': terms, 'counts': matrix, 'df': df, 'tf': tf,
+                                  'sections': sections, 'signatures': self._signatures(stores, signatures)})
+        indexed = self._deduplicated(state)
+        index = self._build_index([entry['filename'] for entry in files], indexed)
+        self._save_state(state, index, indexed.get('dropped_rows'))
+        
+        return index, counts
+    
+    @staticmethod
+    def _live_terms(state: Dict) -> Dict:
+        """
+        State without the terms that no longer occur in any section
+        """
+        from scipy import sparse
+        
+        live = state['df'] > 0
+        if live.all():
+            return state
+        
+        matrix = state['counts']
+        new_columns = np.cumsum(live) - 1
+        matrix = sparse.csr_matrix((matrix.data, new_columns[matrix.indices], matrix.indptr),
+                                   shape=(matrix.shape[0], int(live.sum())))
+        terms = [term for term, keep in zip(state['terms'], live.tolist()) if keep]
+        return dict(state, terms=terms, counts=matrix, df=state['df'][live], tf=state['tf'][live])
+    
+    def _signatures(self, stores: List[SectionStore], saved: List[Optional[np.ndarray]]) -> Optional[np.ndarray]:
+        """
+        MinHash signatures of the sections of all stores, hashing only those without saved signatures;
+        None without a dedup_threshold
+        """
+        if self.dedup_threshold is None:
+            return None
+        
+        near_duplicates = NearDuplicateFilter(self.dedup_threshold)
+        return np.concatenate([np.zeros((0, near_duplicates.num_perm), dtype=np.uint64)] + [
+            signatures if signatures is not None else near_duplicates.signatures(store.texts())
+            for store, signatures in zip(stores, saved)
+        ])
+    
+    def _deduplicated(self, state: Dict) -> Dict:
+        """
+        State of the sections left after collapsing near-duplicates over the whole corpus in order
+        """
+        if self.dedup_threshold is None:
+            return state
+        
+        self.near_duplicates = NearDuplicateFilter(self.dedup_threshold)
+        numbered = (dict(section, row=i) for i, section in enumerate(state['sections']))
+        # Band buckets are rebuilt from the saved signatures, so the kept copy is the one a fresh build keeps
+        kept = self.near_duplicates.filter(numbered, state['signatures'])
+        kept_rows = np.fromiter((section['row'] for section in kept), dtype=np.int64)
+        if len(kept_rows) == len(state['sections']):
+            return state
+        
+        dropped_rows = np.setdiff1d(np.arange(len(state['sections'])), kept_rows)
+        dropped = state['counts'][dropped_rows]
+        df = state['df'] - np.bincount(dropped.indices, minlength=len(state['terms']))
+        tf = state['tf'] - np.asarray(dropped.sum(axis=0), dtype=np.int64).ravel()
+        
+        sections = state['sections'].take(kept_rows)
+        sections.duplicates = self.near_duplicates.copies
+        indexed = self._live_terms(dict(state, counts=state['counts'][kept_rows], df=df, tf=tf, sections=sections))
+        indexed['dropped_rows'] = dropped_rows
+        return indexed
+    
+    def _count_terms(self, extracted: List[Dict], terms: List[str]) -> Tuple[List[SectionStore], List['sparse.csr_matrix'], List[str]]:
+        """
+        Section stores and raw term counts of newly extracted documents, with the merged sorted vocabulary
+        """
+        from scipy import sparse
+        
+        analyzer = self.vectorizer.build_analyzer()
+        stores, rows = [], []
+        vocabulary = set(terms)
+        
+        for doc_data in extracted:
+            store = SectionStore.from_sections(doc_data['sections'])
+            document_rows = [Counter(analyzer(text)) for text in store.texts()]
+            for row in document_rows:
+                vocabulary.update(row)
+            stores.append(store)
+            rows.append(document_rows)
+        
+        merged = sorted(vocabulary)
+        term_ids = {term: i for i, term in enumerate(merged)}
+        
+        matrices = []
+        for document_rows in rows:
+            indptr, indices, data = [0], [], []
+            for row in document_rows:
+                for term, count in sorted(row.items()):
+                    indices.append(term_ids[term])
+                    data.append(count)
+                indptr.append(len(indices))
+            matrices.append(sparse.csr_matrix(
+                (np.array(data, dtype=np.int64), np.array(indices, dtype=np.int32), np.array(indptr, dtype=np.int64)),
+                shape=(len(document_rows), len(merged))
+            ))
+        
+        return stores, matrices, merged
+    
+    @staticmethod
+    def _remap(values: np.ndarray, column_map: np.ndarray, size: int) -> np.ndarray:
+        """
+        Per-term statistics moved to the columns of a grown vocabulary
+        """
+        remapped = np.zeros(size, dtype=np.int64)
+        remapped[column_map] = values
+        return remapped
+    
+    def _build_index(self, documents: List[str], state: Dict) -> CorpusIndex:
+        """
+        Select the vocabulary and weight the counts the way TfidfVectorizer.fit_transform does
+        """
+        sections, matrix, df, tf = state['sections'], state['counts'], state['df'], state['tf']
+        if not len(sections):
+            raise ValueError("Cannot build an index without sections")
+        if not len(state['terms']):
+            raise ValueError("empty vocabulary; perhaps the documents only contain stop words")
+        
+        params = self.vectorizer.get_params()
+        n_sections = len(sections)
+        max_df, min_df = params['max_df'], params['min_df']
+        max_doc_count = max_df if isinstance(max_df, numbers.Integral) else max_df * n_sections
+        min_doc_count = min_df if isinstance(min_df, numbers.Integral) else min_df * n_sections
+        
+        mask = (df <= max_doc_count) & (df >= min_doc_count)
+        limit = params['max_features']
+        if limit is not None and mask.sum() > limit:
+            # Same selection (and tie order) as CountVectorizer._limit_features
+            tfs = tf.astype(self.vectorizer.dtype)
+            selected = (-tfs[mask]).argsort()[:limit]
+            new_mask = np.zeros(len(df), dtype=bool)
+            new_mask[np.flatnonzero(mask)[selected]] = True
+            mask = new_mask
+        
+        columns = np.flatnonzero(mask)
+        if not len(columns):
+            raise ValueError("After pruning, no terms remain. Try a lower min_df or a higher max_df.")
+        
+        vocabulary = {state['terms'][i]: j for j, i in enumerate(columns.tolist())}
+        vectorizer = clone(self.vectorizer).set_params(vocabulary=vocabulary)
+        transformer = TfidfTransformer(norm=params['norm'], use_idf=params['use_idf'],
+                                       smooth_idf=params['smooth_idf'], sublinear_tf=params['sublinear_tf'])
+        
+        # IDF from the maintained document frequencies, as TfidfTransformer.fit computes it
+        smooth = int(params['smooth_idf'])
+        idf = np.log((n_sections + smooth) / (df[columns].astype(np.float64) + smooth)) + 1
+        vectorizer.idf_ = idf
+        transformer.idf_ = idf
+        
+        counts = matrix[:, columns].astype(self.vectorizer.dtype)
+        counts.sort_indices()
+        tfidf = transformer.transform(counts, copy=False).tocsr()
+        
+        return CorpusIndex(documents, sections, vectorizer, tfidf)
+    
+    def _file_entry(self, pdf_path: str, previous: Optional[Dict]) -> Dict:
+        """
+        Manifest entry of a file; the content is only hashed when size or modification time changed
+        """
+        filename = os.path.basename(pdf_path)
+        try:
+            stat = os.stat(pdf_path)
+        except OSError:
+            return {'filename': filename, 'size': None, 'mtime_ns': None, 'sha256': None}
+        
+        entry = {'filename': filename, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        if previous and previous['size'] == stat.st_size and previous['mtime_ns'] == stat.st_mtime_ns:
+            entry['sha256'] = previous['sha256']
+        else:
+            entry['sha256'] = self._file_hash(pdf_path)
+        return entry
+    
+    @staticmethod
+    def _file_hash(pdf_path: str) -> Optional[str]:
+        """
+        SHA-256 of a file's content, or None if it cannot be read
+        """
+        digest = hashlib.sha256()
+        try:
+            with open(pdf_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+        except OSError:
+            return None
+        return digest.hexdigest()
+    
+    def _settings(self) -> Dict:
+        """
+        Settings that must match for the persisted statistics to be reused
+        """
+        params = self.vectorizer.get_params()
+        settings = {name: params[name] for name in _PERSISTED_PARAMS + ('max_df', 'min_df', 'use_idf')}
+        settings['ngram_range'] = list(settings['ngram_range'])
+        if isinstance(settings['stop_words'], (set, frozenset)):
+            settings['stop_words'] = sorted(settings['stop_words'])
+        settings['extractor'] = self.extractor_version
+        return settings
+    
+    def _empty_state(self) -> Dict:
+        from scipy import sparse
+        
+        return {
+            'files': [],
+            'terms': [],
+            'counts': sparse.csr_matrix((0, 0), dtype=np.int64),
+            'df': np.zeros(0, dtype=np.int64),
+            'tf': np.zeros(0, dtype=np.int64),
+            'sections': SectionStore.from_sections([]),
+            'signatures': None
+        }
+    
+    def _load_state(self) -> Dict:
+        """
+        Manifest and term statistics of the last update, or an empty state if there is none to reuse
+        """
+        from scipy import sparse
+        
+        manifest_path = os.path.join(self.index_dir, 'manifest.json')
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return self._empty_state()
+        
+        if manifest.get('format') != self.FORMAT_VERSION or manifest.get('settings') != self._settings():
+            print("Index settings changed; rebuilding the incremental index from scratch")
+            return self._empty_state()
+        
+        try:
+            arrays = {name: np.load(os.path.join(self.index_dir, f'{name}.npy')) for name in self._ARRAYS}
+            sections = SectionStore.load(self.index_dir, mmap=False)
+            if os.path.exists(os.path.join(self.index_dir, self._DUPLICATE_ROWS)):
+                sections = self._with_duplicates(
+                    sections,
+                    SectionStore.load(os.path.join(self.index_dir, self._DUPLICATES_DIR), mmap=False),
+                    np.load(os.path.join(self.index_dir, self._DUPLICATE_ROWS))
+                )
+            signatures = None
+            if os.path.exists(os.path.join(self.index_dir, self._SIGNATURES)):
+                signatures = np.load(os.path.join(self.index_dir, self._SIGNATURES))
+        except (OSError, ValueError) as e:
+            print(f"Could not load incremental index state: {e}")
+            return self._empty_state()
+        
+        terms = manifest['terms']
+        counts = sparse.csr_matrix(
+            (arrays['counts_data'], arrays['counts_indices'], arrays['counts_indptr']),
+            shape=(len(sections), len(terms))
+        )
+        return {'files': manifest['files'], 'terms': terms, 'counts': counts,
+                'df': arrays['df'], 'tf': arrays['tf'], 'sections': sections, 'signatures': signatures}
+    
+    @staticmethod
+    def _with_duplicates(kept: SectionStore, dropped: SectionStore, dropped_rows: np.ndarray) -> SectionStore:
+        """
+        All sections in order, from the indexed ones and the near-duplicates left out at dropped_rows
+        """
+        parts = []
+        position = 0
+        for i, row in enumerate(dropped_rows.tolist()):
+            # Sections before row that were kept
+            stop = row - i
+            parts.append(kept.select(position, stop))
+            parts.append(dropped.select(i, i + 1))
+            position = stop
+        parts.append(kept.select(position, len(kept)))
+        
+        sections = SectionStore.concat(parts)
+        sections.duplicates = {}
+        return sections
+    
+    def _save_state(self, state: Dict, index: CorpusIndex, dropped_rows: Optional[np.ndarray] = None):
+        """
+        Write the index and term statistics to a fresh directory, then swap it in place of the old one
+        """
+        parent = os.path.dirname(os.path.abspath(self.index_dir))
+        os.makedirs(parent, exist_ok=True)
+        tmp_dir = os.path.abspath(self.index_dir) + '.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        
+        index.save(tmp_dir)
+        counts = state['counts']
+        arrays = {
+            'counts_data': counts.data, 'counts_indices': counts.indices, 'counts_indptr': counts.indptr,
+            'df': state['df'], 'tf': state['tf']
+        }
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_dir, f'{name}.npy'), array)
+        if dropped_rows is not None:
+            state['sections'].take(dropped_rows).save(os.path.join(tmp_dir, self._DUPLICATES_DIR), keyword_matchers=False)
+            np.save(os.path.join(tmp_dir, self._DUPLICATE_ROWS), dropped_rows)
+        if state['signatures'] is not None:
+            np.save(os.path.join(tmp_dir, self._SIGNATURES), state['signatures'])
+        
+        manifest = {
+            'format': self.FORMAT_VERSION,
+            'settings': self._settings(),
+            'files': state['files'],
+            'terms': state['terms']
+        }
+        with open(os.path.join(tmp_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        
+        old_dir = os.path.abspath(self.index_dir) + '.old'
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.exists(self.index_dir):
+            os.rename(self.index_dir, old_dir)
+        os.rename(tmp_dir, self.index_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
@@ -0,0 +1,206 @@
+import os
+import re
+from collections import Counter
+from typing import List, Optional, TYPE_CHECKING
+
+import numpy as np
+
+# SciPy takes a noticeable part of start-up and is only loaded once a matcher is built
+if TYPE_CHECKING:
+    from scipy import sparse
+
+
+class KeywordMatcher:
+    """
+    Binary (texts x tokens) matrix over the whitespace-separated tokens of lowercased texts.
+    Built once per text collection, it answers "how many of these keywords occur in each text"
+    for any number of keyword lists with a vocabulary scan and a sparse matrix product.
+    The token ids and the vocabulary can be saved with the texts, sliced and joined like them.
+    """
+    
+    def __init__(self, texts: List[str], tokens: Optional[List[str]] = None,
+                 indices: Optional[np.ndarray] = None, indptr: Optional[np.ndarray] = None):
+        self.texts = texts
+        
+        if tokens is None:
+            vocabulary = {}
+            token_ids = []
+            offsets = [0]
+            for text in texts:
+                token_ids.extend({vocabulary.setdefault(token, len(vocabulary)) for token in text.lower().split()})
+                offsets.append(len(token_ids))
+            tokens = list(vocabulary)
+            indices = np.asarray(token_ids, dtype=np.int32)
+            indptr = np.asarray(offsets, dtype=np.int64)
+        
+        # Row i holds the ids of the distinct tokens of text i: indices[indptr[i]:indptr[i + 1]]
+        self.tokens = tokens
+        self.indices = indices
+        self.indptr = indptr
+        self._matrix = None
+        
+        # Tokens joined by newlines, so keyword occurrences can be found with one scan per keyword
+        self._joined_tokens = '\n'.join(tokens)
+        self._token_starts = np.cumsum([0] + [len(token) + 1 for token in tokens[:-1]]) if tokens else np.zeros(0)
+    
+    @property
+    def matrix(self) -> 'sparse.csr_matrix':
+        """
+        Binary (texts x tokens) matrix, built on first use
+        """
+        if self._matrix is None:
+            from scipy import sparse
+            self._matrix = sparse.csr_matrix(
+                (np.ones(len(self.indices), dtype=np.int64), self.indices, self.indptr),
+                shape=(len(self.indptr) - 1, len(self.tokens))
+            )
+        return self._matrix
+    
+    def select(self, start: int, stop: int, texts: List[str]) -> 'KeywordMatcher':
+        """
+        Matcher over texts start..stop-1 (given as texts), sharing this matcher's vocabulary
+        """
+        indptr = self.indptr[start:stop + 1]
+        return KeywordMatcher(texts, self.tokens, self.indices[indptr[0]:indptr[-1]], indptr - indptr[0])
+    
+    @staticmethod
+    def concat(matchers: List['KeywordMatcher'], texts: List[str]) -> 'KeywordMatcher':
+        """
+        Join matchers into one over texts, their texts in order; the joined vocabulary only keeps
+        the tokens still used, so it does not grow as texts are sliced away
+        """
+        # Slices of one matcher share its vocabulary, which is mapped once for all of them
+        sources = {}
+        for matcher in matchers:
+            sources.setdefault(id(matcher.tokens), (matcher.tokens, []))[1].append(matcher.indices)
+        
+        vocabulary = {}
+        mappings = {}
+        for key, (tokens, parts) in sources.items():
+            mapping = mappings[key] = np.zeros(len(tokens), dtype=np.int32)
+            for token_id in np.unique(np.concatenate(parts)).tolist():
+                mapping[token_id] = vocabulary.setdefault(tokens[token_id], len(vocabulary))
+        
+        indices = [np.zeros(0, dtype=np.int32)]
+        indptr = [np.zeros(1, dtype=np.int64)]
+        size = 0
+        for matcher in matchers:
+            indices.append(mappings[id(matcher.tokens)][matcher.indices])
+            indptr.append(matcher.indptr[1:] - matcher.indptr[0] + size)
+            size += int(matcher.indptr[-1] - matcher.indptr[0])
+        
+        return KeywordMatcher(texts, list(vocabulary), np.concatenate(indices), np.concatenate(indptr))
+    
+    def save(self, directory: str, name: str):
+        """
+        Persist the token ids and the vocabulary as .npy files named after name
+        """
+        np.save(os.path.join(directory, f'{name}_indices.npy'), self.indices)
+        np.save(os.path.join(directory, f'{name}_indptr.npy'), self.indptr)
+        np.save(os.path.join(directory, f'{name}_tokens.npy'),
+                np.frombuffer(self._joined_tokens.encode('utf-8'), dtype=np.uint8))
+    
+    @classmethod
+    def load(cls, directory: str, name: str, texts: List[str], mmap: bool = True) -> 'KeywordMatcher':
+        """
+        Load a matcher saved under name for texts, memory-mapping the token ids unless mmap is False
+        """
+        mmap_mode = 'r' if mmap else None
+        indices = np.load(os.path.join(directory, f'{name}_indices.npy'), mmap_mode=mmap_mode)
+        indptr = np.load(os.path.join(directory, f'{name}_indptr.npy'), mmap_mode=mmap_mode)
+        # Tokens are never empty, so an empty buffer means an empty vocabulary
+        joined = np.load(os.path.join(directory, f'{name}_tokens.npy')).tobytes().decode('utf-8')
+        return cls(texts, joined.split('\n') if joined else [], indices, indptr)
+    
+    @staticmethod
+    def exists(directory: str, name: str) -> bool:
+        return os.path.isfile(os.path.join(directory, f'{name}_tokens.npy'))
+    
+    def counts(self, keyword_lists: List[List[str]]) -> np.ndarray:
+        """
+        Count, for every text, how many keywords of each list occur in it as a substring of the
+        lowercased text (a keyword listed twice counts twice).
+        Returns an integer array of shape (texts, keyword lists).
+        """
+        counts = np.zeros((len(self.texts), len(keyword_lists)), dtype=np.int64)
+        keywords = sorted({keyword for keywords in keyword_lists for keyword in keywords})
+        if not self.texts or not keywords:
+            return counts
+        
+        columns = {keyword: i for i, keyword in enumerate(keywords)}
+        presence = self.presence(keywords)
+        
+        for j, keyword_list in enumerate(keyword_lists):
+            weights = np.zeros(len(keywords), dtype=np.int64)
+            for keyword, multiplicity in Counter(keyword_list).items():
+                weights[columns[keyword]] = multiplicity
+            counts[:, j] = presence @ weights
+        
+        return counts
+    
+    def presence(self, keywords: List[str]) -> np.ndarray:
+        """
+        Boolean array of shape (texts, keywords): whether each distinct keyword occurs in each
+        lowercased text
+        """
+        columns = {keyword: i for i, keyword in enumerate(keywords)}
+        presence = np.zeros((len(self.texts), len(keywords)), dtype=bool)
+        if not self.texts or not keywords:
+            return presence
+        
+        # A keyword without whitespace can only occur inside a single token
+        token_keywords = [keyword for keyword in keywords if keyword and not re.search(r'\s', keyword)]
+        if token_keywords and self.tokens:
+            hits = (self.matrix @ self._token_indicator(token_keywords)).toarray() > 0
+            presence[:, [columns[keyword] for keyword in token_keywords]] = hits
+        
+        # Rare keywords with whitespace (or empty ones) are matched against the texts directly
+        other_keywords = [keyword for keyword in keywords if keyword not in set(token_keywords)]
+        if other_keywords:
+            lowered = [text.lower() for text in self.texts]
+            for keyword in other_keywords:
+                presence[:, columns[keyword]] = [keyword in text for text in lowered]
+        
+        return presence
+    
+    def _token_indicator(self, keywords: List[str]) -> 'sparse.csr_matrix':
+        """
+        Sparse (tokens x keywords) matrix marking the tokens that contain each keyword
+        """
+        from scipy import sparse
+        
+        rows, cols = [], []
+        for j, keyword in enumerate(keywords):
+            positions = [m.start() for m in re.finditer(f'(?={re.escape(keyword)})', self._joined_tokens)]
+            token_ids = np.unique(np.searchsorted(self._token_starts, positions, side='right') - 1)
+            rows.extend(token_ids.tolist())
+            cols.extend([j] * len(token_ids))
+        
+        return sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.int64), (rows, cols)),
+            shape=(len(self.tokens), len(keywords))
+        )
+
+
+def keyword_match_counts(texts: List[str], keyword_lists: List[List[str]]) -> np.ndarray:
+    """
+    One-off keyword counting with the semantics of KeywordMatcher.counts.
+    Scans the texts directly: building a matcher costs more than one scan and only pays off
+    when the same texts are matched again.
+    """
+    counts = []
+    for text in texts:
+        text = text.lower()
+        counts.append([sum(keyword in text for keyword in keywords) for keywords in keyword_lists])
+    return np.array(counts, dtype=np.int64).reshape(len(texts), len(keyword_lists))
+
+
+def keyword_presence(texts: List[str], keywords: List[str]) -> np.ndarray:
+    """
+    One-off keyword presence with the semantics of KeywordMatcher.presence, scanning the texts directly
+    """
+    presence = np.zeros((len(texts), len(keywords)), dtype=bool)
+    for i, text in enumerate(texts):
+        text = text.lower()
+        presence[i] = [keyword in text for keyword in keywords]
+    return presence
@@ -0,0 +1,181 @@
+import re
+from collections import Counter
+from typing import List, Dict, Optional, Tuple
+
+import numpy as np
+
+# Font names that indicate a bold face
+_BOLD_FONT_RE = re.compile(r'bold|black|heavy|semibold|demi|[-,](?:B|Bd|SB)$', re.IGNORECASE)
+
+# Heading size thresholds relative to the body font size, largest first
+_LEVEL_RATIOS = (1.6, 1.3, 1.12)
+
+# Lines longer than this are treated as body text regardless of font
+MAX_HEADING_CHARS = 120
+
+# Bold run-in text is only a heading when it is short
+MAX_BOLD_HEADING_CHARS = 60
+
+# Share of the page height at the top and bottom treated as running header/footer
+_MARGIN_FRACTION = 0.06
+
+# A line repeated within this many points of where it was on one of the last pages is a running header/footer
+_RUNNING_TOLERANCE = 2.0
+
+# Running headers alternate between facing pages at most
+_RUNNING_PAGES = 2
+
+
+class LayoutHeadingDetector:
+    """
+    Detect headings from pdfplumber character metadata (font size, boldness and position).
+    One detector is used per document so the body font size and repeated running
+    headers are learned across pages.
+    """
+    
+    def __init__(self):
+        self.size_histogram = Counter()
+        self.page_number = 0
+        # Page and vertical position where each heading candidate was last seen
+        self.heading_positions = {}
+    
+    def page_lines(self, chars: List[Dict], page_height: Optional[float] = None) -> List[Tuple[str, Optional[int]]]:
+        """
+        Group a page's characters into lines in reading order and mark headings.
+        Returns (line text, heading level) pairs; the level is None for body lines.
+        """
+        self.page_number += 1
+        chars = [c for c in chars if c.get('upright', True)]
+        if not chars:
+            return []
+        
+        top = np.fromiter((c['top'] for c in chars), dtype=float, count=len(chars))
+        x0 = np.fromiter((c['x0'] for c in chars), dtype=float, count=len(chars))
+        x1 = np.fromiter((c['x1'] for c in chars), dtype=float, count=len(chars))
+        size = np.fromiter((c['size'] for c in chars), dtype=float, count=len(chars))
+        texts = np.array([c['text'] for c in chars], dtype=object)
+        visible = np.array([t.strip() != '' for t in texts])
+        
+        # Bold flag per character, classified once per distinct font name
+        fontnames, font_ids = np.unique([c.get('fontname', '') for c in chars], return_inverse=True)
+        bold = np.array([bool(_BOLD_FONT_RE.search(name)) for name in fontnames])[font_ids]
+        
+        # Cluster characters into lines by vertical position
+        order = np.argsort(top, kind='stable')
+        tolerance = max(np.median(size) * 0.5, 1.0)
+        new_line = np.r_[True, np.diff(top[order]) > tolerance]
+        line_ids = np.empty(len(order), dtype=np.int64)
+        line_ids[order] = np.cumsum(new_line) - 1
+        
+        # Reading order within a line is left to right
+        order = np.lexsort((x0, line_ids))
+        line_ids, top, x0, x1 = line_ids[order], top[order], x0[order], x1[order]
+        size, texts, visible, bold = size[order], texts[order], visible[order], bold[order]
+        
+        # Split lines into segments at wide horizontal gaps (column gutters, table cells)
+        same_line = np.r_[False, line_ids[1:] == line_ids[:-1]]
+        gap = np.r_[0.0, x0[1:] - x1[:-1]]
+        wide_gap = same_line & (gap > size * 1.5)
+        needs_space = same_line & ~wide_gap & (gap > size * 0.2)
+        seg_starts = np.flatnonzero(~same_line | wide_gap)
+        seg_ends = np.r_[seg_starts[1:], len(texts)]
+        
+        # Per-segment font statistics
+        counts = np.maximum(np.add.reduceat(visible.astype(float), seg_starts), 1.0)
+        seg_size = np.add.reduceat(size * visible, seg_starts) / counts
+        seg_bold = np.add.reduceat((bold & visible).astype(float), seg_starts) / counts
+        seg_top = top[seg_starts]
+        seg_x0 = x0[seg_starts]
+        
+        # Two-column pages: read the left column before the right one
+        column = np.zeros(len(seg_starts), dtype=np.int64)
+        split_x = (x0[wide_gap] + x1[np.flatnonzero(wide_gap) - 1]) / 2
+        if len(split_x) >= max(3, 0.3 * (line_ids[-1] + 1)):
+            column = (seg_x0 >= np.median(split_x)).astype(np.int64)
+        seg_order = np.lexsort((seg_x0, seg_top, column))
+        
+        body_size = self._body_size(size[visible])
+        ratios = seg_size / body_size
+        
+        lines = []
+        for i in seg_order:
+            parts = []
+            for j in range(seg_starts[i], seg_ends[i]):
+                if needs_space[j] and texts[j] != ' ':
+                    parts.append(' ')
+                parts.append(texts[j])
+            text = re.sub(r'\s+', ' ', ''.join(parts)).strip()
+            if not text:
+                continue
+            
+            in_margin = page_height is not None and not (
+                page_height * _MARGIN_FRACTION < seg_top[i] < page_height * (1 - _MARGIN_FRACTION))
+            level = None if in_margin else self._heading_level(text, ratios[i], seg_bold[i], seg_top[i])
+            lines.append((text, level, seg_top[i], seg_size[i], column[i]))
+        
+        return self._merge_heading_lines(lines)
+    
+    def _body_size(self, sizes: np.ndarray) -> float:
+        """
+        Most common (rounded) character size seen so far in the document
+        """
+        rounded, counts = np.unique(np.round(sizes * 2) / 2, return_counts=True)
+        self.size_histogram.update(dict(zip(rounded.tolist(), counts.tolist())))
+        
+        if not self.size_histogram:
+            return 1.0
+        return self.size_histogram.most_common(1)[0][0]
+    
+    def _heading_level(self, text: str, ratio: float, bold_fraction: float,
+                       top: Optional[float] = None) -> Optional[int]:
+        """
+        Heading level of a line from its size relative to the body text, or None for body text
+        """
+        if len(text) > MAX_HEADING_CHARS or not re.match(r'[\dA-Z]', text) or not re.search(r'[A-Za-z]{2}', text):
+            return None
+        
+        if self._is_running(text, top):
+            return None
+        
+        for depth, threshold in enumerate(_LEVEL_RATIOS, start=1):
+            if ratio >= threshold:
+                return depth
+        
+        # Short bold lines around body size are the lowest heading level
+        if bold_fraction >= 0.8 and ratio >= 0.85 and len(text) <= MAX_BOLD_HEADING_CHARS:
+            return len(_LEVEL_RATIOS) + 1
+        
+        return None
+    
+    def _is_running(self, text: str, top: Optional[float]) -> bool:
+        """
+        Whether a line repeats a running header/footer: the same text at the same height on one of the
+        last pages. A heading that recurs elsewhere on a later page (e.g. "Introduction" of another chapter)
+        is still a section boundary.
+        """
+        previous = self.heading_positions.get(text)
+        self.heading_positions[text] = (self.page_number, top)
+        if previous is None or top is None or previous[1] is None:
+            return False
+        
+        page, previous_top = previous
+        return 0 < self.page_number - page <= _RUNNING_PAGES and abs(top - previous_top) <= _RUNNING_TOLERANCE
+    
+    @staticmethod
+    def _merge_heading_lines(lines: List[Tuple]) -> List[Tuple[str, Optional[int]]]:
+        """
+        Join headings wrapped over consecutive lines with the same level into a single heading
+        """
+        merged = []
+        previous = None
+        
+        for text, level, top, line_size, column in lines:
+            if (level is not None and merged and merged[-1][1] == level and previous[1] == column
+                    and 0 < top - previous[0] < line_size * 2
+                    and len(merged[-1][0]) + len(text) < MAX_HEADING_CHARS):
+                merged[-1] = (f"{merged[-1][0]} {text}", level)
+            else:
+                merged.append((text, level))
+            previous = (top, column)
+        
+        return merged
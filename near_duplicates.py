@@ -0,0 +1,143 @@
+import re
+import zlib
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+_WORD_RE = re.compile(r'\w+')
+
+# Mersenne-like prime above 2**32 for the universal hash family (a * x + b) mod p
+_PRIME = np.uint64(4294967311)
+
+# Shingle hashes processed per block, bounding the (permutations x shingles) work array
+_BLOCK = 4096
+
+# Signature value of texts without words; hashes are reduced modulo _PRIME and never reach it
+_NO_WORDS = np.uint64(np.iinfo(np.uint64).max)
+
+
+class NearDuplicateFilter:
+    """
+    Streaming near-duplicate detection of section texts with MinHash signatures and LSH banding.
+    Each section is reduced to a signature of num_perm minimum hashes over its word shingles; signatures
+    are cut into bands, and only earlier kept sections sharing a band bucket are compared. A section whose
+    estimated Jaccard similarity to one of them reaches the threshold is dropped and recorded as a copy of it,
+    so the cost grows linearly with the number of sections. The first occurrence of a text is the one kept.
+    """
+    
+    def __init__(self, threshold: float = 0.8, num_perm: int = 128, bands: int = 16, shingle_size: int = 5,
+                 seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        
+        rng = np.random.RandomState(seed)
+        # Multipliers below 2**31 keep a * x + b within 64 bits for 32-bit shingle hashes
+        self._a = rng.randint(1, 2 ** 31, size=num_perm).astype(np.uint64)[:, None]
+        self._b = rng.randint(0, 2 ** 32, size=num_perm).astype(np.uint64)[:, None]
+        self._word_hashes = {}
+        
+        self.buckets = [{} for _ in range(bands)]
+        self.kept = []
+        # Index of the kept section (in the filtered stream) -> its dropped copies
+        self.copies = {}
+        self.dropped = 0
+    
+    def shingles(self, text: str) -> np.ndarray:
+        """
+        32-bit hashes of the word shingle_size-grams of a text (the whole text for shorter ones)
+        """
+        word_hashes = self._word_hashes
+        hashes = []
+        for word in _WORD_RE.findall(text.lower()):
+            value = word_hashes.get(word)
+            if value is None:
+                value = word_hashes[word] = zlib.crc32(word.encode('utf-8'))
+            hashes.append(value)
+        if not hashes:
+            return np.zeros(0, dtype=np.uint64)
+        
+        words = np.asarray(hashes, dtype=np.uint64)
+        size = min(self.shingle_size, len(words))
+        count = len(words) - size + 1
+        grams = np.zeros(count, dtype=np.uint64)
+        for offset in range(size):
+            grams = (grams * np.uint64(1000003) + words[offset:offset + count]) & np.uint64(0xFFFFFFFF)
+        return np.unique(grams)
+    
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """
+        MinHash signature of a text, None when it has no words
+        """
+        shingles = self.shingles(text)
+        if not len(shingles):
+            return None
+        
+        signature = np.full(self.num_perm, np.iinfo(np.uint64).max, dtype=np.uint64)
+        for start in range(0, len(shingles), _BLOCK):
+            block = shingles[None, start:start + _BLOCK]
+            np.minimum(signature, ((self._a * block + self._b) % _PRIME).min(axis=1), out=signature)
+        return signature
+    
+    def signatures(self, texts: Iterable[str]) -> np.ndarray:
+        """
+        MinHash signatures of texts as the rows of a (texts x num_perm) array; a text without words
+        gets a row of the maximum value, which no hash reaches
+        """
+        rows = [np.zeros((0, self.num_perm), dtype=np.uint64)]
+        for text in texts:
+            signature = self.signature(text)
+            rows.append(np.full((1, self.num_perm), _NO_WORDS, dtype=np.uint64) if signature is None else signature[None])
+        return np.concatenate(rows)
+    
+    def filter(self, sections: Iterable[Dict], signatures: Optional[np.ndarray] = None) -> Iterator[Dict]:
+        """
+        Yield the sections that are not near-duplicates of an earlier yielded one.
+        With signatures (as returned by signatures() for the same sections) the texts are not hashed again.
+        """
+        for i, section in enumerate(sections):
+            if signatures is None:
+                signature = self.signature(f"{section['section_title']} {section['content']}")
+            else:
+                signature = signatures[i] if signatures[i, 0] != _NO_WORDS else None
+            if signature is None:
+                self.kept.append(None)
+                yield section
+                continue
+            
+            keys = [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+            original = self._best_match(signature, keys)
+            if original is not None:
+                self.copies.setdefault(original, []).append({
+                    'document': section['document'],
+                    'page': section['page'],
+                    'section_title': section['section_title']
+                })
+                self.dropped += 1
+                continue
+            
+            index = len(self.kept)
+            self.kept.append(signature)
+            for bucket, key in zip(self.buckets, keys):
+                bucket.setdefault(key, []).append(index)
+            yield section
+    
+    def _best_match(self, signature: np.ndarray, keys: List[bytes]) -> Optional[int]:
+        """
+        Earliest of the most similar kept sections sharing a band with the signature, if similar enough
+        """
+        candidates = set()
+        for bucket, key in zip(self.buckets, keys):
+            candidates.update(bucket.get(key, ()))
+        
+        best, best_similarity = None, self.threshold
+        for index in sorted(candidates):
+            similarity = float(np.mean(self.kept[index] == signature))
+            if similarity > best_similarity or (similarity >= best_similarity and best is None):
+                best, best_similarity = index, similarity
+        return best
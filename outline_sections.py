@@ -0,0 +1,189 @@
+import re
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+# Outlines with fewer usable entries (e.g. a single bookmark for the title) leave sectioning to the heuristics
+MIN_OUTLINE_ENTRIES = 2
+
+# Wrapped heading lines following a bookmark that are dropped from the section text
+MAX_TITLE_LINES = 3
+
+_NON_WORD_RE = re.compile(r'\W+')
+
+# Unbookmarked back matter after the last outline entry (typically the bibliography) still starts a section
+_BACK_MATTER_RE = re.compile(r'^(?:references|bibliography|appendix(?: [a-z0-9]+)?|appendices|index)$', re.IGNORECASE)
+
+
+class OutlineEntry(NamedTuple):
+    page_index: int
+    top: float
+    title: str
+    level: int
+
+
+def _normalize(text: str) -> str:
+    # Extracted text often loses the spaces between words, so only word characters are compared
+    return _NON_WORD_RE.sub('', text.lower())
+
+
+class DocumentOutline:
+    """
+    Section starts taken from a PDF's outline (bookmarks): the title, nesting level, page and vertical
+    position of every entry whose destination resolves to a page of the document, in reading order.
+    Page lines are split into sections at these positions instead of being classified one by one.
+    """
+    
+    def __init__(self, entries: List[OutlineEntry]):
+        self.entries = sorted(entries, key=lambda entry: (entry.page_index, entry.top))
+        self.by_page = {}
+        for entry in self.entries:
+            self.by_page.setdefault(entry.page_index, []).append(entry)
+    
+    @property
+    def first_page_index(self) -> int:
+        """
+        Index of the page holding the first entry; text before it belongs to no section
+        """
+        return self.entries[0].page_index
+    
+    @classmethod
+    def from_pdf(cls, pdf) -> Optional['DocumentOutline']:
+        """
+        Outline of an open pdfplumber document, or None when it has no usable outline
+        """
+        # pdfminer comes with pdfplumber, which is only loaded once a PDF is opened
+        from pdfminer.pdftypes import PDFObjRef
+        
+        try:
+            outlines = list(pdf.doc.get_outlines())
+        except Exception:
+            # No /Outlines (PDFNoOutlines) or a malformed outline tree
+            return None
+        if len(outlines) < MIN_OUTLINE_ENTRIES:
+            return None
+        
+        pages = pdf.pages
+        page_indexes = {page.page_obj.pageid: i for i, page in enumerate(pages)}
+        
+        entries = []
+        for level, title, dest, action, _ in outlines:
+            target = cls._resolve_destination(pdf.doc, dest, action)
+            if not target or not title or not title.strip():
+                continue
+            
+            page_ref = target[0]
+            page_index = page_indexes.get(page_ref.objid) if isinstance(page_ref, PDFObjRef) else None
+            if page_index is None:
+                continue
+            
+            page = pages[page_index]
+            entries.append(OutlineEntry(page_index, cls._destination_top(target, page), title.strip(), level))
+        
+        return cls(entries) if len(entries) >= MIN_OUTLINE_ENTRIES else None
+    
+    @staticmethod
+    def _resolve_destination(doc, dest, action) -> Optional[List]:
+        """
+        Explicit destination array [page, /Fit..., ...] of an outline entry, following GoTo actions and named destinations
+        """
+        from pdfminer.pdftypes import resolve1
+        from pdfminer.psparser import PSLiteral
+        
+        try:
+            if dest is None and action is not None:
+                action = resolve1(action)
+                if not isinstance(action, dict):
+                    return None
+                kind = action.get('S')
+                if not isinstance(kind, PSLiteral) or kind.name != 'GoTo':
+                    return None
+                dest = action.get('D')
+            
+            dest = resolve1(dest)
+            if isinstance(dest, PSLiteral):
+                dest = dest.name
+            if isinstance(dest, (bytes, str)):
+                dest = resolve1(doc.get_dest(dest))
+            if isinstance(dest, dict):
+                dest = resolve1(dest.get('D'))
+        except Exception:
+            # Dangling references and unknown named destinations
+            return None
+        
+        return dest if isinstance(dest, list) and dest else None
+    
+    @staticmethod
+    def _destination_top(dest: List, page) -> float:
+        """
+        Distance of a destination from the top of its page, 0 when it only names the page
+        """
+        from pdfminer.pdftypes import resolve1
+        from pdfminer.psparser import PSLiteral
+        
+        kind = dest[1].name if len(dest) > 1 and isinstance(dest[1], PSLiteral) else None
+        position = None
+        if kind == 'XYZ' and len(dest) > 3:
+            position = resolve1(dest[3])
+        elif kind in ('FitH', 'FitBH') and len(dest) > 2:
+            position = resolve1(dest[2])
+        if not isinstance(position, (int, float)):
+            return 0.0
+        
+        # Destination coordinates are in PDF user space, measured up from the media box bottom
+        return min(max(page.height - (position - page.mediabox[1]), 0.0), page.height)
+    
+    def page_lines(self, page, clean_heading: Callable[[str], str]) -> List[Tuple[str, Optional[Tuple[str, int]]]]:
+        """
+        Lines of a page in reading order paired with (title, level) where an outline entry starts.
+        The heading text printed after a bookmark is dropped since the entry already carries the title.
+        """
+        page_index = page.page_number - 1
+        pending = list(self.by_page.get(page_index, []))
+        # Past the last entry, back-matter headings the outline leaves out still end the last section
+        tail = page_index > self.entries[-1].page_index
+        if not pending:
+            text = page.extract_text()
+            lines = [line.strip() for line in text.split('\n')] if text else []
+            return [(line, self._back_matter(line, clean_heading) if tail else None) for line in lines if line]
+        
+        result = []
+        title = None
+        title_lines = 0
+        for line in page.extract_text_lines(return_chars=False):
+            text = line['text'].strip()
+            if not text:
+                continue
+            
+            # An entry starts at the first line whose middle lies below its destination
+            middle = (line['top'] + line['bottom']) / 2
+            while pending and pending[0].top <= middle:
+                entry = pending.pop(0)
+                result.append((entry.title, (clean_heading(entry.title), entry.level)))
+                title, title_lines = _normalize(entry.title), 0
+                tail = entry is self.entries[-1]
+            
+            heading = self._back_matter(text, clean_heading) if tail else None
+            if heading:
+                result.append((text, heading))
+                title = None
+                continue
+            
+            normalized = _normalize(text)
+            if title is not None and title_lines < MAX_TITLE_LINES and normalized and normalized in title:
+                title_lines += 1
+                continue
+            title = None
+            result.append((text, None))
+        
+        # Entries pointing below the last line start with the next page
+        for entry in pending:
+            result.append((entry.title, (clean_heading(entry.title), entry.level)))
+        
+        return result
+    
+    @staticmethod
+    def _back_matter(line: str, clean_heading: Callable[[str], str]) -> Optional[Tuple[str, int]]:
+        """
+        (title, level) of a back-matter heading such as 'References', None for other lines
+        """
+        title = clean_heading(line)
+        return (title, 1) if _BACK_MATTER_RE.match(title) else None
@@ -0,0 +1,139 @@
+import json
+import os
+import shutil
+import tempfile
+from typing import Dict, List, Optional
+
+# Indented JSON as before, JSON without whitespace, or one JSON record per line
+OUTPUT_FORMATS = ('json', 'compact', 'jsonl')
+
+# File extension of results written in each format
+OUTPUT_EXTENSIONS = {'json': '.json', 'compact': '.json', 'jsonl': '.jsonl'}
+
+
+class OutputWriter:
+    """
+    Write an analysis result incrementally, one ranked section and its sub-sections at a time.
+    In JSON the sub-section entries are spooled to a temporary file while the sections are written and
+    copied in after them, so neither list is held in memory; indented output is identical to json.dump
+    with indent=2. JSON Lines output has one {"<member>": value} record per line: the metadata, then an
+    "extracted_section" and its "sub_section" records per section, then any trailing members.
+    The file is written under a temporary name and only replaces output_file once it is complete.
+    """
+    
+    def __init__(self, output_file: str, output_format: str = 'json'):
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format: {output_format}")
+        
+        self.output_file = output_file
+        self.output_format = output_format
+        self.indent = 2 if output_format == 'json' else None
+        self.sections = 0
+        self.sub_sections = 0
+        
+        self._tmp_path = f"{output_file}.tmp"
+        self._file = open(self._tmp_path, 'w', encoding='utf-8')
+        self._spool = None
+    
+    def __enter__(self) -> 'OutputWriter':
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+    
+    def _encode(self, value, depth: int = 0) -> str:
+        """
+        JSON of a value nested depth levels deep in the output
+        """
+        if self.indent is None:
+            return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+        return json.dumps(value, ensure_ascii=False, indent=self.indent).replace('\n', '\n' + ' ' * self.indent * depth)
+    
+    def _member(self, name: str, first: bool = False) -> str:
+        """
+        Separator and key that start a top-level member of the output object
+        """
+        if self.indent is None:
+            return f'{"" if first else ","}{json.dumps(name)}:'
+        return f'{"" if first else ","}\n{" " * self.indent}{json.dumps(name)}: '
+    
+    def _item(self, value, first: bool) -> str:
+        """
+        Separator and JSON of an item of a top-level list
+        """
+        if self.indent is None:
+            return ('' if first else ',') + self._encode(value)
+        return f'{"" if first else ","}\n{" " * self.indent * 2}{self._encode(value, 2)}'
+    
+    def _close_list(self, count: int) -> str:
+        return ']' if self.indent is None or not count else f'\n{" " * self.indent}]'
+    
+    def _record(self, name: str, value):
+        self._file.write(self._encode({name: value}) + '\n')
+    
+    def begin(self, metadata: Dict):
+        """
+        Start the output with its metadata
+        """
+        if self.output_format == 'jsonl':
+            self._record('metadata', metadata)
+            return
+        
+        self._file.write('{' + self._member('metadata', first=True) + self._encode(metadata, 1))
+        self._file.write(self._member('extracted_sections') + '[')
+        self._spool = tempfile.TemporaryFile('w+', encoding='utf-8')
+    
+    def add_section(self, extracted_section: Dict, sub_sections: List[Dict]):
+        """
+        Append a ranked section and the sub-section entries taken from it
+        """
+        if self.output_format == 'jsonl':
+            self._record('extracted_section', extracted_section)
+            for sub_section in sub_sections:
+                self._record('sub_section', sub_section)
+        else:
+            self._file.write(self._item(extracted_section, self.sections == 0))
+            for i, sub_section in enumerate(sub_sections):
+                self._spool.write(self._item(sub_section, self.sub_sections + i == 0))
+        
+        self.sections += 1
+        self.sub_sections += len(sub_sections)
+    
+    def close(self, trailing: Optional[Dict] = None):
+        """
+        Finish the output with any trailing members (such as metrics) and move it into place
+        """
+        if self._file.closed:
+            return
+        
+        trailing = trailing or {}
+        if self.output_format == 'jsonl':
+            for name, value in trailing.items():
+                self._record(name, value)
+        else:
+            self._file.write(self._close_list(self.sections))
+            self._file.write(self._member('sub_section_analysis') + '[')
+            self._spool.seek(0)
+            shutil.copyfileobj(self._spool, self._file)
+            self._spool.close()
+            self._file.write(self._close_list(self.sub_sections))
+            for name, value in trailing.items():
+                self._file.write(self._member(name) + self._encode(value, 1))
+            self._file.write('}' if self.indent is None else '\n}')
+        
+        self._file.close()
+        os.replace(self._tmp_path, self.output_file)
+    
+    def abort(self):
+        """
+        Discard a partially written output
+        """
+        if self._spool is not None:
+            self._spool.close()
+        if not self._file.closed:
+            self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
@@ -1,41 +1,251 @@
+import argparse
+import heapq
 import json
 import os
 import re
-import pdfplumber
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 from datetime import datetime
-from typing import List, Dict, Optional, Tuple
-from collections import defaultdict
-import nltk
-from nltk.tokenize import sent_tokenize, word_tokenize
-from nltk.corpus import stopwords
-from nltk.stem import PorterStemmer
+from itertools import islice
+from typing import List, Dict, Iterable, Iterator, Optional, Sequence, Tuple, Union, TYPE_CHECKING
+from collections import OrderedDict, defaultdict
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from bm25_index import BM25Index
+from extraction_budget import ExtractionBudget, parse_page_range
+from extraction_cache import ExtractionCache
+from keyword_scoring import keyword_match_counts, keyword_presence
+from layout_headings import LayoutHeadingDetector
+from near_duplicates import NearDuplicateFilter
+from outline_sections import DocumentOutline
+from output_writer import OUTPUT_EXTENSIONS, OUTPUT_FORMATS, OutputWriter
+from pipeline_metrics import PROFILERS, PipelineMetrics, profiled
+from section_store import SectionStore
+from sharded_collection import DEFAULT_SHARD_DOCUMENTS, ShardedCollection, parse_collection_spec
+from subsections import SubsectionEngine
+from text_resources import TextResources
+
+# NLTK, scikit-learn and pdfplumber take seconds to import and are only loaded where they are used
+if TYPE_CHECKING:
+    from corpus_index import CorpusIndex
+
+# Bump whenever section extraction changes so cached results are invalidated
+EXTRACTOR_VERSION = '4'
+
+# Ranked sections whose sub-sections are extracted together while the output is written
+OUTPUT_CHUNK_SIZE = 256
+
+# Available heading detectors: regexes over extracted text lines, or font metadata of page characters
+HEADING_DETECTORS = ('regex', 'layout')
+
+# Available ranking backends: TF-IDF over a fitted vocabulary or over hashed term features,
+# or BM25 over an inverted index of stemmed terms
+RANKING_BACKENDS = ('tfidf', 'hashing', 'bm25')
+
+# Heading patterns combined into one expression so each line is classified with a single match
+_HEADING_RE = re.compile(
+    r'(?P<numbered>\d+\.\s+[A-Z])'  # "1. Introduction"
+    r'|(?P<subnumbered>\d+\.\d+\s+[A-Z])'  # "1.1 Overview"
+    r'|(?P<caps>[A-Z][A-Z\s]+$)'  # "INTRODUCTION"
+    r'|(?P<titlecase>[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*$)'  # "Introduction to Methods"
+    r'|(?P<chapter>Chapter\s+\d+)'  # "Chapter 1"
+    r'|(?P<section>Section\s+\d+)'  # "Section 1"
+)
+
+# Numbering and "Chapter N" / "Section N" prefixes stripped from heading titles
+_HEADING_PREFIX_RE = re.compile(
+    r'(?:(?P<number>\d+(?:\.\d+)*)\s+)?'
+    r'(?:(?i:chapter)\s+\d+:?\s*)?'
+    r'(?:(?i:section)\s+\d+:?\s*)?'
+)
+
+# Heading level by pattern, used when the title carries no dotted numbering
+_HEADING_LEVELS = {
+    'numbered': 1,
+    'subnumbered': 2,
+    'caps': 1,
+    'titlecase': 2,
+    'chapter': 1,
+    'section': 2
+}
+
+def classify_heading(line: str) -> Optional[Tuple[str, int]]:
+    """
+    Classify a line in one pass, returning (cleaned title, heading level) for headings and None otherwise
+    """
+    line = line.strip()
+    match = _HEADING_RE.match(line)
+    if not match:
+        return None
+    
+    prefix = _HEADING_PREFIX_RE.match(line)
+    number = prefix.group('number')
+    level = number.count('.') + 1 if number else _HEADING_LEVELS[match.lastgroup]
+    
+    return line[prefix.end():].strip(), level
+
+# Vocabulary added to the persona keywords for every role named in the persona
+ROLE_KEYWORDS = {
+    'researcher': ('research', 'study', 'analysis', 'methodology', 'findings', 'data', 'results'),
+    'student': ('learn', 'understand', 'concept', 'theory', 'example', 'explanation', 'basics'),
+    'analyst': ('trend', 'performance', 'metric', 'comparison', 'evaluation', 'assessment'),
+    'journalist': ('fact', 'news', 'report', 'event', 'timeline', 'source', 'evidence'),
+    'entrepreneur': ('opportunity', 'market', 'strategy', 'business', 'revenue', 'growth'),
+    'salesperson': ('customer', 'benefit', 'value', 'feature', 'advantage', 'solution')
+}
+
+# (trigger words, vocabulary) of persona domains; only the first domain named in the persona is used
+DOMAIN_KEYWORDS = (
+    (('biology',), ('protein', 'gene', 'molecular', 'biological', 'drug', 'compound')),
+    (('chemistry',), ('reaction', 'mechanism', 'chemical', 'molecular', 'synthesis')),
+    (('investment', 'financial'), ('revenue', 'profit', 'financial', 'investment', 'market', 'growth'))
+)
+
+# (trigger phrases, keywords) of common jobs, used instead of the job's own words for the first match
+JOB_KEYWORDS = (
+    (('literature review',), ('methodology', 'approach', 'result', 'finding', 'comparison', 'evaluation')),
+    (('financial', 'revenue'), ('revenue', 'profit', 'financial', 'growth', 'investment', 'performance')),
+    (('exam', 'study'), ('concept', 'mechanism', 'theory', 'principle', 'example', 'definition'))
+)
 
 class PersonaDrivenAnalyzer:
-    def __init__(self):
-        # Download required NLTK data
-        try:
-            nltk.data.find('tokenizers/punkt')
-        except LookupError:
-            nltk.download('punkt')
+    def __init__(self, workers: int = 1, cache_dir: Optional[str] = None,
+                 cache_max_bytes: int = 512 * 1024 * 1024, heading_detector: str = 'regex',
+                 full_ranking: bool = False, top_sections: int = 20, subsection_window: int = 3,
+                 subsection_step: Optional[int] = None, fast_start: bool = False,
+                 ranking_backend: str = 'tfidf', hash_features: int = 2 ** 20, collect_metrics: bool = False,
+                 page_range: Optional[Tuple[int, Optional[int]]] = None, page_budget: Optional[int] = None,
+                 time_budget: Optional[float] = None, skim_pages: Optional[int] = None, skim_deepen: int = 3,
+                 use_outline: bool = True, dedup_threshold: Optional[float] = 0.8,
+                 keyword_cache_size: int = 1024, output_sections: int = 15, subsection_results: int = 3,
+                 refined_text_chars: int = 500, output_format: str = 'json',
+                 rerank_candidates: Optional[int] = None):
+        if heading_detector not in HEADING_DETECTORS:
+            raise ValueError(f"Unknown heading detector: {heading_detector}")
+        if ranking_backend not in RANKING_BACKENDS:
+            raise ValueError(f"Unknown ranking backend: {ranking_backend}")
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format: {output_format}")
         
-        try:
-            nltk.data.find('corpora/stopwords')
-        except LookupError:
-            nltk.download('stopwords')
+        # NLTK data is never downloaded: installed data is used when present, otherwise the vendored
+        # stopwords and sentence splitter. Fast start skips looking for NLTK data altogether.
+        self.fast_start = fast_start
+        self.text_resources = TextResources(vendored_only=fast_start)
+        self._vectorizer = None
+        
+        # Persona and job keywords by normalized text, since the same queries recur in batch and server modes
+        self.keyword_cache_size = keyword_cache_size
+        self._keyword_cache = OrderedDict()
+        self._keyword_lock = threading.Lock()
+        
+        # Number of worker processes used for PDF extraction (0 = one per CPU)
+        self.workers = workers if workers > 0 else (os.cpu_count() or 1)
+        
+        # How section headings are recognised while extracting; documents with an outline (bookmarks)
+        # are split at its entries instead, unless use_outline is off
+        self.heading_detector = heading_detector
+        self.use_outline = use_outline
+        
+        # Pages of every document that are extracted (1-based, inclusive; None = to the end).
+        # The range changes the extracted sections, so it is part of the extractor version.
+        self.page_range = page_range
+        self.extractor_version = f"{EXTRACTOR_VERSION}-{heading_detector}"
+        if not use_outline:
+            self.extractor_version += "-no-outline"
+        if page_range:
+            self.extractor_version += f"-pages{page_range[0]}-{page_range[1] or ''}"
+        
+        # Optional persistent cache of extracted sections
+        self.cache = ExtractionCache(cache_dir, cache_max_bytes, self.extractor_version) if cache_dir else None
         
-        self.stemmer = PorterStemmer()
-        self.stop_words = set(stopwords.words('english'))
-        self.vectorizer = TfidfVectorizer(max_features=1000, stop_words='english')
+        # Rank every section instead of only the ones that reach the output
+        self.full_ranking = full_ranking
         
+        # Sections whose estimated word-shingle Jaccard similarity to an earlier section reaches this
+        # threshold are collapsed into it before indexing and ranking (None keeps every section)
+        self.dedup_threshold = dedup_threshold
+        
+        # Number of top sections ranked, and the sentence windows sub-sections are taken from
+        self.top_sections = top_sections
+        self.subsections = SubsectionEngine(subsection_window, subsection_step, max_results=subsection_results,
+                                            sentence_spans=self.text_resources.sentence_spans)
+        
+        # Sections listed in the output (out of at least as many ranked ones), the length refined texts are
+        # cut to, and how results are encoded; results are written to files a section at a time
+        self.output_sections = output_sections
+        self.refined_text_chars = refined_text_chars
+        self.output_format = output_format
+        
+        # Scoring behind the ranking; hashing has no vocabulary cap and streams sections in chunks,
+        # bm25 ranks by keyword postings without scanning every section
+        self.ranking_backend = ranking_backend
+        self.hash_features = hash_features
+        
+        # Two-stage ranking: a cheap prefilter over keyword and query-word hits keeps this many candidate
+        # sections, and only those are scored by TF-IDF/hashed-term similarity (None scores every section)
+        self.rerank_candidates = rerank_candidates
+        
+        # Optional per-stage timings, per-document extraction statistics and peak RSS, added to the output
+        self.metrics = PipelineMetrics() if collect_metrics else None
+        
+        # Latency bounds for direct queries: a page and time budget for all documents together, and a skim
+        # mode that extracts the first skim_pages pages of every document and then only the skim_deepen
+        # documents holding the best-ranked sections in full
+        self.page_budget = page_budget
+        self.time_budget = time_budget
+        self.skim_pages = skim_pages
+        self.skim_deepen = skim_deepen
+    
+    def __getstate__(self):
+        # Copies sent to worker processes start with an empty keyword cache
+        state = self.__dict__.copy()
+        state['_keyword_cache'] = OrderedDict()
+        del state['_keyword_lock']
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._keyword_lock = threading.Lock()
+    
+    @property
+    def stemmer(self):
+        return self.text_resources.stemmer
+    
+    @property
+    def stop_words(self):
+        return self.text_resources.stop_words
+    
+    @property
+    def vectorizer(self):
+        if self._vectorizer is None:
+            from sklearn.feature_extraction.text import TfidfVectorizer
+            self._vectorizer = TfidfVectorizer(max_features=1000, stop_words='english')
+        return self._vectorizer
+    
+    def _stage(self, name: str):
+        """
+        Context manager timing a pipeline stage when metrics are collected
+        """
+        return self.metrics.stage(name) if self.metrics else nullcontext()
+    
+    def warm_up(self):
+        """
+        Load the NLP resources and heavy libraries up front instead of on the first request
+        """
+        import pdfplumber  # noqa: F401
+        from corpus_index import CorpusIndex  # noqa: F401
+        
+        self._extract_persona_keywords("Researcher")
+        self.text_resources.sentence_spans("Warm up.")
+        return self.vectorizer
+    
     def process_documents(self, input_dir: str, persona: str, job_to_be_done: str, output_file: str):
         """
         Main processing function that analyzes documents based on persona and job requirements
         """
         # Read all PDFs from input directory
-        pdf_files = [f for f in os.listdir(input_dir) if f.endswith('.pdf')]
+        pdf_files = self.list_pdfs(input_dir)
         
         if not pdf_files:
             print("No PDF files found in input directory")
@@ -45,372 +255,1335 @@ class PersonaDrivenAnalyzer:
         print(f"Job to be done: {job_to_be_done}")
         
         # Extract content and sections from all documents
-        documents_data = []
-        all_sections = []
+        pdf_paths = [os.path.join(input_dir, pdf_file) for pdf_file in pdf_files]
+        documents_data = [{'filename': pdf_file} for pdf_file in pdf_files]
+        budget = self._extraction_budget()
+        index = None
+        deepened = None
+        if self.skim_pages:
+            all_sections, deepened = self._skim_corpus(pdf_paths, persona, job_to_be_done, budget)
+        elif self.ranking_backend != 'tfidf':
+            # Sections are indexed as they come out of extraction
+            all_sections, index = self.build_corpus(pdf_files, pdf_paths, budget)
+        else:
+            with self._stage('extraction'):
+                sections, near_duplicates = self._deduplicated(self._iter_corpus_sections(pdf_paths, budget))
+                all_sections = SectionStore.from_sections(sections)
+            self._record_duplicates(all_sections, near_duplicates)
+        
+        extraction = None
+        if budget is not None:
+            extraction = budget.to_dict()
+            if deepened is not None:
+                extraction['deepened_documents'] = deepened
+        self._write_analysis(output_file, documents_data, all_sections, persona, job_to_be_done, index,
+                             extra={'extraction': extraction} if extraction else None)
+    
+    def _extraction_budget(self) -> Optional[ExtractionBudget]:
+        """
+        Budget of one run, or None when extraction is not limited
+        """
+        if self.page_range is None and self.page_budget is None and self.time_budget is None and not self.skim_pages:
+            return None
+        return ExtractionBudget(self.page_budget, self.time_budget)
+    
+    def _skim_corpus(self, pdf_paths: List[str], persona: str, job_to_be_done: str,
+                     budget: ExtractionBudget) -> Tuple[SectionStore, List[str]]:
+        """
+        Extract the first skim_pages pages of every document, rank the sections found, then extract in
+        full only the partially read documents holding the best-ranked sections.
+        Returns the sections and the documents that were deepened.
+        """
+        with self._stage('extraction'):
+            documents_data = self._extract_documents(pdf_paths, budget, page_limit=self.skim_pages)
+        skimmed = SectionStore.from_sections(section for doc_data in documents_data for section in doc_data['sections'])
         
-        for pdf_file in pdf_files:
-            pdf_path = os.path.join(input_dir, pdf_file)
-            doc_data = self._extract_document_content(pdf_path)
-            documents_data.append(doc_data)
-            all_sections.extend(doc_data['sections'])
+        with self._stage('skim_ranking'):
+            ranked_sections = self._rank_sections(skimmed, self._extract_persona_keywords(persona),
+                                                  self._extract_job_keywords(job_to_be_done), job_to_be_done,
+                                                  top_k=self._ranked_count)
         
-        # Analyze relevance based on persona and job
-        persona_keywords = self._extract_persona_keywords(persona)
-        job_keywords = self._extract_job_keywords(job_to_be_done)
-        
-        # Rank sections by relevance
-        ranked_sections = self._rank_sections(all_sections, persona_keywords, job_keywords, job_to_be_done)
-        
-        # Extract sub-sections for top sections
-        enhanced_sections = []
-        for section in ranked_sections[:20]:  # Process top 20 sections
-            sub_sections = self._extract_subsections(section, persona_keywords, job_keywords)
-            enhanced_sections.append({
-                **section,
-                'sub_sections': sub_sections
-            })
-        
-        # Generate output
+        partial = {doc_data['filename']: i for i, doc_data in enumerate(documents_data) if doc_data.get('truncated')}
+        deepen = []
+        for section in ranked_sections:
+            i = partial.get(section['document'])
+            if i is not None and i not in deepen:
+                deepen.append(i)
+                if len(deepen) >= self.skim_deepen:
+                    break
+        
+        if deepen:
+            # Deepened documents are read again from their first page, which the skim already paid for
+            for i in deepen:
+                budget.release(documents_data[i]['stats']['pages'])
+            with self._stage('deepening'):
+                for i, doc_data in zip(deepen, self._extract_documents([pdf_paths[i] for i in deepen], budget)):
+                    documents_data[i] = doc_data
+        
+        deepened = [documents_data[i]['filename'] for i in deepen]
+        print(f"Skimmed {len(pdf_paths)} documents, deepened {len(deepened)}: {', '.join(deepened) or 'none'}")
+        
+        sections, near_duplicates = self._deduplicated(
+            section for doc_data in documents_data for section in doc_data['sections']
+        )
+        sections = SectionStore.from_sections(sections)
+        self._record_duplicates(sections, near_duplicates)
+        return sections, deepened
+    
+    def build_index(self, input_dir: str, index_dir: str):
+        """
+        Extract all documents once and persist an index of their sections for the ranking backend
+        """
+        pdf_files = self.list_pdfs(input_dir)
+        
+        if not pdf_files:
+            print("No PDF files found in input directory")
+            return
+        
+        print(f"Indexing {len(pdf_files)} documents into {index_dir}")
+        
+        pdf_paths = [os.path.join(input_dir, pdf_file) for pdf_file in pdf_files]
+        
+        all_sections, index = self.build_corpus(pdf_files, pdf_paths)
+        if index is None:
+            return
+        with self._stage('index_save'):
+            index.save(index_dir)
+        
+        term_count = len(index.vectorizer.vocabulary_) if self.ranking_backend == 'tfidf' else index.term_count
+        print(f"Index built: {len(all_sections)} sections, {term_count} {self.ranking_backend} terms")
+    
+    def update_index(self, input_dir: str, index_dir: str) -> Optional['CorpusIndex']:
+        """
+        Update a persisted index with the PDFs added to, modified in or removed from input_dir since the last update.
+        Only new and changed files are extracted; term statistics are adjusted instead of refitting the vectorizer.
+        """
+        if self.ranking_backend != 'tfidf':
+            print("Incremental updates are only supported by the tfidf ranking backend")
+            return None
+        
+        from incremental_index import IncrementalIndex
+        
+        pdf_files = self.list_pdfs(input_dir)
+        pdf_paths = [os.path.join(input_dir, pdf_file) for pdf_file in pdf_files]
+        
+        incremental = IncrementalIndex(index_dir, self.vectorizer, self.extractor_version, self.dedup_threshold)
+        try:
+            with self._stage('incremental_update'):
+                index, counts = incremental.update(pdf_paths, self._extract_documents)
+        except ValueError as e:
+            print(f"Could not update index: {e}")
+            return None
+        
+        self._record_duplicates(index.sections, incremental.near_duplicates)
+        print(f"Index updated: {counts['added']} added, {counts['modified']} modified, "
+              f"{counts['removed']} removed, {counts['unchanged']} unchanged; "
+              f"{len(index.sections)} sections, {len(index.vectorizer.vocabulary_)} terms")
+        return index
+    
+    def query_index(self, index_dir: str, persona: str, job_to_be_done: str, output_file: str):
+        """
+        Answer a persona/job query against a persisted index without re-extracting or refitting
+        """
+        from corpus_index import load_index
+        
+        with self._stage('index_load'):
+            index = load_index(index_dir)
+        
+        print(f"Querying index of {len(index.documents)} documents for persona: {persona}")
+        print(f"Job to be done: {job_to_be_done}")
+        
+        documents_data = [{'filename': filename} for filename in index.documents]
+        self._write_analysis(output_file, documents_data, index.sections, persona, job_to_be_done, index)
+    
+    def process_batch(self, queries_file: str, output_dir: str, input_dir: Optional[str] = None,
+                      index_dir: Optional[str] = None):
+        """
+        Answer many persona/job pairs against one document collection.
+        Extraction and vectorization are shared by the whole batch and all queries are scored
+        with a single sparse matrix product; one output file is written per query.
+        """
+        queries = self._load_queries(queries_file)
+        if not queries:
+            print("No queries found in batch file")
+            return
+        
+        from corpus_index import load_index
+        
+        if index_dir:
+            with self._stage('index_load'):
+                index = load_index(index_dir)
+            documents, all_sections = index.documents, index.sections
+        else:
+            documents = self.list_pdfs(input_dir)
+            if not documents:
+                print("No PDF files found in input directory")
+                return
+            
+            pdf_paths = [os.path.join(input_dir, pdf_file) for pdf_file in documents]
+            all_sections, index = self.build_corpus(documents, pdf_paths)
+        
+        print(f"Processing {len(queries)} queries against {len(documents)} documents")
+        
+        # Every query matches its keywords against the same sections
+        if len(queries) > 1:
+            with self._stage('keyword_matching'):
+                all_sections.build_keyword_matchers()
+        
+        # BM25 queries are answered from the postings of their own terms instead
+        similarity = None
+        if index is not None and not isinstance(index, BM25Index):
+            with self._stage('query_vectorization'):
+                query_texts = [
+                    self._query_text(
+                        self._extract_persona_keywords(query['persona']),
+                        self._extract_job_keywords(query['job_to_be_done']),
+                        query['job_to_be_done']
+                    )
+                    for query in queries
+                ]
+                similarity = index.similarity(query_texts)
+        
+        os.makedirs(output_dir, exist_ok=True)
+        documents_data = [{'filename': filename} for filename in documents]
+        
+        for i, query in enumerate(queries):
+            self._write_analysis(
+                os.path.join(output_dir, f"{query['id']}{OUTPUT_EXTENSIONS[self.output_format]}"),
+                documents_data, all_sections, query['persona'], query['job_to_be_done'], index,
+                similarity[i] if similarity is not None else None
+            )
+    
+    def build_collection(self, name: str, input_dir: str, collections_dir: str,
+                         shard_documents: int = DEFAULT_SHARD_DOCUMENTS):
+        """
+        Extract a document directory into a named collection of hashed-term shards, one shard of
+        shard_documents documents at a time, so only one shard is ever held in memory
+        """
+        from hashing_index import HashingIndex
+        
+        pdf_files = self.list_pdfs(input_dir)
+        if not pdf_files:
+            print("No PDF files found in input directory")
+            return
+        
+        collection = ShardedCollection.create(collections_dir, name, self.hash_features)
+        print(f"Indexing {len(pdf_files)} documents into collection '{name}' ({collection.collection_dir})")
+        
+        for start in range(0, len(pdf_files), shard_documents):
+            documents = pdf_files[start:start + shard_documents]
+            pdf_paths = [os.path.join(input_dir, pdf_file) for pdf_file in documents]
+            
+            # Near-duplicates are collapsed within a shard
+            with self._stage('extraction'):
+                sections, near_duplicates = self._deduplicated(self._iter_corpus_sections(pdf_paths))
+                index = HashingIndex.build(documents, sections, self.hash_features)
+            self._record_duplicates(index.sections, near_duplicates)
+            
+            with self._stage('index_save'):
+                collection.add_shard(index)
+            print(f"Shard {len(collection.shards)}: {len(documents)} documents, {len(index.sections)} sections")
+        
+        print(f"Collection '{name}' built: {len(collection.shards)} shards, {collection.section_count} sections")
+    
+    def query_collections(self, names: List[str], collections_dir: str, persona: str, job_to_be_done: str,
+                          output_file: str):
+        """
+        Answer a persona/job query from one or more named collections: every shard is ranked in parallel
+        with collection-wide IDF weights and the shards' top sections are merged.
+        Documents are prefixed with their collection name when several collections are queried.
+        """
+        names = list(dict.fromkeys(names))
+        try:
+            collections = [ShardedCollection.load(collections_dir, name) for name in names]
+            statistics = ShardedCollection.term_statistics(collections)
+        except ValueError as e:
+            print(f"Could not load collections: {e}")
+            return
+        
+        shards = [
+            (shard_dir, f"{collection.name}/" if len(collections) > 1 else '')
+            for collection in collections for shard_dir in collection.shard_dirs()
+        ]
+        print(f"Querying {len(shards)} shards of {', '.join(names)} for persona: {persona}")
+        print(f"Job to be done: {job_to_be_done}")
+        
+        with self._stage('keywords'):
+            persona_keywords = self._extract_persona_keywords(persona)
+            job_keywords = self._extract_job_keywords(job_to_be_done)
+        
+        ranked_sections = self._rank_shards(shards, statistics, persona_keywords, job_keywords, job_to_be_done)
+        if self.metrics:
+            self.metrics.count('sections', statistics[0])
+            self.metrics.count('shards', len(shards))
+            self.metrics.count('ranked_sections', len(ranked_sections))
+        
+        documents_data = [
+            {'filename': f"{collection.name}/{document}" if len(collections) > 1 else document}
+            for collection in collections for document in collection.documents
+        ]
+        entries = self._ranked_entries(ranked_sections, persona_keywords, job_keywords)
+        self._write_entries(output_file, documents_data, persona, job_to_be_done, entries)
+    
+    def _rank_shards(self, shards: List[Tuple[str, str]], statistics: Tuple[int, np.ndarray, np.ndarray],
+                     persona_keywords: List[str], job_keywords: List[str], job_to_be_done: str) -> List[Dict]:
+        """
+        Rank the sections of (shard directory, document prefix) shards, in worker processes when more than one
+        worker is configured, and merge their top sections into one ranking.
+        Shards hold consecutive documents, so merging their rankings in shard order keeps ties in collection order.
+        """
+        top_k = None if self.full_ranking else self._ranked_count
+        
+        with self._stage('shard_ranking'):
+            if self.workers <= 1 or len(shards) <= 1:
+                rankings = [
+                    self._rank_shard(shard_dir, statistics, persona_keywords, job_keywords, job_to_be_done, top_k)
+                    for shard_dir, _ in shards
+                ]
+            else:
+                rankings = []
+                with ProcessPoolExecutor(max_workers=min(self.workers, len(shards))) as executor:
+                    futures = [
+                        executor.submit(self._rank_shard, shard_dir, statistics, persona_keywords, job_keywords,
+                                        job_to_be_done, top_k)
+                        for shard_dir, _ in shards
+                    ]
+                    for (shard_dir, _), future in zip(shards, futures):
+                        try:
+                            rankings.append(future.result())
+                        except Exception as e:
+                            # A failed shard leaves its sections out instead of failing the query
+                            print(f"Error ranking shard {shard_dir}: {e}")
+                            rankings.append([])
+        
+        with self._stage('merge'):
+            for (_, prefix), ranking in zip(shards, rankings):
+                for section in ranking:
+                    section['document'] = prefix + section['document']
+                # The merge needs every shard's ranking in score order, which two-stage ranking only approximates
+                ranking.sort(key=lambda section: -section['relevance_score'])
+            
+            merged = heapq.merge(*rankings, key=lambda section: -section['relevance_score'])
+            ranked_sections = list(islice(merged, top_k))
+            for rank, section in enumerate(ranked_sections, start=1):
+                section['importance_rank'] = rank
+        
+        return ranked_sections
+    
+    def _rank_shard(self, shard_dir: str, statistics: Tuple[int, np.ndarray, np.ndarray],
+                    persona_keywords: List[str], job_keywords: List[str], job_to_be_done: str,
+                    top_k: Optional[int] = None) -> List[Dict]:
+        """
+        Rank the sections of one shard with IDF weights of the whole (multi-)collection.
+        The shard's memory-mapped keyword token data answers the keyword scores, so its texts
+        are neither decoded nor tokenized again for every query.
+        """
+        from hashing_index import HashingIndex
+        
+        index = HashingIndex.load(shard_dir)
+        index = index.with_idf(ShardedCollection.idf(*statistics, len(index.idf)))
+        # Materialized here: the merge edits the sections, and workers send them back
+        return list(self._rank_sections(index.sections, persona_keywords, job_keywords, job_to_be_done, index,
+                                        top_k=top_k))
+    
+    def build_corpus(self, documents: List[str], pdf_paths: List[str],
+                     budget: Optional[ExtractionBudget] = None) -> Tuple[SectionStore, Optional['CorpusIndex']]:
+        """
+        Extract a document collection and fit an in-memory index over it.
+        The index is None when the sections cannot be vectorized; queries then fall back to per-query ranking.
+        """
+        if self.ranking_backend != 'tfidf':
+            # Indexing consumes sections as they are extracted, so both are timed as one stage
+            with self._stage('extraction'):
+                sections, near_duplicates = self._deduplicated(self._iter_corpus_sections(pdf_paths, budget))
+                index = self._build_backend_index(documents, sections)
+            self._record_duplicates(index.sections, near_duplicates)
+            if not index.term_count:
+                print("Could not index sections: no terms found")
+                return index.sections, None
+            return index.sections, index
+        
+        from corpus_index import CorpusIndex
+        
+        with self._stage('extraction'):
+            sections, near_duplicates = self._deduplicated(self._iter_corpus_sections(pdf_paths, budget))
+            all_sections = SectionStore.from_sections(sections)
+        self._record_duplicates(all_sections, near_duplicates)
+        
+        try:
+            with self._stage('indexing'):
+                index = CorpusIndex.build(documents, all_sections, self.vectorizer)
+        except ValueError as e:
+            print(f"Could not vectorize sections: {e}")
+            index = None
+        
+        return all_sections, index
+    
+    def _build_backend_index(self, documents: List[str], sections: Union[SectionStore, Iterator[Dict]]):
+        """
+        Index sections (a store, or a stream consumed as it is extracted) with the hashing or bm25 backend
+        """
+        if self.ranking_backend == 'bm25':
+            return BM25Index.build(documents, sections, self.text_resources.stem, self.stop_words)
+        
+        from hashing_index import HashingIndex
+        return HashingIndex.build(documents, sections, self.hash_features)
+    
+    def _deduplicated(self, sections: Iterable[Dict]) -> Tuple[Iterable[Dict], Optional[NearDuplicateFilter]]:
+        """
+        Section stream without near-duplicates, and the filter recording the dropped copies
+        """
+        if self.dedup_threshold is None:
+            return sections, None
+        near_duplicates = NearDuplicateFilter(self.dedup_threshold)
+        return near_duplicates.filter(sections), near_duplicates
+    
+    def _record_duplicates(self, sections: SectionStore, near_duplicates: Optional[NearDuplicateFilter]):
+        """
+        Keep the provenance of the dropped near-duplicates with the sections they were collapsed into
+        """
+        if near_duplicates is None:
+            return
+        sections.duplicates = near_duplicates.copies
+        if near_duplicates.dropped:
+            print(f"Near-duplicate sections: {near_duplicates.dropped} collapsed into "
+                  f"{len(near_duplicates.copies)} kept sections")
+        if self.metrics:
+            self.metrics.count('near_duplicate_sections', near_duplicates.dropped)
+    
+    @staticmethod
+    def _load_queries(queries_file: str) -> List[Dict]:
+        """
+        Read persona/job pairs from a JSON list or a JSON Lines file.
+        Each entry needs 'persona' and 'job' (or 'job_to_be_done'); an optional 'id' names its output file.
+        A repeated id gets a numeric suffix so no query overwrites another one's output.
+        """
+        with open(queries_file, 'r', encoding='utf-8') as f:
+            text = f.read().strip()
+        
+        if text.startswith('['):
+            entries = json.loads(text)
+        else:
+            entries = [json.loads(line) for line in text.splitlines() if line.strip()]
+        
+        queries = []
+        used_ids = set()
+        for i, entry in enumerate(entries, start=1):
+            job = entry.get('job_to_be_done', entry.get('job'))
+            if not entry.get('persona') or not job:
+                print(f"Skipping query {i}: persona and job are required")
+                continue
+            
+            query_id = re.sub(r'[^\w.-]+', '_', str(entry.get('id') or f"query_{i:03d}"))
+            # Output files may land on a case-insensitive file system
+            unique_id, suffix = query_id, 2
+            while unique_id.lower() in used_ids:
+                unique_id, suffix = f"{query_id}_{suffix}", suffix + 1
+            if unique_id != query_id:
+                print(f"Query {i}: id {query_id} is already used, writing it as {unique_id}")
+            query_id = unique_id
+            used_ids.add(query_id.lower())
+            queries.append({'id': query_id, 'persona': entry['persona'], 'job_to_be_done': job})
+        
+        return queries
+    
+    @staticmethod
+    def list_pdfs(input_dir: str) -> List[str]:
+        """
+        PDF filenames of a directory in a deterministic order
+        """
+        return sorted(f for f in os.listdir(input_dir) if f.endswith('.pdf'))
+    
+    @property
+    def _ranked_count(self) -> int:
+        """
+        Number of best sections a ranking keeps, enough for the output
+        """
+        return max(self.top_sections, self.output_sections)
+    
+    def analyze_sections(self, documents_data: List[Dict], all_sections: SectionStore, persona: str,
+                          job_to_be_done: str, index: Optional['CorpusIndex'] = None,
+                          similarity_scores: Optional[np.ndarray] = None) -> Dict:
+        """
+        Rank extracted sections for a persona and job and build the output structure
+        """
         output = self._generate_output(
-            documents_data, 
-            enhanced_sections, 
-            persona, 
+            documents_data,
+            self._output_entries(all_sections, persona, job_to_be_done, index, similarity_scores),
+            persona,
             job_to_be_done
         )
         
-        # Save to file
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(output, f, indent=2, ensure_ascii=False)
+        if self.metrics:
+            output['metrics'] = self.metrics.to_dict()
+        
+        return output
+    
+    def _write_analysis(self, output_file: str, documents_data: List[Dict], all_sections: SectionStore,
+                        persona: str, job_to_be_done: str, index: Optional['CorpusIndex'] = None,
+                        similarity_scores: Optional[np.ndarray] = None, extra: Optional[Dict] = None):
+        """
+        Rank extracted sections for a persona and job and write the result as it is produced,
+        followed by the metrics and any extra top-level members
+        """
+        entries = self._output_entries(all_sections, persona, job_to_be_done, index, similarity_scores)
+        self._write_entries(output_file, documents_data, persona, job_to_be_done, entries, extra)
+    
+    def _write_entries(self, output_file: str, documents_data: List[Dict], persona: str, job_to_be_done: str,
+                       entries: Iterable[Tuple[Dict, List[Dict]]], extra: Optional[Dict] = None):
+        """
+        Write output entries as they are produced, followed by the metrics and any extra top-level members
+        """
+        with OutputWriter(output_file, self.output_format) as writer:
+            writer.begin(self._output_metadata(documents_data, persona, job_to_be_done))
+            for extracted_section, sub_sections in entries:
+                writer.add_section(extracted_section, sub_sections)
+            
+            trailing = {'metrics': self.metrics.to_dict()} if self.metrics else {}
+            trailing.update(extra or {})
+            writer.close(trailing)
         
         print(f"Analysis complete. Results saved to {output_file}")
     
-    def _extract_document_content(self, pdf_path: str) -> Dict:
+    def _output_entries(self, all_sections: SectionStore, persona: str, job_to_be_done: str,
+                        index: Optional['CorpusIndex'] = None,
+                        similarity_scores: Optional[np.ndarray] = None) -> Iterator[Tuple[Dict, List[Dict]]]:
+        """
+        (extracted section, sub-section entries) of the output sections in rank order.
+        Sub-sections are extracted a chunk of sections at a time as the entries are consumed.
+        """
+        # Analyze relevance based on persona and job
+        with self._stage('keywords'):
+            persona_keywords = self._extract_persona_keywords(persona)
+            job_keywords = self._extract_job_keywords(job_to_be_done)
+        
+        # Rank sections by relevance; only the top sections are used unless a full ranking is requested
+        top_k = None if self.full_ranking else self._ranked_count
+        with self._stage('ranking'):
+            ranked_sections = self._rank_sections(all_sections, persona_keywords, job_keywords, job_to_be_done,
+                                                  index, similarity_scores, top_k)
+        
+        if self.metrics:
+            self.metrics.count('sections', len(all_sections))
+            self.metrics.count('ranked_sections', len(ranked_sections))
+        
+        yield from self._ranked_entries(ranked_sections, persona_keywords, job_keywords)
+    
+    def _ranked_entries(self, ranked_sections: Sequence[Dict], persona_keywords: List[str],
+                        job_keywords: List[str]) -> Iterator[Tuple[Dict, List[Dict]]]:
+        """
+        (extracted section, sub-section entries) of the ranked sections that reach the output
+        """
+        # Extract sub-sections for the sections that reach the output
+        output_count = min(self.output_sections, len(ranked_sections))
+        for start in range(0, output_count, OUTPUT_CHUNK_SIZE):
+            chunk = ranked_sections[start:min(start + OUTPUT_CHUNK_SIZE, output_count)]
+            with self._stage('subsections'):
+                sub_sections = self.subsections.extract(chunk, persona_keywords, job_keywords)
+            for section, section_sub_sections in zip(chunk, sub_sections):
+                yield self._output_entry(section, section_sub_sections)
+    
+    def _extract_documents(self, pdf_paths: List[str], budget: Optional[ExtractionBudget] = None,
+                           page_limit: Optional[int] = None) -> List[Dict]:
+        """
+        Extract content from several PDFs, serving unchanged documents from the extraction cache.
+        Results are returned in the same order as pdf_paths; partially extracted documents are marked
+        'truncated' and never cached.
+        """
+        if not self.cache:
+            return self._extract_documents_uncached(pdf_paths, budget, page_limit)
+        
+        documents_data = [None] * len(pdf_paths)
+        cache_keys = {}
+        misses = []
+        
+        for i, pdf_path in enumerate(pdf_paths):
+            try:
+                cache_keys[i] = self.cache.key_for(pdf_path)
+            except OSError:
+                misses.append(i)
+                continue
+            
+            sections = self.cache.get(cache_keys[i], os.path.basename(pdf_path))
+            if sections is None:
+                misses.append(i)
+            else:
+                documents_data[i] = {
+                    'filename': os.path.basename(pdf_path),
+                    'sections': sections
+                }
+        
+        extracted = self._extract_documents_uncached([pdf_paths[i] for i in misses], budget, page_limit)
+        if self.metrics:
+            hits = [i for i in range(len(pdf_paths)) if documents_data[i] is not None]
+            for i in hits:
+                self.metrics.record_document(documents_data[i]['filename'], None,
+                                             len(documents_data[i]['sections']), 0.0, cached=True)
+        for i, doc_data in zip(misses, extracted):
+            documents_data[i] = doc_data
+            # Failed and partial extractions are retried on the next run instead of being cached
+            if i in cache_keys and 'error' not in doc_data and not doc_data.get('truncated'):
+                self.cache.put(cache_keys[i], doc_data['sections'])
+        
+        print(f"Extraction cache: {len(pdf_paths) - len(misses)} hits, {len(misses)} misses")
+        return documents_data
+    
+    def _extract_documents_uncached(self, pdf_paths: List[str], budget: Optional[ExtractionBudget] = None,
+                                    page_limit: Optional[int] = None) -> List[Dict]:
+        """
+        Extract content from several PDFs, using a process pool when more than one worker is configured
+        """
+        if self.workers <= 1 or len(pdf_paths) <= 1:
+            documents_data = [self._extract_document_content(pdf_path, budget, page_limit) for pdf_path in pdf_paths]
+            self._record_documents(documents_data, budget)
+            return documents_data
+        
+        # Workers cannot share a page budget, so pages are reserved up front in document order
+        if budget is not None and budget.pages_left is not None:
+            budgets = budget.allot([self._page_count(pdf_path, page_limit) for pdf_path in pdf_paths])
+        else:
+            budgets = [budget] * len(pdf_paths)
+        
+        documents_data = []
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(pdf_paths))) as executor:
+            futures = [
+                executor.submit(self._extract_document_content, pdf_path, document_budget, page_limit)
+                for pdf_path, document_budget in zip(pdf_paths, budgets)
+            ]
+            
+            for pdf_path, future in zip(pdf_paths, futures):
+                try:
+                    documents_data.append(future.result())
+                except Exception as e:
+                    # A failed or crashed worker must not abort the whole run
+                    print(f"Error processing {pdf_path}: {e}")
+                    documents_data.append({
+                        'filename': os.path.basename(pdf_path),
+                        'sections': [],
+                        'error': str(e)
+                    })
+        
+        self._record_documents(documents_data, budget)
+        return documents_data
+    
+    def _record_documents(self, documents_data: List[Dict], budget: Optional[ExtractionBudget] = None):
+        """
+        Add the extraction statistics of freshly extracted documents to the metrics and the budget
+        """
+        for doc_data in documents_data:
+            stats = doc_data.get('stats', {})
+            if budget is not None:
+                budget.record(doc_data['filename'], stats)
+            if self.metrics:
+                self.metrics.record_document(doc_data['filename'], stats.get('pages'), len(doc_data['sections']),
+                                             stats.get('seconds', 0.0))
+    
+    def _extract_document_content(self, pdf_path: str, budget: Optional[ExtractionBudget] = None,
+                                  page_limit: Optional[int] = None) -> Dict:
         """
         Extract structured content from a PDF document
         """
         sections = []
         filename = os.path.basename(pdf_path)
+        stats = {}
+        start = time.perf_counter()
         
         try:
-            with pdfplumber.open(pdf_path) as pdf:
-                current_section = None
-                current_text = []
-                
-                for page_num, page in enumerate(pdf.pages, start=1):
-                    text = page.extract_text()
-                    if not text:
-                        continue
-                    
-                    lines = text.split('\n')
-                    
-                    for line in lines:
-                        line = line.strip()
-                        if not line:
-                            continue
-                        
-                        # Check if line is a heading
-                        if self._is_heading(line):
-                            # Save previous section
-                            if current_section and current_text:
-                                sections.append({
-                                    'document': filename,
-                                    'page': current_section['page'],
-                                    'section_title': current_section['title'],
-                                    'content': ' '.join(current_text),
-                                    'importance_rank': 0  # Will be calculated later
-                                })
-                            
-                            # Start new section
-                            current_section = {
-                                'title': self._clean_heading(line),
-                                'page': page_num
-                            }
-                            current_text = []
-                        else:
-                            # Add to current section content
-                            if current_section:
-                                current_text.append(line)
-                
-                # Don't forget the last section
-                if current_section and current_text:
-                    sections.append({
-                        'document': filename,
-                        'page': current_section['page'],
-                        'section_title': current_section['title'],
-                        'content': ' '.join(current_text),
-                        'importance_rank': 0
-                    })
+            for section in self._iter_document_sections(pdf_path, stats, budget, page_limit):
+                sections.append(section)
         
         except Exception as e:
             print(f"Error processing {pdf_path}: {e}")
+            stats['seconds'] = time.perf_counter() - start
+            return {
+                'filename': filename,
+                'sections': sections,
+                'error': str(e),
+                'stats': stats
+            }
         
-        return {
+        stats['seconds'] = time.perf_counter() - start
+        doc_data = {
             'filename': filename,
-            'sections': sections
+            'sections': sections,
+            'stats': stats
         }
+        if stats.get('truncated'):
+            doc_data['truncated'] = True
+        return doc_data
     
-    def _is_heading(self, line: str) -> bool:
+    def _iter_corpus_sections(self, pdf_paths: List[str], budget: Optional[ExtractionBudget] = None) -> Iterator[Dict]:
         """
-        Determine if a line is likely a heading
+        Yield the sections of all documents in order.
+        Serial, uncached runs stream sections page by page; pooled or cached runs yield per document.
         """
-        line = line.strip()
+        if self.cache or self.workers > 1:
+            for doc_data in self._extract_documents(pdf_paths, budget):
+                yield from doc_data['sections']
+            return
         
-        # Pattern-based heading detection
-        heading_patterns = [
-            r'^\d+\.\s+[A-Z]',  # "1. Introduction"
-            r'^\d+\.\d+\s+[A-Z]',  # "1.1 Overview"
-            r'^[A-Z][A-Z\s]+$',  # "INTRODUCTION"
-            r'^[A-Z][a-z]+(\s+[A-Z][a-z]+)*$',  # "Introduction to Methods"
-            r'^Chapter\s+\d+',  # "Chapter 1"
-            r'^Section\s+\d+',  # "Section 1"
-        ]
+        for pdf_path in pdf_paths:
+            stats = {}
+            sections = 0
+            # Only time spent inside the extractor counts, not the consumer's work between sections
+            elapsed = 0.0
+            start = time.perf_counter()
+            try:
+                for section in self._iter_document_sections(pdf_path, stats, budget):
+                    elapsed += time.perf_counter() - start
+                    sections += 1
+                    yield section
+                    start = time.perf_counter()
+            except Exception as e:
+                print(f"Error processing {pdf_path}: {e}")
+            elapsed += time.perf_counter() - start
+            
+            if budget is not None:
+                budget.record(os.path.basename(pdf_path), stats)
+            if self.metrics:
+                self.metrics.record_document(os.path.basename(pdf_path), stats.get('pages'), sections, elapsed)
+    
+    def _iter_document_sections(self, pdf_path: str, stats: Optional[Dict] = None,
+                                budget: Optional[ExtractionBudget] = None,
+                                page_limit: Optional[int] = None) -> Iterator[Dict]:
+        """
+        Yield sections of a PDF as its pages are parsed, releasing each page's cached layout afterwards.
+        Sections follow the document's outline when it has one, otherwise the heading detector.
+        Only the configured page range is read, at most page_limit pages of it, and no more than the budget allows.
+        The number of pages read, the document's page count and whether it was cut short are stored in stats.
+        """
+        import pdfplumber
+        
+        filename = os.path.basename(pdf_path)
+        stats = stats if stats is not None else {}
+        stats['pages'] = 0
+        stats['truncated'] = False
+        
+        if budget is not None and budget.exhausted:
+            # Not even opened, so the page count stays unknown
+            stats['total_pages'] = None
+            stats['truncated'] = True
+            return
+        
+        layout_detector = LayoutHeadingDetector() if self.heading_detector == 'layout' else None
+        
+        with pdfplumber.open(pdf_path) as pdf:
+            stats['total_pages'] = len(pdf.pages)
+            selected, outline = self._pages_to_read(pdf)
+            pages = selected[:page_limit] if page_limit is not None else selected
+            if budget is not None:
+                pages = pages[:budget.reserve(len(pages))]
+            stats['truncated'] = len(pages) < len(selected)
+            current_section = None
+            current_text = []
+            
+            for page in pages:
+                if budget is not None and budget.expired():
+                    stats['truncated'] = True
+                    break
+                stats['pages'] += 1
+                page_num = page.page_number
+                try:
+                    lines = self._page_lines(page, layout_detector, outline)
+                finally:
+                    self._release_page(page)
+                
+                for line, heading in lines:
+                    # Check if line is a heading
+                    if heading:
+                        # Emit previous section
+                        if current_section and current_text:
+                            yield {
+                                'document': filename,
+                                'page': current_section['page'],
+                                'section_title': current_section['title'],
+                                'heading_level': current_section['level'],
+                                'content': ' '.join(current_text),
+                                'importance_rank': 0  # Will be calculated later
+                            }
+                        
+                        # Start new section
+                        current_section = {
+                            'title': heading[0],
+                            'level': heading[1],
+                            'page': page_num
+                        }
+                        current_text = []
+                    else:
+                        # Add to current section content
+                        if current_section:
+                            current_text.append(line)
+            
+            # Don't forget the last section
+            if current_section and current_text:
+                yield {
+                    'document': filename,
+                    'page': current_section['page'],
+                    'section_title': current_section['title'],
+                    'heading_level': current_section['level'],
+                    'content': ' '.join(current_text),
+                    'importance_rank': 0
+                }
+    
+    def _select_pages(self, pages: List) -> List:
+        """
+        Pages of a document within the configured page range
+        """
+        if not self.page_range:
+            return pages
+        first, last = self.page_range
+        return pages[first - 1:last]
+    
+    def _pages_to_read(self, pdf) -> Tuple[List, Optional[DocumentOutline]]:
+        """
+        Pages of an open document that extraction reads when nothing limits it, and the document's
+        outline when sections follow it
+        """
+        outline = DocumentOutline.from_pdf(pdf) if self.use_outline else None
+        pages = self._select_pages(pdf.pages)
+        if outline:
+            # Text before the first bookmark belongs to no section, so those pages are never read
+            pages = [page for page in pages if page.page_number - 1 >= outline.first_page_index]
+        return pages, outline
+    
+    def _page_count(self, pdf_path: str, page_limit: Optional[int] = None) -> int:
+        """
+        Number of pages that would be extracted from a PDF without a budget, 0 if it cannot be opened
+        """
+        import pdfplumber
         
-        return any(re.match(pattern, line) for pattern in heading_patterns)
+        try:
+            with pdfplumber.open(pdf_path) as pdf:
+                pages = len(self._pages_to_read(pdf)[0])
+        except Exception:
+            return 0
+        return min(pages, page_limit) if page_limit is not None else pages
+    
+    def _page_lines(self, page, layout_detector: Optional[LayoutHeadingDetector] = None,
+                    outline: Optional[DocumentOutline] = None) -> List[Tuple[str, Optional[Tuple[str, int]]]]:
+        """
+        Split a page into non-empty lines, each paired with (title, level) if it is a heading
+        """
+        if outline:
+            return outline.page_lines(page, self._clean_heading)
+        
+        if layout_detector:
+            return [
+                (text, (self._clean_heading(text), level) if level else None)
+                for text, level in layout_detector.page_lines(page.chars, page.height)
+            ]
+        
+        text = page.extract_text()
+        if not text:
+            return []
+        
+        lines = (line.strip() for line in text.split('\n'))
+        return [(line, classify_heading(line)) for line in lines if line]
+    
+    @staticmethod
+    def _release_page(page):
+        """
+        Drop the parsed layout objects pdfplumber caches on a page
+        """
+        if hasattr(page, 'close'):
+            page.close()
+            return
+        
+        page.flush_cache()
+        # The memoized text map also holds on to every character object of the page
+        get_textmap = getattr(page, 'get_textmap', None)
+        if hasattr(get_textmap, 'cache_clear'):
+            get_textmap.cache_clear()
+    
+    def _is_heading(self, line: str) -> bool:
+        """
+        Determine if a line is likely a heading
+        """
+        return _HEADING_RE.match(line.strip()) is not None
     
     def _clean_heading(self, heading: str) -> str:
         """
         Clean heading text
         """
-        # Remove numbering
-        heading = re.sub(r'^\d+(\.\d+)*\s+', '', heading)
-        heading = re.sub(r'^Chapter\s+\d+:?\s*', '', heading, flags=re.IGNORECASE)
-        heading = re.sub(r'^Section\s+\d+:?\s*', '', heading, flags=re.IGNORECASE)
+        # Remove numbering and chapter/section prefixes
+        prefix = _HEADING_PREFIX_RE.match(heading)
         
-        return heading.strip()
+        return heading[prefix.end():].strip()
     
     def _extract_persona_keywords(self, persona: str) -> List[str]:
         """
         Extract relevant keywords from persona description
         """
-        # Role-based keyword mapping
-        role_keywords = {
-            'researcher': ['research', 'study', 'analysis', 'methodology', 'findings', 'data', 'results'],
-            'student': ['learn', 'understand', 'concept', 'theory', 'example', 'explanation', 'basics'],
-            'analyst': ['trend', 'performance', 'metric', 'comparison', 'evaluation', 'assessment'],
-            'journalist': ['fact', 'news', 'report', 'event', 'timeline', 'source', 'evidence'],
-            'entrepreneur': ['opportunity', 'market', 'strategy', 'business', 'revenue', 'growth'],
-            'salesperson': ['customer', 'benefit', 'value', 'feature', 'advantage', 'solution']
-        }
+        return self._cached_keywords('persona', persona, self._persona_keywords)
+    
+    def _extract_job_keywords(self, job_description: str) -> List[str]:
+        """
+        Extract keywords from job-to-be-done description
+        """
+        return self._cached_keywords('job', job_description, self._job_keywords)
+    
+    def _cached_keywords(self, kind: str, text: str, extract) -> List[str]:
+        """
+        Keywords of a persona or job, memoized by its lowercased, whitespace-collapsed text
+        """
+        key = (kind, ' '.join(text.lower().split()))
+        with self._keyword_lock:
+            keywords = self._keyword_cache.get(key)
+            if keywords is not None:
+                self._keyword_cache.move_to_end(key)
+                return list(keywords)
+        
+        keywords = tuple(extract(key[1]))
+        
+        with self._keyword_lock:
+            self._keyword_cache[key] = keywords
+            if len(self._keyword_cache) > self.keyword_cache_size:
+                self._keyword_cache.popitem(last=False)
         
+        # Callers get their own list, so they cannot change the cached keywords
+        return list(keywords)
+    
+    def _persona_keywords(self, persona_lower: str) -> List[str]:
+        """
+        Role and domain vocabulary named in a normalized persona, and the stems of its own words
+        """
         keywords = []
-        persona_lower = persona.lower()
         
         # Extract keywords based on role
-        for role, role_keywords_list in role_keywords.items():
+        for role, role_keywords in ROLE_KEYWORDS.items():
             if role in persona_lower:
-                keywords.extend(role_keywords_list)
+                keywords.extend(role_keywords)
         
         # Add domain-specific keywords
-        if 'biology' in persona_lower or 'computational biology' in persona_lower:
-            keywords.extend(['protein', 'gene', 'molecular', 'biological', 'drug', 'compound'])
-        elif 'chemistry' in persona_lower:
-            keywords.extend(['reaction', 'mechanism', 'chemical', 'molecular', 'synthesis'])
-        elif 'investment' in persona_lower or 'financial' in persona_lower:
-            keywords.extend(['revenue', 'profit', 'financial', 'investment', 'market', 'growth'])
+        for triggers, domain_keywords in DOMAIN_KEYWORDS:
+            if any(trigger in persona_lower for trigger in triggers):
+                keywords.extend(domain_keywords)
+                break
         
         # Extract keywords from persona text itself
-        words = word_tokenize(persona.lower())
-        keywords.extend([self.stemmer.stem(word) for word in words if word not in self.stop_words and len(word) > 3])
+        keywords.extend(self._stemmed_words(persona_lower))
         
         return list(set(keywords))
     
-    def _extract_job_keywords(self, job_description: str) -> List[str]:
+    def _job_keywords(self, job_lower: str) -> List[str]:
         """
-        Extract keywords from job-to-be-done description
+        Keywords of a common job kind named in a normalized job description, otherwise the stems of its words
         """
-        # Extract key action words and concepts
-        job_lower = job_description.lower()
-        
         # Action-based keywords
-        if 'literature review' in job_lower:
-            return ['methodology', 'approach', 'result', 'finding', 'comparison', 'evaluation']
-        elif 'financial' in job_lower or 'revenue' in job_lower:
-            return ['revenue', 'profit', 'financial', 'growth', 'investment', 'performance']
-        elif 'exam' in job_lower or 'study' in job_lower:
-            return ['concept', 'mechanism', 'theory', 'principle', 'example', 'definition']
+        for triggers, job_keywords in JOB_KEYWORDS:
+            if any(trigger in job_lower for trigger in triggers):
+                return list(job_keywords)
         
         # Extract keywords from job description
-        words = word_tokenize(job_lower)
-        keywords = [self.stemmer.stem(word) for word in words if word not in self.stop_words and len(word) > 3]
-        
-        return keywords
+        return self._stemmed_words(job_lower)
     
-    def _rank_sections(self, sections: List[Dict], persona_keywords: List[str], 
-                      job_keywords: List[str], job_description: str) -> List[Dict]:
+    def _stemmed_words(self, text: str) -> List[str]:
         """
-        Rank sections based on relevance to persona and job requirements
+        Stems of the words of a text that are not stopwords and longer than three characters
         """
-        if not sections:
-            return []
+        words = self.text_resources.word_tokenize(text)
+        return [self.text_resources.stem(word) for word in words if word not in self.stop_words and len(word) > 3]
+    
+    def _rank_sections(self, sections: Union[SectionStore, List[Dict]], persona_keywords: List[str], 
+                      job_keywords: List[str], job_description: str,
+                      index: Optional['CorpusIndex'] = None,
+                      similarity_scores: Optional[np.ndarray] = None,
+                      top_k: Optional[int] = None) -> Sequence[Dict]:
+        """
+        Rank sections based on relevance to persona and job requirements.
+        With a prebuilt index the sections are not re-vectorized; only the query is transformed.
+        Precomputed similarity scores (e.g. from a batch) skip vectorization entirely.
+        With top_k only the k best sections are ranked and returned.
+        The ranked sections are returned as dicts; the store itself is never modified.
+        """
+        if not isinstance(sections, SectionStore):
+            sections = SectionStore.from_sections(sections)
         
-        # Prepare texts for TF-IDF
-        section_texts = [f"{section['section_title']} {section['content']}" for section in sections]
+        if not len(sections):
+            return []
         
-        # Create TF-IDF matrix
-        try:
-            tfidf_matrix = self.vectorizer.fit_transform(section_texts)
-        except:
-            # Fallback to simple keyword matching if TF-IDF fails
-            return self._rank_sections_simple(sections, persona_keywords, job_keywords)
+        if isinstance(index, BM25Index) or (index is None and self.ranking_backend == 'bm25'):
+            return self._rank_sections_bm25(sections, persona_keywords, job_keywords, index, top_k)
         
         # Create query vector from persona and job keywords
-        query_text = ' '.join(persona_keywords + job_keywords + [job_description])
-        query_vector = self.vectorizer.transform([query_text])
+        query_text = self._query_text(persona_keywords, job_keywords, job_description)
         
-        # Calculate similarity scores
-        similarity_scores = cosine_similarity(query_vector, tfidf_matrix).flatten()
+        if similarity_scores is None and index is None and self.ranking_backend == 'hashing':
+            # Hashed section vectors do not depend on the query, so they are kept with the store
+            index = self._backend_index(sections)
+            if not index.term_count:
+                return self._rank_sections_simple(sections, persona_keywords, job_keywords, top_k)
         
-        # Add additional scoring based on keyword matches
-        for i, section in enumerate(sections):
-            text = f"{section['section_title']} {section['content']}".lower()
-            
-            # Keyword match bonus
-            persona_matches = sum(1 for keyword in persona_keywords if keyword in text)
-            job_matches = sum(1 for keyword in job_keywords if keyword in text)
-            
-            # Title match bonus (headings are important)
-            title_matches = sum(1 for keyword in persona_keywords + job_keywords 
-                              if keyword in section['section_title'].lower())
+        if (similarity_scores is None and self.rerank_candidates is not None
+                and len(sections) > self.rerank_candidates):
+            return self._rank_sections_two_stage(sections, persona_keywords, job_keywords, query_text, index, top_k)
+        
+        if similarity_scores is None and index is not None:
+            similarity_scores = index.similarity([query_text])[0]
+        elif similarity_scores is None:
+            # Create TF-IDF matrix
+            try:
+                tfidf_matrix = self.vectorizer.fit_transform(sections.texts())
+            except:
+                # Fallback to simple keyword matching if TF-IDF fails
+                return self._rank_sections_simple(sections, persona_keywords, job_keywords, top_k)
             
-            # Combine scores
-            keyword_score = (persona_matches * 0.3 + job_matches * 0.4 + title_matches * 0.5) / 10
-            final_score = similarity_scores[i] + keyword_score
+            query_vector = self.vectorizer.transform([query_text])
             
-            sections[i]['relevance_score'] = final_score
+            # Calculate similarity scores
+            from sklearn.metrics.pairwise import cosine_similarity
+            similarity_scores = cosine_similarity(query_vector, tfidf_matrix).flatten()
         
-        # Sort by relevance score
-        ranked_sections = sorted(sections, key=lambda x: x['relevance_score'], reverse=True)
+        # Add additional scoring based on keyword matches
+        keyword_scores = self._keyword_scores(sections, persona_keywords, job_keywords)
         
-        # Assign importance ranks
-        for i, section in enumerate(ranked_sections):
-            section['importance_rank'] = i + 1
+        # Combine scores
+        final_scores = similarity_scores + keyword_scores
         
-        return ranked_sections
+        return self._assign_ranks(sections, final_scores, top_k)
     
-    def _rank_sections_simple(self, sections: List[Dict], persona_keywords: List[str], 
-                             job_keywords: List[str]) -> List[Dict]:
+    def _rank_sections_two_stage(self, sections: SectionStore, persona_keywords: List[str],
+                                 job_keywords: List[str], query_text: str, index: Optional['CorpusIndex'] = None,
+                                 top_k: Optional[int] = None) -> Sequence[Dict]:
         """
-        Simple keyword-based ranking fallback
+        Retrieve rerank_candidates sections with the prefilter, then score only those with the full scorer
+        (similarity plus keyword scores). Candidates are ranked ahead of the other sections, which follow
+        in prefilter order; their keyword scores are capped at the last candidate's score so reported
+        scores never increase down the ranking.
+        With an index, candidates get exactly the scores of single-stage ranking. Without one, TF-IDF is
+        fitted on the candidate texts only, so IDF weights (and the max_features vocabulary cut) come from
+        the candidates rather than the whole corpus: scores are an approximation of single-stage scores,
+        and the order among candidates can differ from it.
         """
-        for section in sections:
-            text = f"{section['section_title']} {section['content']}".lower()
-            
-            persona_matches = sum(1 for keyword in persona_keywords if keyword in text)
-            job_matches = sum(1 for keyword in job_keywords if keyword in text)
-            title_matches = sum(1 for keyword in persona_keywords + job_keywords 
-                              if keyword in section['section_title'].lower())
+        with self._stage('prefilter'):
+            candidates, keyword_scores, prefilter_scores = self._prefilter(
+                sections, persona_keywords, job_keywords, query_text, index
+            )
+        
+        with self._stage('rerank'):
+            if index is not None:
+                similarity_scores = index.similarity([query_text], rows=candidates)[0]
+            else:
+                try:
+                    tfidf_matrix = self.vectorizer.fit_transform([sections.text(i) for i in candidates.tolist()])
+                    query_vector = self.vectorizer.transform([query_text])
+                    from sklearn.metrics.pairwise import cosine_similarity
+                    similarity_scores = cosine_similarity(query_vector, tfidf_matrix).flatten()
+                except ValueError:
+                    # No vocabulary among the candidates (e.g. only stop words): keyword scores alone
+                    similarity_scores = np.zeros(len(candidates))
             
-            section['relevance_score'] = persona_matches * 0.3 + job_matches * 0.4 + title_matches * 0.5
+            scores = similarity_scores + keyword_scores[candidates]
+            ranking = np.lexsort((candidates, -scores))
+            order, scores = candidates[ranking], scores[ranking]
         
-        ranked_sections = sorted(sections, key=lambda x: x['relevance_score'], reverse=True)
+        if self.metrics:
+            self.metrics.count('rerank_candidates', len(candidates))
         
-        for i, section in enumerate(ranked_sections):
-            section['importance_rank'] = i + 1
+        # Places left after the candidates are filled with the best of the other sections
+        remaining = len(sections) if top_k is None else max(top_k - len(candidates), 0)
+        rest = np.setdiff1d(np.arange(len(sections)), candidates)
+        rest = rest[np.lexsort((rest, -prefilter_scores[rest]))][:remaining]
         
-        return ranked_sections
+        order = np.concatenate([order, rest])[:top_k]
+        scores = np.minimum.accumulate(np.concatenate([scores, keyword_scores[rest]])[:top_k])
+        return self._materialize_ranks(sections, order, scores)
     
-    def _extract_subsections(self, section: Dict, persona_keywords: List[str], 
-                            job_keywords: List[str]) -> List[Dict]:
+    def _prefilter(self, sections: SectionStore, persona_keywords: List[str], job_keywords: List[str],
+                   query_text: str, index: Optional['CorpusIndex'] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
         """
-        Extract and rank sub-sections from a main section
+        First ranking stage: score every section by its keyword scores plus the number of the query's own
+        words it contains, both answered from the store's keyword matchers when it has them.
+        A section containing none of the query's words has no similarity to it, so only the sections
+        holding the most of them are worth scoring fully.
+        Returns the candidate indices (in section order), the keyword scores and the prefilter scores.
         """
-        content = section['content']
-        sentences = sent_tokenize(content)
+        keyword_scores = self._keyword_scores(sections, persona_keywords, job_keywords)
         
-        if len(sentences) < 3:
-            return []
+        # Query words as the similarity scorer tokenizes them
+        vectorizer = index.vectorizer if index is not None else self.vectorizer
+        query_words = sorted(set(vectorizer.build_analyzer()(query_text)))
+        if not query_words:
+            word_hits = 0
+        elif sections.keyword_matchers is not None:
+            word_hits = sections.keyword_matchers[0].presence(query_words).sum(axis=1)
+        else:
+            word_hits = keyword_presence(sections.texts(), query_words).sum(axis=1)
         
-        # Group sentences into paragraphs/subsections
-        subsections = []
-        current_subsection = []
+        prefilter_scores = keyword_scores + word_hits
         
-        for sentence in sentences:
-            current_subsection.append(sentence)
-            
-            # Create subsection every 3-5 sentences or when we hit a logical break
-            if len(current_subsection) >= 3:
-                subsection_text = ' '.join(current_subsection)
-                
-                # Calculate relevance score
-                text_lower = subsection_text.lower()
-                persona_matches = sum(1 for keyword in persona_keywords if keyword in text_lower)
-                job_matches = sum(1 for keyword in job_keywords if keyword in text_lower)
-                relevance_score = persona_matches * 0.4 + job_matches * 0.6
-                
-                if relevance_score > 0:  # Only include relevant subsections
-                    subsections.append({
-                        'document': section['document'],
-                        'refined_text': subsection_text,
-                        'page_number': section['page'],
-                        'relevance_score': relevance_score
-                    })
-                
-                current_subsection = []
-        
-        # Handle remaining sentences
-        if current_subsection:
-            subsection_text = ' '.join(current_subsection)
-            text_lower = subsection_text.lower()
-            persona_matches = sum(1 for keyword in persona_keywords if keyword in text_lower)
-            job_matches = sum(1 for keyword in job_keywords if keyword in text_lower)
-            relevance_score = persona_matches * 0.4 + job_matches * 0.6
-            
-            if relevance_score > 0:
-                subsections.append({
-                    'document': section['document'],
-                    'refined_text': subsection_text,
-                    'page_number': section['page'],
-                    'relevance_score': relevance_score
-                })
-        
-        # Sort by relevance and return top 3
-        return sorted(subsections, key=lambda x: x['relevance_score'], reverse=True)[:3]
-    
-    def _generate_output(self, documents_data: List[Dict], enhanced_sections: List[Dict], 
+        # Ties at the cut-off keep the earlier sections
+        candidates = np.argsort(-prefilter_scores, kind='stable')[:self.rerank_candidates]
+        return np.sort(candidates), keyword_scores, prefilter_scores
+    
+    def _rank_sections_bm25(self, sections: SectionStore, persona_keywords: List[str], job_keywords: List[str],
+                            index: Optional[BM25Index] = None, top_k: Optional[int] = None) -> Sequence[Dict]:
+        """
+        Rank sections by the BM25 score of the persona and job keywords.
+        With top_k only the postings of the query terms are visited; sections without any
+        query term fill the remaining places in their original order.
+        """
+        if index is None:
+            index = self._backend_index(sections)
+        
+        query = index.query_terms(persona_keywords + job_keywords, self.text_resources.stem)
+        if top_k is None or top_k >= len(sections):
+            return self._assign_ranks(sections, index.scores(query), top_k)
+        
+        best, scores = index.top_k(query, top_k)
+        order, scores = best.tolist(), scores.tolist()
+        if len(order) < top_k:
+            ranked = set(order)
+            unranked = (i for i in range(len(sections)) if i not in ranked)
+            for i in unranked:
+                order.append(i)
+                scores.append(0.0)
+                if len(order) == top_k:
+                    break
+        
+        return self._materialize_ranks(sections, order, scores)
+    
+    def _backend_index(self, sections: SectionStore):
+        """
+        Hashing or bm25 index of a store, kept with the store since it does not depend on the query
+        """
+        key = f'{self.ranking_backend}_index'
+        index = sections.derived.get(key)
+        if index is None:
+            index = sections.derived[key] = self._build_backend_index([], sections)
+        return index
+    
+    @staticmethod
+    def _assign_ranks(sections: SectionStore, scores: np.ndarray, top_k: Optional[int] = None) -> Sequence[Dict]:
+        """
+        Order sections by descending score, keeping the original order among equal scores,
+        and return the (top k) sections with their relevance_score/importance_rank, materialized on access
+        """
+        scores = np.asarray(scores, dtype=float)
+        
+        if top_k is not None and 0 < top_k < len(scores):
+            # Select the k best without sorting everything; ties at the cut-off are all kept as candidates
+            best = np.argpartition(-scores, top_k - 1)[:top_k]
+            candidates = np.flatnonzero(scores >= scores[best].min())
+        else:
+            candidates = np.arange(len(scores))
+        
+        order = candidates[np.lexsort((candidates, -scores[candidates]))][:top_k]
+        
+        return PersonaDrivenAnalyzer._materialize_ranks(sections, order, scores[order])
+    
+    @staticmethod
+    def _materialize_ranks(sections: SectionStore, order: Sequence[int], scores: Sequence[float]) -> Sequence[Dict]:
+        """
+        Section dicts in ranked order with their relevance_score and importance_rank, materialized
+        as they are read so the output only builds the chunk it is writing
+        """
+        return sections.ranked(order, scores)
+    
+    def _keyword_matches(self, sections: SectionStore, persona_keywords: List[str],
+                         job_keywords: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Per-section counts of persona keywords and job keywords found in the section text,
+        and of all keywords found in the section title (headings are important)
+        """
+        # Building the matchers costs more than one direct scan, so a store only has them
+        # when it is queried repeatedly (batch, server)
+        if sections.keyword_matchers is not None:
+            text_matcher, title_matcher = sections.keyword_matchers
+            text_matches = text_matcher.counts([persona_keywords, job_keywords])
+            title_matches = title_matcher.counts([persona_keywords + job_keywords])
+        else:
+            text_matches = keyword_match_counts(sections.texts(), [persona_keywords, job_keywords])
+            title_matches = keyword_match_counts(sections.titles(), [persona_keywords + job_keywords])
+        
+        return text_matches[:, 0], text_matches[:, 1], title_matches[:, 0]
+    
+    def _keyword_scores(self, sections: SectionStore, persona_keywords: List[str],
+                        job_keywords: List[str]) -> np.ndarray:
+        """
+        Keyword part of the section scores, added to the similarity scores
+        """
+        persona_matches, job_matches, title_matches = self._keyword_matches(sections, persona_keywords, job_keywords)
+        return (persona_matches * 0.3 + job_matches * 0.4 + title_matches * 0.5) / 10
+    
+    @staticmethod
+    def _query_text(persona_keywords: List[str], job_keywords: List[str], job_description: str) -> str:
+        """
+        Text vectorized as the query for a persona/job pair
+        """
+        return ' '.join(persona_keywords + job_keywords + [job_description])
+    
+    def _rank_sections_simple(self, sections: Union[SectionStore, List[Dict]], persona_keywords: List[str], 
+                             job_keywords: List[str], top_k: Optional[int] = None) -> Sequence[Dict]:
+        """
+        Simple keyword-based ranking fallback
+        """
+        if not isinstance(sections, SectionStore):
+            sections = SectionStore.from_sections(sections)
+        
+        persona_matches, job_matches, title_matches = self._keyword_matches(sections, persona_keywords, job_keywords)
+        scores = persona_matches * 0.3 + job_matches * 0.4 + title_matches * 0.5
+        
+        return self._assign_ranks(sections, scores, top_k)
+    
+    def _extract_subsections(self, section: Dict, persona_keywords: List[str], 
+                            job_keywords: List[str]) -> List[Dict]:
+        """
+        Extract and rank sub-sections from a main section
+        """
+        return self.subsections.extract([section], persona_keywords, job_keywords)[0]
+    
+    def _generate_output(self, documents_data: List[Dict], entries: Iterable[Tuple[Dict, List[Dict]]],
                         persona: str, job_to_be_done: str) -> Dict:
         """
         Generate the final output in required format
         """
-        # Prepare document list
-        input_documents = [doc['filename'] for doc in documents_data]
-        
-        # Prepare extracted sections
         extracted_sections = []
         sub_section_analysis = []
         
-        for section in enhanced_sections[:15]:  # Top 15 sections
-            extracted_sections.append({
-                'document': section['document'],
-                'page_number': section['page'],
-                'section_title': section['section_title'],
-                'importance_rank': section['importance_rank']
-            })
-            
-            # Add sub-sections
-            for sub_section in section.get('sub_sections', []):
-                sub_section_analysis.append({
-                    'document': sub_section['document'],
-                    'refined_text': sub_section['refined_text'][:500] + "..." if len(sub_section['refined_text']) > 500 else sub_section['refined_text'],
-                    'page_number': sub_section['page_number']
-                })
+        for extracted_section, sub_sections in entries:
+            extracted_sections.append(extracted_section)
+            sub_section_analysis.extend(sub_sections)
         
         return {
-            'metadata': {
-                'input_documents': input_documents,
-                'persona': persona,
-                'job_to_be_done': job_to_be_done,
-                'processing_timestamp': datetime.now().isoformat()
-            },
+            'metadata': self._output_metadata(documents_data, persona, job_to_be_done),
             'extracted_sections': extracted_sections,
             'sub_section_analysis': sub_section_analysis
         }
+    
+    @staticmethod
+    def _output_metadata(documents_data: List[Dict], persona: str, job_to_be_done: str) -> Dict:
+        """
+        Metadata member of the output
+        """
+        return {
+            'input_documents': [doc['filename'] for doc in documents_data],
+            'persona': persona,
+            'job_to_be_done': job_to_be_done,
+            'processing_timestamp': datetime.now().isoformat()
+        }
+    
+    def _output_entry(self, section: Dict, sub_sections: List[Dict]) -> Tuple[Dict, List[Dict]]:
+        """
+        Output entries of a ranked section and of its sub-sections
+        """
+        extracted_section = {
+            'document': section['document'],
+            'page_number': section['page'],
+            'section_title': section['section_title'],
+            'importance_rank': section['importance_rank']
+        }
+        # Near-duplicates of the section found elsewhere in the collection
+        if section.get('duplicates'):
+            extracted_section['duplicates'] = [
+                {'document': copy['document'], 'page_number': copy['page'], 'section_title': copy['section_title']}
+                for copy in section['duplicates']
+            ]
+        
+        limit = self.refined_text_chars
+        sub_section_entries = [{
+            'document': sub_section['document'],
+            'refined_text': sub_section['refined_text'][:limit] + "..." if len(sub_section['refined_text']) > limit else sub_section['refined_text'],
+            'page_number': sub_section['page_number']
+        } for sub_section in sub_sections]
+        
+        return extracted_section, sub_section_entries
 
 def main():
     """
     Process documents from input directory and generate analysis
     """
-    input_dir = "./input"
-    output_file = "./output/analysis.json"
+    parser = argparse.ArgumentParser(description="Persona-driven document analysis")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Worker processes for PDF extraction (0 = one per CPU)")
+    parser.add_argument('--cache-dir', default=None,
+                        help="Directory for the persistent extraction cache (disabled by default)")
+    parser.add_argument('--cache-max-mb', type=int, default=512,
+                        help="Maximum size of the extraction cache in megabytes")
+    parser.add_argument('--heading-detector', choices=HEADING_DETECTORS, default='regex',
+                        help="Detect headings from text patterns or from font size/weight/position")
+    parser.add_argument('--no-outline', action='store_true',
+                        help="Ignore PDF outlines (bookmarks) and always detect headings line by line")
+    parser.add_argument('--dedup-threshold', type=float, default=0.8,
+                        help="Collapse sections at least this similar (estimated Jaccard of word 5-grams) into one")
+    parser.add_argument('--no-dedup', action='store_true',
+                        help="Keep near-duplicate sections")
+    parser.add_argument('--top-sections', type=int, default=20,
+                        help="Number of top-ranked sections kept by the ranking (at least --output-sections)")
+    parser.add_argument('--full-ranking', action='store_true',
+                        help="Score and sort every section instead of selecting only the top sections")
+    parser.add_argument('--output-sections', type=int, default=15,
+                        help="Number of ranked sections listed in the output, with their sub-sections")
+    parser.add_argument('--subsection-results', type=int, default=3,
+                        help="Best sub-sections listed per output section")
+    parser.add_argument('--refined-text-chars', type=int, default=500,
+                        help="Length sub-section texts are cut to in the output")
+    parser.add_argument('--output-format', choices=OUTPUT_FORMATS, default='json',
+                        help="Write results as indented JSON, compact JSON or JSON Lines (one record per line)")
+    parser.add_argument('--subsection-window', type=int, default=3,
+                        help="Sentences per sub-section window")
+    parser.add_argument('--subsection-step', type=int, default=None,
+                        help="Sentences between window starts (default: window size, i.e. no overlap)")
+    parser.add_argument('--ranking-backend', choices=RANKING_BACKENDS, default='tfidf',
+                        help="Score sections with TF-IDF over a 1000-term vocabulary or over hashed term features, "
+                             "or with BM25 over an inverted index of stemmed keywords")
+    parser.add_argument('--rerank-candidates', type=int, default=None, metavar='N',
+                        help="Two-stage ranking: prefilter sections by keyword and query-word hits and score "
+                             "only the N best with TF-IDF/hashed-term similarity")
+    parser.add_argument('--hash-features', type=int, default=2 ** 20,
+                        help="Number of hashed feature columns of the hashing ranking backend")
+    parser.add_argument('--page-range', type=parse_page_range, default=None, metavar='FIRST-LAST',
+                        help="Only extract these pages of every document, e.g. 1-50, 10- or 3 (the first three)")
+    parser.add_argument('--page-budget', type=int, default=None,
+                        help="Extract at most this many pages across all documents, in document order")
+    parser.add_argument('--time-budget', type=float, default=None, metavar='SECONDS',
+                        help="Stop extracting further pages once this many seconds have passed")
+    parser.add_argument('--skim-pages', type=int, default=None,
+                        help="Skim mode: extract this many pages per document, then only the best-ranked documents in full")
+    parser.add_argument('--skim-deepen', type=int, default=3,
+                        help="Documents extracted in full after skimming")
+    parser.add_argument('--fast-start', action='store_true',
+                        help="Use the vendored stopwords and sentence splitter without looking for NLTK data")
+    parser.add_argument('--metrics', action='store_true',
+                        help="Add per-stage timings, per-document extraction statistics and peak RSS to the output JSON")
+    parser.add_argument('--metrics-file', metavar='PATH', default=None,
+                        help="Also write the metrics to PATH as JSON (implies --metrics)")
+    parser.add_argument('--profile', choices=PROFILERS, default=None,
+                        help="Profile the whole run with cProfile or tracemalloc")
+    parser.add_argument('--profile-output', metavar='PATH', default=None,
+                        help="cProfile stats or tracemalloc report file (default: ./output/profile.prof or profile.txt)")
+    parser.add_argument('--serve', metavar='PORT', type=int, default=None,
+                        help="Run a long-lived HTTP analysis server on PORT (see analysis_server.py)")
+    parser.add_argument('--host', default='127.0.0.1',
+                        help="Interface the server listens on")
+    parser.add_argument('--unix-socket', metavar='PATH', default=None,
+                        help="Run the analysis server on a Unix socket instead of a TCP port")
+    parser.add_argument('--max-corpora', type=int, default=8,
+                        help="Document sets and indexes the server keeps warm in memory")
+    parser.add_argument('--build-index', metavar='INDEX_DIR', default=None,
+                        help="Extract the input documents, persist a TF-IDF index to INDEX_DIR and exit")
+    parser.add_argument('--incremental', metavar='INDEX_DIR', default=None,
+                        help="Update INDEX_DIR with added, modified and removed PDFs only, then answer the query from it")
+    parser.add_argument('--index', metavar='INDEX_DIR', default=None,
+                        help="Answer the persona/job query from a prebuilt index instead of the PDFs")
+    parser.add_argument('--batch', metavar='QUERIES_FILE', default=None,
+                        help="JSON list or JSON Lines file of persona/job pairs to answer in one run")
+    parser.add_argument('--output-dir', default="./output/batch",
+                        help="Directory for per-query results in batch mode")
+    parser.add_argument('--input-dir', default="./input",
+                        help="Directory of the PDFs (and of persona.txt and job.txt)")
+    parser.add_argument('--collections-dir', default="./collections",
+                        help="Directory holding the named sharded collections")
+    parser.add_argument('--build-collection', metavar='NAME[=DIR]', type=parse_collection_spec, action='append',
+                        help="Extract DIR (default: --input-dir) into the named sharded collection and exit; repeatable")
+    parser.add_argument('--shard-documents', type=int, default=DEFAULT_SHARD_DOCUMENTS,
+                        help="Documents per shard of a collection")
+    parser.add_argument('--collection', metavar='NAME', action='append',
+                        help="Answer the persona/job query from this sharded collection; repeat to query several")
+    args = parser.parse_args()
+    
+    input_dir = args.input_dir
+    output_file = f"./output/analysis{OUTPUT_EXTENSIONS[args.output_format]}"
     
     # These would typically be read from input files or command line arguments
     # For the hackathon, you might read these from JSON files in the input directory
@@ -433,8 +1606,61 @@ def main():
     os.makedirs(os.path.dirname(output_file), exist_ok=True)
     
     # Process documents
-    analyzer = PersonaDrivenAnalyzer()
-    analyzer.process_documents(input_dir, persona, job_to_be_done, output_file)
+    analyzer = PersonaDrivenAnalyzer(
+        workers=args.workers,
+        cache_dir=args.cache_dir,
+        cache_max_bytes=args.cache_max_mb * 1024 * 1024,
+        heading_detector=args.heading_detector,
+        full_ranking=args.full_ranking,
+        top_sections=args.top_sections,
+        output_sections=args.output_sections,
+        subsection_results=args.subsection_results,
+        refined_text_chars=args.refined_text_chars,
+        output_format=args.output_format,
+        subsection_window=args.subsection_window,
+        subsection_step=args.subsection_step,
+        fast_start=args.fast_start,
+        ranking_backend=args.ranking_backend,
+        hash_features=args.hash_features,
+        rerank_candidates=args.rerank_candidates,
+        collect_metrics=args.metrics or bool(args.metrics_file),
+        page_range=args.page_range,
+        page_budget=args.page_budget,
+        time_budget=args.time_budget,
+        skim_pages=args.skim_pages,
+        skim_deepen=args.skim_deepen,
+        use_outline=not args.no_outline,
+        dedup_threshold=None if args.no_dedup else args.dedup_threshold
+    )
+    
+    profile_output = args.profile_output or (
+        "./output/profile.prof" if args.profile == 'cprofile' else "./output/profile.txt"
+    )
+    
+    with profiled(args.profile, profile_output):
+        if args.serve is not None or args.unix_socket:
+            import analysis_server
+            analysis_server.run(analyzer, args.host, args.serve, args.unix_socket, args.max_corpora)
+        elif args.build_collection:
+            for name, collection_input_dir in args.build_collection:
+                analyzer.build_collection(name, collection_input_dir or input_dir, args.collections_dir,
+                                          args.shard_documents)
+        elif args.collection:
+            analyzer.query_collections(args.collection, args.collections_dir, persona, job_to_be_done, output_file)
+        elif args.build_index:
+            analyzer.build_index(input_dir, args.build_index)
+        elif args.incremental:
+            if analyzer.update_index(input_dir, args.incremental) is not None:
+                analyzer.query_index(args.incremental, persona, job_to_be_done, output_file)
+        elif args.batch:
+            analyzer.process_batch(args.batch, args.output_dir, input_dir=input_dir, index_dir=args.index)
+        elif args.index:
+            analyzer.query_index(args.index, persona, job_to_be_done, output_file)
+        else:
+            analyzer.process_documents(input_dir, persona, job_to_be_done, output_file)
+    
+    if args.metrics_file:
+        analyzer.metrics.save(args.metrics_file)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,176 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Opt-in profilers that can wrap a whole run
+PROFILERS = ('cprofile', 'tracemalloc')
+
+
+class PipelineMetrics:
+    """
+    Wall and CPU time per pipeline stage, per-document extraction statistics, counters and peak RSS.
+    Stages accumulate over repeated calls and may be entered from several threads.
+    Document totals cover every recorded document, but only the last max_documents are listed, so a
+    long-running server does not grow without bound.
+    CPU time covers this process only; extraction worker processes show up in the children's peak RSS.
+    """
+    
+    def __init__(self, max_documents: int = 1000):
+        self._lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.documents = deque(maxlen=max_documents)
+        self.document_totals = {'documents': 0, 'pages': 0, 'sections': 0}
+        self.counters = {}
+    
+    def __getstate__(self):
+        # Copies sent to worker processes get their own lock; what they record stays in the worker
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+    
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Time a block as one call of a named stage
+        """
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            with self._lock:
+                stage = self.stages.setdefault(name, {'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'calls': 0})
+                stage['wall_seconds'] += wall
+                stage['cpu_seconds'] += cpu
+                stage['calls'] += 1
+    
+    def record_document(self, filename: str, pages: Optional[int], sections: int, seconds: float,
+                        cached: bool = False):
+        """
+        Record the extraction of one document (pages is None when it was never opened)
+        """
+        with self._lock:
+            self.documents.append({
+                'filename': filename,
+                'pages': pages,
+                'sections': sections,
+                'extraction_seconds': seconds,
+                'cached': cached
+            })
+            self.document_totals['documents'] += 1
+            self.document_totals['pages'] += pages or 0
+            self.document_totals['sections'] += sections
+    
+    def count(self, name: str, value: int):
+        """
+        Set a counter such as the number of sections or queries
+        """
+        with self._lock:
+            self.counters[name] = value
+    
+    @staticmethod
+    def peak_rss() -> Dict[str, Optional[int]]:
+        """
+        Peak resident set size in bytes of this process and of its finished child processes
+        """
+        if resource is None:
+            return {'self': None, 'children': None}
+        
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        scale = 1 if sys.platform == 'darwin' else 1024
+        return {
+            'self': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+            'children': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+        }
+    
+    def to_dict(self) -> Dict:
+        """
+        Snapshot of the metrics as a JSON-serializable dict
+        """
+        with self._lock:
+            return {
+                'stages': {name: dict(stage) for name, stage in self.stages.items()},
+                'documents': [dict(document) for document in self.documents],
+                'counters': dict(self.counters),
+                'totals': {
+                    **self.document_totals,
+                    'wall_seconds': time.perf_counter() - self.started
+                },
+                'peak_rss_bytes': self.peak_rss()
+            }
+    
+    def save(self, metrics_file: str):
+        """
+        Write the metrics as JSON
+        """
+        directory = os.path.dirname(metrics_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        with open(metrics_file, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        
+        print(f"Metrics saved to {metrics_file}")
+
+
+@contextmanager
+def profiled(profiler: Optional[str], output_file: str, limit: int = 25):
+    """
+    Run a block under cProfile (stats written to output_file) or tracemalloc (top allocations written
+    to output_file); a profiler of None runs the block unprofiled
+    """
+    if profiler is None:
+        yield
+        return
+    if profiler not in PROFILERS:
+        raise ValueError(f"Unknown profiler: {profiler}")
+    
+    directory = os.path.dirname(output_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    
+    if profiler == 'cprofile':
+        import cProfile
+        import pstats
+        
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            profile.dump_stats(output_file)
+            print(f"cProfile stats saved to {output_file}; slowest calls by cumulative time:")
+            pstats.Stats(profile).sort_stats('cumulative').print_stats(limit)
+        return
+    
+    import tracemalloc
+    
+    tracemalloc.start(25)
+    try:
+        yield
+    finally:
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        
+        with open(output_file, 'w', encoding='utf-8') as f:
+            f.write(f"Traced memory: current {current} bytes, peak {peak} bytes\n\n")
+            for statistic in snapshot.statistics('lineno')[:limit]:
+                f.write(f"{statistic}\n")
+        print(f"tracemalloc peak {peak / 1e6:.1f} MB; top allocations saved to {output_file}")
@@ -0,0 +1,328 @@
+import io
+import json
+import os
+from array import array
+from collections.abc import Sequence
+from typing import List, Dict, Iterable, Iterator
+
+import numpy as np
+
+from keyword_scoring import KeywordMatcher
+
+
+class SectionStore:
+    """
+    Columnar storage for extracted sections.
+    Document names are interned and referenced by id, page numbers and heading levels are
+    integer columns, and titles and contents are kept in two UTF-8 buffers addressed by offsets.
+    A section costs a few array entries instead of a dict holding its own strings.
+    """
+    
+    FORMAT_VERSION = 1
+    
+    # Arrays persisted as .npy files (memory-mapped on load)
+    _ARRAYS = ('doc_ids', 'pages', 'heading_levels', 'title_buffer', 'title_offsets',
+               'content_buffer', 'content_offsets')
+    
+    # File name prefixes of the persisted text and title keyword matchers
+    _MATCHERS = ('keywords_text', 'keywords_title')
+    
+    def __init__(self, documents: List[str], doc_ids: np.ndarray, pages: np.ndarray,
+                 heading_levels: np.ndarray, title_buffer: np.ndarray, title_offsets: np.ndarray,
+                 content_buffer: np.ndarray, content_offsets: np.ndarray):
+        self.documents = documents
+        self.doc_ids = doc_ids
+        self.pages = pages
+        self.heading_levels = heading_levels
+        self.title_buffer = title_buffer
+        self.title_offsets = title_offsets
+        self.content_buffer = content_buffer
+        self.content_offsets = content_offsets
+        # Data derived from the sections (e.g. backend indexes), kept as long as the store
+        self.derived = {}
+        # Keyword matchers over the texts and the titles, built only for stores that are queried repeatedly
+        self.keyword_matchers = None
+        # Section index -> near-duplicate copies dropped in its favour (document, page and title of each)
+        self.duplicates = {}
+    
+    @classmethod
+    def from_sections(cls, sections: Iterable[Dict]) -> 'SectionStore':
+        """
+        Build a store from section dicts, consuming them one at a time
+        """
+        documents = []
+        document_ids = {}
+        doc_ids, pages, heading_levels = array('i'), array('i'), array('h')
+        titles, contents = io.BytesIO(), io.BytesIO()
+        title_offsets, content_offsets = array('q', [0]), array('q', [0])
+        
+        for section in sections:
+            doc_id = document_ids.get(section['document'])
+            if doc_id is None:
+                doc_id = document_ids[section['document']] = len(documents)
+                documents.append(section['document'])
+            
+            doc_ids.append(doc_id)
+            pages.append(section['page'])
+            # Level 0 stands for an unknown heading level
+            heading_levels.append(section.get('heading_level') or 0)
+            title_offsets.append(title_offsets[-1] + titles.write(section['section_title'].encode('utf-8')))
+            content_offsets.append(content_offsets[-1] + contents.write(section['content'].encode('utf-8')))
+        
+        return cls(
+            documents,
+            np.asarray(doc_ids, dtype=np.int32),
+            np.asarray(pages, dtype=np.int32),
+            np.asarray(heading_levels, dtype=np.int16),
+            np.frombuffer(titles.getvalue(), dtype=np.uint8),
+            np.asarray(title_offsets, dtype=np.int64),
+            np.frombuffer(contents.getvalue(), dtype=np.uint8),
+            np.asarray(content_offsets, dtype=np.int64)
+        )
+    
+    @classmethod
+    def concat(cls, stores: List['SectionStore']) -> 'SectionStore':
+        """
+        Join stores into one, in order; document names are interned again across the parts
+        """
+        documents = []
+        document_ids = {}
+        doc_ids = [np.zeros(0, dtype=np.int32)]
+        title_offsets = [np.zeros(1, dtype=np.int64)]
+        content_offsets = [np.zeros(1, dtype=np.int64)]
+        title_size = content_size = 0
+        duplicates = {}
+        section_count = 0
+        
+        for store in stores:
+            duplicates.update((section_count + i, copies) for i, copies in store.duplicates.items())
+            section_count += len(store)
+            
+            # Map the part's document ids to ids in the joined store
+            mapping = np.zeros(len(store.documents), dtype=np.int32)
+            for doc_id in np.unique(store.doc_ids).tolist():
+                name = store.documents[doc_id]
+                if name not in document_ids:
+                    document_ids[name] = len(documents)
+                    documents.append(name)
+                mapping[doc_id] = document_ids[name]
+            doc_ids.append(mapping[store.doc_ids])
+            
+            title_offsets.append(store.title_offsets[1:] - store.title_offsets[0] + title_size)
+            content_offsets.append(store.content_offsets[1:] - store.content_offsets[0] + content_size)
+            title_size += int(store.title_offsets[-1] - store.title_offsets[0])
+            content_size += int(store.content_offsets[-1] - store.content_offsets[0])
+        
+        joined = cls(
+            documents,
+            np.concatenate(doc_ids),
+            np.concatenate([np.zeros(0, dtype=np.int32)] + [store.pages for store in stores]),
+            np.concatenate([np.zeros(0, dtype=np.int16)] + [store.heading_levels for store in stores]),
+            np.concatenate([np.zeros(0, dtype=np.uint8)] + [
+                store.title_buffer[store.title_offsets[0]:store.title_offsets[-1]] for store in stores
+            ]),
+            np.concatenate(title_offsets),
+            np.concatenate([np.zeros(0, dtype=np.uint8)] + [
+                store.content_buffer[store.content_offsets[0]:store.content_offsets[-1]] for store in stores
+            ]),
+            np.concatenate(content_offsets)
+        )
+        joined.duplicates = duplicates
+        
+        # Matchers are carried over once any part has them; parts without them are tokenized now
+        if any(store.keyword_matchers is not None for store in stores):
+            for store in stores:
+                store.build_keyword_matchers()
+            joined.keyword_matchers = (
+                KeywordMatcher.concat([store.keyword_matchers[0] for store in stores], joined.texts()),
+                KeywordMatcher.concat([store.keyword_matchers[1] for store in stores], joined.titles())
+            )
+        return joined
+    
+    def select(self, start: int, stop: int) -> 'SectionStore':
+        """
+        Sections start..stop-1 as a store sharing this store's buffers
+        """
+        selected = SectionStore(
+            self.documents,
+            self.doc_ids[start:stop],
+            self.pages[start:stop],
+            self.heading_levels[start:stop],
+            self.title_buffer,
+            self.title_offsets[start:stop + 1],
+            self.content_buffer,
+            self.content_offsets[start:stop + 1]
+        )
+        selected.duplicates = {i - start: copies for i, copies in self.duplicates.items() if start <= i < stop}
+        if self.keyword_matchers is not None:
+            text_matcher, title_matcher = self.keyword_matchers
+            selected.keyword_matchers = (
+                text_matcher.select(start, stop, selected.texts()),
+                title_matcher.select(start, stop, selected.titles())
+            )
+        return selected
+    
+    def take(self, rows: np.ndarray) -> 'SectionStore':
+        """
+        Sections at increasing indices rows as a new store, joined from runs of consecutive sections
+        """
+        runs = np.split(rows, np.flatnonzero(np.diff(rows) != 1) + 1) if len(rows) else []
+        return SectionStore.concat([self.select(int(run[0]), int(run[-1]) + 1) for run in runs])
+    
+    def build_keyword_matchers(self):
+        """
+        Build the text and title keyword matchers unless the store already has them
+        """
+        if self.keyword_matchers is None:
+            self.keyword_matchers = (KeywordMatcher(self.texts()), KeywordMatcher(self.titles()))
+    
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+    
+    def __iter__(self) -> Iterator[Dict]:
+        for i in range(len(self)):
+            yield self.section(i)
+    
+    def document(self, i: int) -> str:
+        return self.documents[self.doc_ids[i]]
+    
+    def title(self, i: int) -> str:
+        return self.title_buffer[self.title_offsets[i]:self.title_offsets[i + 1]].tobytes().decode('utf-8')
+    
+    def content(self, i: int) -> str:
+        return self.content_buffer[self.content_offsets[i]:self.content_offsets[i + 1]].tobytes().decode('utf-8')
+    
+    def text(self, i: int) -> str:
+        """
+        Title and content of a section as one text, as it is vectorized and matched
+        """
+        return f"{self.title(i)} {self.content(i)}"
+    
+    def section(self, i: int) -> Dict:
+        """
+        Materialize one section as a dict in the extractor's format
+        """
+        return {
+            'document': self.document(i),
+            'page': int(self.pages[i]),
+            'section_title': self.title(i),
+            'heading_level': int(self.heading_levels[i]) or None,
+            'content': self.content(i),
+            'importance_rank': 0
+        }
+    
+    def texts(self) -> Sequence:
+        """
+        Lazy sequence of section texts (title and content), decoded on access
+        """
+        return _ColumnView(self, self.text)
+    
+    def titles(self) -> Sequence:
+        """
+        Lazy sequence of section titles, decoded on access
+        """
+        return _ColumnView(self, self.title)
+    
+    def ranked(self, order: np.ndarray, scores: np.ndarray) -> Sequence:
+        """
+        Lazy sequence of the sections at indices order, as dicts with their relevance_score (from scores),
+        importance_rank and near-duplicate copies, materialized on access
+        """
+        return _RankedView(self, np.asarray(order, dtype=np.int64), np.asarray(scores, dtype=float))
+    
+    def save(self, store_dir: str, keyword_matchers: bool = True):
+        """
+        Persist the columns as .npy files plus a JSON file with the document names.
+        With keyword_matchers the matchers are built if needed and saved too, so a loaded store
+        answers keyword queries without tokenizing its sections again.
+        """
+        os.makedirs(store_dir, exist_ok=True)
+        
+        for name in self._ARRAYS:
+            np.save(os.path.join(store_dir, f'sections_{name}.npy'), getattr(self, name))
+        
+        if keyword_matchers:
+            self.build_keyword_matchers()
+            for name, matcher in zip(self._MATCHERS, self.keyword_matchers):
+                matcher.save(store_dir, name)
+        
+        with open(os.path.join(store_dir, 'sections.json'), 'w', encoding='utf-8') as f:
+            json.dump({
+                'format': self.FORMAT_VERSION,
+                'documents': self.documents,
+                'duplicates': {str(i): copies for i, copies in self.duplicates.items()}
+            }, f, ensure_ascii=False)
+    
+    @classmethod
+    def load(cls, store_dir: str, mmap: bool = True) -> 'SectionStore':
+        """
+        Load a persisted store, memory-mapping the columns unless mmap is False
+        """
+        with open(os.path.join(store_dir, 'sections.json'), 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+        
+        if metadata.get('format') != cls.FORMAT_VERSION:
+            raise ValueError(f"Unsupported section store format in {store_dir}")
+        
+        mmap_mode = 'r' if mmap else None
+        arrays = [np.load(os.path.join(store_dir, f'sections_{name}.npy'), mmap_mode=mmap_mode) for name in cls._ARRAYS]
+        
+        store = cls(metadata['documents'], *arrays)
+        store.duplicates = {int(i): copies for i, copies in metadata.get('duplicates', {}).items()}
+        
+        # Stores saved without matchers build them again on demand
+        if all(KeywordMatcher.exists(store_dir, name) for name in cls._MATCHERS):
+            store.keyword_matchers = (
+                KeywordMatcher.load(store_dir, cls._MATCHERS[0], store.texts(), mmap),
+                KeywordMatcher.load(store_dir, cls._MATCHERS[1], store.titles(), mmap)
+            )
+        return store
+
+
+class _ColumnView(Sequence):
+    """
+    Read-only sequence over one decoded column of a SectionStore
+    """
+    
+    def __init__(self, store: SectionStore, getter):
+        self._store = store
+        self._getter = getter
+    
+    def __len__(self) -> int:
+        return len(self._store)
+    
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._getter(j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self._getter(i)
+    
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self._getter(i)
+
+
+class _RankedView(_ColumnView):
+    """
+    Read-only sequence of ranked section dicts of a SectionStore
+    """
+    
+    def __init__(self, store: SectionStore, order: np.ndarray, scores: np.ndarray):
+        super().__init__(store, self._section)
+        self._order = order
+        self._scores = scores
+    
+    def __len__(self) -> int:
+        return len(self._order)
+    
+    def _section(self, rank: int) -> Dict:
+        i = int(self._order[rank])
+        section = self._store.section(i)
+        section['relevance_score'] = float(self._scores[rank])
+        section['importance_rank'] = rank + 1
+        if i in self._store.duplicates:
+            section['duplicates'] = self._store.duplicates[i]
+        return section
@@ -0,0 +1,158 @@
+import json
+import os
+import re
+import shutil
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+
+import numpy as np
+
+# scikit-learn is only loaded where shards are indexed or scored
+if TYPE_CHECKING:
+    from hashing_index import HashingIndex
+
+# Documents extracted and indexed together as one shard unless configured otherwise
+DEFAULT_SHARD_DOCUMENTS = 100
+
+_NAME_RE = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_.-]*$')
+
+
+def parse_collection_spec(spec: str) -> Tuple[str, Optional[str]]:
+    """
+    Parse a collection given as NAME or NAME=INPUT_DIR
+    """
+    name, _, input_dir = spec.partition('=')
+    name = name.strip()
+    if not _NAME_RE.match(name):
+        raise ValueError(f"Invalid collection name: {name}")
+    return name, input_dir.strip() or None
+
+
+class ShardedCollection:
+    """
+    A named document collection split into shards of consecutive documents, each persisted in its own
+    directory as a HashingIndex (section store and hashed TF-IDF matrix) with its document frequencies.
+    Hashed term columns are the same in every shard, so the collection-wide document frequency of a term
+    is the sum over the shards; shard matrices are re-weighted with the resulting global IDF before they
+    are scored, which gives the scores an index over the whole collection would.
+    collection.json lists the shards with their documents and section counts.
+    """
+    
+    FORMAT_VERSION = 1
+    
+    def __init__(self, collection_dir: str, name: str, n_features: int, shards: Optional[List[Dict]] = None):
+        self.collection_dir = collection_dir
+        self.name = name
+        self.n_features = n_features
+        self.shards = shards or []
+    
+    @staticmethod
+    def path(collections_dir: str, name: str) -> str:
+        """
+        Directory of a named collection
+        """
+        if not _NAME_RE.match(name):
+            raise ValueError(f"Invalid collection name: {name}")
+        return os.path.join(collections_dir, name)
+    
+    @classmethod
+    def create(cls, collections_dir: str, name: str, n_features: int) -> 'ShardedCollection':
+        """
+        Start an empty collection, replacing an earlier build of it
+        """
+        collection_dir = cls.path(collections_dir, name)
+        if os.path.isdir(collection_dir) and os.listdir(collection_dir):
+            if not os.path.exists(os.path.join(collection_dir, 'collection.json')):
+                raise ValueError(f"{collection_dir} exists and is not a collection")
+            shutil.rmtree(collection_dir)
+        os.makedirs(collection_dir, exist_ok=True)
+        
+        collection = cls(collection_dir, name, n_features)
+        collection.save()
+        return collection
+    
+    @property
+    def documents(self) -> List[str]:
+        return [document for shard in self.shards for document in shard['documents']]
+    
+    @property
+    def section_count(self) -> int:
+        return sum(shard['sections'] for shard in self.shards)
+    
+    def shard_dirs(self) -> List[str]:
+        return [os.path.join(self.collection_dir, shard['dir']) for shard in self.shards]
+    
+    def add_shard(self, index: 'HashingIndex'):
+        """
+        Persist the index of the next shard with its document frequencies
+        """
+        shard = {'dir': f"shard-{len(self.shards):05d}", 'documents': index.documents, 'sections': len(index.sections)}
+        shard_dir = os.path.join(self.collection_dir, shard['dir'])
+        index.save(shard_dir)
+        
+        # Every stored entry of a section row is a term occurring in that section
+        document_frequency = np.bincount(np.asarray(index.matrix.indices), minlength=self.n_features)
+        terms = np.flatnonzero(document_frequency)
+        np.save(os.path.join(shard_dir, 'df_terms.npy'), terms)
+        np.save(os.path.join(shard_dir, 'df_counts.npy'), document_frequency[terms])
+        
+        self.shards.append(shard)
+        self.save()
+    
+    def save(self):
+        """
+        Write the collection manifest
+        """
+        manifest = {
+            'format': self.FORMAT_VERSION,
+            'name': self.name,
+            'n_features': self.n_features,
+            'shards': self.shards
+        }
+        with open(os.path.join(self.collection_dir, 'collection.json'), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+    
+    @classmethod
+    def load(cls, collections_dir: str, name: str) -> 'ShardedCollection':
+        """
+        Load the manifest of a built collection
+        """
+        collection_dir = cls.path(collections_dir, name)
+        try:
+            with open(os.path.join(collection_dir, 'collection.json'), 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            raise ValueError(f"No collection named {name} in {collections_dir}")
+        
+        if manifest.get('format') != cls.FORMAT_VERSION:
+            raise ValueError(f"Unsupported collection format in {collection_dir}")
+        
+        return cls(collection_dir, manifest['name'], manifest['n_features'], manifest['shards'])
+    
+    @staticmethod
+    def term_statistics(collections: List['ShardedCollection']) -> Tuple[int, np.ndarray, np.ndarray]:
+        """
+        Number of sections and (term, document frequency) pairs summed over every shard of the collections
+        """
+        if len({collection.n_features for collection in collections}) > 1:
+            raise ValueError("Collections were built with different numbers of hashed features")
+        
+        terms, counts = [], []
+        for collection in collections:
+            for shard_dir in collection.shard_dirs():
+                terms.append(np.load(os.path.join(shard_dir, 'df_terms.npy')))
+                counts.append(np.load(os.path.join(shard_dir, 'df_counts.npy')))
+        if not terms:
+            return 0, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        
+        terms, inverse = np.unique(np.concatenate(terms), return_inverse=True)
+        document_frequency = np.bincount(inverse, weights=np.concatenate(counts)).astype(np.int64)
+        return sum(collection.section_count for collection in collections), terms, document_frequency
+    
+    @staticmethod
+    def idf(section_count: int, terms: np.ndarray, document_frequency: np.ndarray, n_features: int) -> np.ndarray:
+        """
+        Smoothed IDF weights of all hashed columns from collection-wide statistics, as HashingIndex computes them
+        """
+        frequencies = np.zeros(n_features, dtype=np.float64)
+        frequencies[terms] = document_frequency
+        return np.log((section_count + 1) / (frequencies + 1.0)) + 1
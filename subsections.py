@@ -0,0 +1,147 @@
+import re
+import threading
+from collections import Counter, OrderedDict
+from typing import List, Dict, Callable, Optional, Tuple
+
+import numpy as np
+
+from keyword_scoring import keyword_presence
+from text_resources import TextResources
+
+
+class SubsectionEngine:
+    """
+    Split sections into windows of consecutive sentences and score them against persona and job keywords.
+    Sentence boundaries are computed once per distinct section content and cached as offsets.
+    Keyword hits are found once per sentence, and every window is scored from prefix sums over them.
+    """
+    
+    def __init__(self, window_size: int = 3, window_step: Optional[int] = None, max_results: int = 3,
+                 cache_size: int = 4096,
+                 sentence_spans: Optional[Callable[[str], List[Tuple[int, int]]]] = None):
+        if window_size < 1 or (window_step is not None and window_step < 1):
+            raise ValueError("Sub-section window size and step must be positive")
+        
+        self.window_size = window_size
+        # Non-overlapping windows by default; a smaller step gives sliding windows
+        self.window_step = window_step or window_size
+        self.max_results = max_results
+        self.cache_size = cache_size
+        self._sentence_spans = sentence_spans or TextResources().sentence_spans
+        self._span_cache = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def sentence_spans(self, content: str) -> np.ndarray:
+        """
+        Sentence offsets of a section's content as an (n, 2) array, cached per content
+        """
+        with self._lock:
+            spans = self._span_cache.get(content)
+            if spans is not None:
+                self._span_cache.move_to_end(content)
+                return spans
+        
+        spans = np.array(list(self._sentence_spans(content)), dtype=np.int64).reshape(-1, 2)
+        
+        with self._lock:
+            self._span_cache[content] = spans
+            if len(self._span_cache) > self.cache_size:
+                self._span_cache.popitem(last=False)
+        
+        return spans
+    
+    def __getstate__(self):
+        # Copies sent to worker processes start with an empty cache
+        state = self.__dict__.copy()
+        state['_span_cache'] = OrderedDict()
+        del state['_lock']
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+    
+    def window_bounds(self, sentence_count: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Start and end sentence indices of the windows over a section.
+        Sections shorter than one window have none; a final partial window covers any remaining sentences.
+        """
+        if sentence_count < self.window_size:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        
+        starts = np.arange(0, sentence_count - self.window_size + 1, self.window_step)
+        last_start = starts[-1] + self.window_step
+        if starts[-1] + self.window_size < sentence_count and last_start < sentence_count:
+            starts = np.append(starts, last_start)
+        
+        return starts, np.minimum(starts + self.window_size, sentence_count)
+    
+    def extract(self, sections: List[Dict], persona_keywords: List[str],
+                job_keywords: List[str]) -> List[List[Dict]]:
+        """
+        Best scoring sub-sections of each section, in the order the sections are given
+        """
+        spans = [self.sentence_spans(section['content']) for section in sections]
+        sentences = [
+            section['content'][start:end]
+            for section, section_spans in zip(sections, spans)
+            for start, end in section_spans.tolist()
+        ]
+        
+        keywords = sorted(set(persona_keywords) | set(job_keywords))
+        persona_weights = self._keyword_weights(keywords, persona_keywords)
+        job_weights = self._keyword_weights(keywords, job_keywords)
+        
+        # Keywords without whitespace cannot span sentences, so per-sentence hits decide each window
+        token_columns = [i for i, keyword in enumerate(keywords) if keyword and not re.search(r'\s', keyword)]
+        other_columns = [i for i in range(len(keywords)) if i not in set(token_columns)]
+        if sentences and token_columns:
+            sentence_hits = keyword_presence(sentences, [keywords[i] for i in token_columns])
+        else:
+            sentence_hits = np.zeros((len(sentences), len(token_columns)), dtype=bool)
+        
+        results = []
+        offset = 0
+        for section, section_spans in zip(sections, spans):
+            count = len(section_spans)
+            section_sentences = sentences[offset:offset + count]
+            section_hits = sentence_hits[offset:offset + count]
+            offset += count
+            
+            starts, ends = self.window_bounds(count)
+            if not len(starts):
+                results.append([])
+                continue
+            
+            window_texts = [' '.join(section_sentences[start:end]) for start, end in zip(starts.tolist(), ends.tolist())]
+            
+            prefix = np.zeros((count + 1, len(token_columns)), dtype=np.int64)
+            np.cumsum(section_hits, axis=0, out=prefix[1:])
+            window_hits = np.zeros((len(starts), len(keywords)), dtype=bool)
+            window_hits[:, token_columns] = (prefix[ends] - prefix[starts]) > 0
+            
+            for i in other_columns:
+                window_hits[:, i] = [keywords[i] in text.lower() for text in window_texts]
+            
+            scores = (window_hits @ persona_weights) * 0.4 + (window_hits @ job_weights) * 0.6
+            
+            # Only relevant windows are kept; ties keep their order in the section
+            relevant = np.flatnonzero(scores > 0)
+            best = relevant[np.argsort(-scores[relevant], kind='stable')][:self.max_results]
+            
+            results.append([{
+                'document': section['document'],
+                'refined_text': window_texts[i],
+                'page_number': section['page'],
+                'relevance_score': score
+            } for i, score in zip(best.tolist(), scores[best].tolist())])
+        
+        return results
+    
+    @staticmethod
+    def _keyword_weights(keywords: List[str], keyword_list: List[str]) -> np.ndarray:
+        """
+        How many times each distinct keyword appears in a keyword list
+        """
+        multiplicity = Counter(keyword_list)
+        return np.array([multiplicity[keyword] for keyword in keywords], dtype=np.int64)
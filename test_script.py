@@ -3,11 +3,32 @@
 Test script for Round 1B Persona-Driven Document Intelligence
 """
 
+import asyncio
 import os
+import random
+import re
 import json
 import tempfile
 import shutil
-from persona_analyzer import PersonaDrivenAnalyzer
+from persona_analyzer import JOB_KEYWORDS, PersonaDrivenAnalyzer
+from analysis_server import AnalysisServer
+from benchmarks.synthetic_pdfs import document_pages, generate_corpus, write_pdf
+from bm25_index import BM25Index
+from corpus_index import CorpusIndex, load_index
+from extraction_budget import ExtractionBudget, parse_page_range
+from extraction_cache import ExtractionCache
+from hashing_index import HashingIndex
+from incremental_index import IncrementalIndex
+from keyword_scoring import KeywordMatcher, keyword_match_counts, keyword_presence
+from layout_headings import LayoutHeadingDetector
+from near_duplicates import NearDuplicateFilter
+from outline_sections import DocumentOutline
+from output_writer import OutputWriter
+from pipeline_metrics import PipelineMetrics, profiled
+from section_store import SectionStore
+from sharded_collection import ShardedCollection, parse_collection_spec
+from subsections import SubsectionEngine
+from text_resources import TextResources
 
 def create_test_inputs():
     """
@@ -64,6 +85,34 @@ def test_keyword_extraction():
         print(f"Expected Keywords Found: {found_keywords}")
         print(f"Coverage: {len(found_keywords)}/{len(case['expected_keywords'])}")
 
+def test_keyword_memoization():
+    """
+    Test that keywords are memoized by normalized text in a bounded cache, and stems in a bounded LRU
+    """
+    print("\n" + "="*50)
+    print("Testing keyword memoization...")
+    
+    analyzer = PersonaDrivenAnalyzer(fast_start=True, keyword_cache_size=2)
+    persona = "PhD Researcher in Computational Biology"
+    keywords = analyzer._extract_persona_keywords(persona)
+    assert {'research', 'protein', 'comput'} <= set(keywords)
+    
+    keywords.append('mutated')
+    again = analyzer._extract_persona_keywords("  phd researcher in\ncomputational   BIOLOGY ")
+    assert 'mutated' not in again and sorted(again) == sorted(keywords[:-1])
+    assert len(analyzer._keyword_cache) == 1
+    
+    job = "Summarize onboarding procedures for new employees"
+    assert analyzer._extract_job_keywords(job) == ['summar', 'onboard', 'procedur', 'employe']
+    assert analyzer._extract_job_keywords("Prepare a Literature  Review") == list(JOB_KEYWORDS[0][1])
+    assert len(analyzer._keyword_cache) == 2
+    assert ('persona', persona.lower()) not in analyzer._keyword_cache
+    
+    resources = TextResources(vendored_only=True, stem_cache_size=2)
+    assert [resources.stem(word) for word in ('running', 'studies', 'running', 'molecular')] == \
+        ['run', 'studi', 'run', 'molecular']
+    assert list(resources._stems) == ['running', 'molecular']
+
 def test_heading_detection():
     """
     Test heading detection patterns
@@ -139,6 +188,1095 @@ def test_section_ranking():
     for i, section in enumerate(ranked_sections):
         print(f"{i+1}. {section['section_title']} (score: {section.get('relevance_score', 0):.3f})")
 
+def test_top_k_ranking():
+    """
+    Test that top-k ranking returns the head of the full ranking, ties in original order
+    """
+    print("\n" + "="*50)
+    print("Testing top-k ranking...")
+    
+    scores = [0.2, 0.9, 0.5, 0.9, 0.1, 0.5]
+    sections = SectionStore.from_sections(
+        {'document': 'test.pdf', 'page': i + 1, 'section_title': f"Section {i}", 'content': ''}
+        for i in range(len(scores))
+    )
+    
+    full = PersonaDrivenAnalyzer._assign_ranks(sections, scores)
+    top = PersonaDrivenAnalyzer._assign_ranks(sections, scores, top_k=3)
+    print(f"Top 3: {[s['section_title'] for s in top]}")
+    
+    assert [s['section_title'] for s in top] == [s['section_title'] for s in full[:3]]
+    assert [s['section_title'] for s in top] == ['Section 1', 'Section 3', 'Section 2']
+    assert [s['importance_rank'] for s in top] == [1, 2, 3]
+    
+    # Ranked sections are only materialized when read, so the output builds them chunk by chunk
+    materialized = []
+    section = sections.section
+    sections.section = lambda i: materialized.append(i) or section(i)
+    full = PersonaDrivenAnalyzer._assign_ranks(sections, scores)
+    assert len(full) == len(scores) and materialized == []
+    last = full[-1]
+    assert last['section_title'] == 'Section 4' and last['importance_rank'] == len(scores)
+    assert materialized == [4]
+
+def synthetic_sections(documents, pages, seed=0):
+    """
+    Sections of synthetic benchmark documents, split at their headings without writing PDFs
+    """
+    rng = random.Random(seed)
+    sections = []
+    for document in range(documents):
+        for page, lines in enumerate(document_pages(random.Random(rng.random()), pages), start=1):
+            for text, bold in lines:
+                if bold:
+                    sections.append({'document': f"doc_{document}.pdf", 'page': page, 'section_title': text,
+                                     'content': ''})
+                elif sections:
+                    sections[-1]['content'] += text + ' '
+    return sections
+
+def test_two_stage_ranking():
+    """
+    Test that the prefilter keeps the relevant sections for the full scorer, with stage timings recorded
+    """
+    print("\n" + "="*50)
+    print("Testing two-stage ranking...")
+    
+    filler = "Quarterly catering schedules and parking allocations for the facilities team."
+    relevant = {
+        7: "Neural networks predict protein binding for drug discovery.",
+        23: "Graph neural networks model molecular structure of drug candidates.",
+        41: "Benchmark datasets for protein function prediction with neural networks."
+    }
+    sections = SectionStore.from_sections(
+        {'document': 'test.pdf', 'page': i + 1, 'section_title': f"Part {i}", 'content': relevant.get(i, filler)}
+        for i in range(60)
+    )
+    persona, job = "Researcher in Computational Biology", "Review neural networks for drug discovery"
+    
+    for backend in ('tfidf', 'hashing'):
+        single = PersonaDrivenAnalyzer(fast_start=True, ranking_backend=backend)
+        two_stage = PersonaDrivenAnalyzer(fast_start=True, ranking_backend=backend, rerank_candidates=5,
+                                          collect_metrics=True)
+        keywords = (single._extract_persona_keywords(persona), single._extract_job_keywords(job))
+        
+        expected = single._rank_sections(sections, *keywords, job, top_k=3)
+        actual = two_stage._rank_sections(sections, *keywords, job, top_k=3)
+        print(f"{backend}: {[s['section_title'] for s in actual]}")
+        assert [s['section_title'] for s in actual] == [s['section_title'] for s in expected]
+        assert {s['page'] for s in actual} == {8, 24, 42}
+        
+        metrics = two_stage.metrics.to_dict()
+        assert {'prefilter', 'rerank'} <= set(metrics['stages'])
+        assert metrics['counters']['rerank_candidates'] == 5
+        
+        # Places beyond the candidates are filled with the other sections in prefilter order
+        ranked = two_stage._rank_sections(sections, *keywords, job)
+        assert len(ranked) == len(sections) and len({s['page'] for s in ranked}) == len(sections)
+        assert [s['importance_rank'] for s in ranked[:3]] == [1, 2, 3]
+        assert len(two_stage._rank_sections(sections, *keywords, job, top_k=8)) == 8
+        scores = [s['relevance_score'] for s in ranked]
+        assert all(a >= b for a, b in zip(scores, scores[1:]))
+    
+    # On a larger corpus, an index gives candidates their single-stage scores; without one TF-IDF is
+    # fitted on the candidates only, which approximates them
+    sections = SectionStore.from_sections(synthetic_sections(10, 10, seed=13))
+    job = "Review drug discovery benchmarks and protein binding"
+    for backend in ('tfidf', 'hashing'):
+        single = PersonaDrivenAnalyzer(fast_start=True, ranking_backend=backend)
+        two_stage = PersonaDrivenAnalyzer(fast_start=True, ranking_backend=backend, rerank_candidates=100)
+        keywords = (single._extract_persona_keywords(persona), single._extract_job_keywords(job))
+        
+        expected = {(s['document'], s['page'], s['section_title']): s['relevance_score']
+                    for s in single._rank_sections(sections, *keywords, job)}
+        top = [(s['document'], s['page'], s['section_title'], s['relevance_score'])
+               for s in two_stage._rank_sections(sections, *keywords, job, top_k=20)]
+        single_top = sorted(expected, key=lambda key: -expected[key])[:20]
+        overlap = len({entry[:3] for entry in top} & set(single_top))
+        error = max(abs(expected[entry[:3]] - entry[3]) for entry in top)
+        print(f"{backend}: {len(sections)} sections, top-20 overlap {overlap}, largest score error {error:.3f}")
+        
+        if backend == 'hashing':
+            assert [entry[:3] for entry in top] == single_top and error < 1e-9
+        else:
+            assert overlap >= 16 and error < 0.1
+
+def test_subsection_engine():
+    """
+    Test sentence-window sub-section scoring
+    """
+    print("\n" + "="*50)
+    print("Testing sub-section engine...")
+    
+    # Split on full stops so the test does not depend on NLTK data
+    def sentence_spans(text):
+        return [match.span() for match in re.finditer(r'\S[^.]*\.', text)]
+    
+    section = {
+        'document': 'test.pdf',
+        'page': 3,
+        'content': 'Neural nets learn. They use layers. Weights change. Drugs bind targets. Screening is slow. '
+                   'Proteins fold. Networks generalize.'
+    }
+    
+    engine = SubsectionEngine(sentence_spans=sentence_spans)
+    sub_sections = engine.extract([section], ['neural', 'network'], ['drug'])[0]
+    print(f"Windows: {[s['refined_text'] for s in sub_sections]}")
+    
+    assert engine.window_bounds(7)[0].tolist() == [0, 3, 6]
+    assert [s['relevance_score'] for s in sub_sections] == [0.6, 0.4, 0.4]
+    assert sub_sections[0]['refined_text'].startswith('Drugs bind targets.')
+    assert sub_sections[2]['refined_text'] == 'Networks generalize.'
+    
+    sliding = SubsectionEngine(window_size=2, window_step=1, sentence_spans=sentence_spans)
+    assert sliding.window_bounds(4)[0].tolist() == [0, 1, 2]
+
+def make_chars(text, top, size, fontname='Times-Roman', x0=72.0):
+    """
+    Build pdfplumber-style character dicts for one line of text
+    """
+    chars = []
+    for ch in text:
+        width = size * 0.5
+        if ch != ' ':
+            chars.append({'text': ch, 'top': top, 'x0': x0, 'x1': x0 + width, 'size': size,
+                          'fontname': fontname, 'upright': True})
+        x0 += width
+    return chars
+
+def test_layout_heading_detection():
+    """
+    Test font-based heading detection on synthetic page characters
+    """
+    print("\n" + "="*50)
+    print("Testing layout heading detection...")
+    
+    chars = make_chars("Methods and Materials", 100, 16, 'Times-Bold')
+    for i in range(6):
+        chars += make_chars("plain body text line with several words", 130 + i * 14, 10)
+    chars += make_chars("Data collection", 230, 10, 'Times-Bold')
+    chars += make_chars("more body text follows the run-in heading", 244, 10)
+    
+    lines = LayoutHeadingDetector().page_lines(chars, page_height=792)
+    headings = [(text, level) for text, level in lines if level]
+    print(f"Detected headings: {headings}")
+    
+    assert headings == [("Methods and Materials", 1), ("Data collection", 4)]
+    assert lines[1] == ("plain body text line with several words", None)
+    
+    # A running header is dropped after its first page; a heading recurring elsewhere is kept
+    detector = LayoutHeadingDetector()
+    page_headings = []
+    for page, heading_top in enumerate((100, 300, 500)):
+        chars = make_chars("Journal of Synthetic Tests", 60, 16, 'Times-Bold')
+        chars += make_chars("Introduction", heading_top, 16, 'Times-Bold')
+        for i in range(6):
+            chars += make_chars("plain body text line with several words", heading_top + 30 + i * 14, 10)
+        page_headings.append([text for text, level in detector.page_lines(chars, page_height=792) if level])
+    print(f"Headings per page: {page_headings}")
+    
+    assert page_headings == [["Journal of Synthetic Tests", "Introduction"], ["Introduction"], ["Introduction"]]
+
+def test_extraction_cache():
+    """
+    Test that cached sections round-trip and are keyed by content
+    """
+    print("\n" + "="*50)
+    print("Testing extraction cache...")
+    
+    cache_dir = tempfile.mkdtemp()
+    try:
+        pdf_path = os.path.join(cache_dir, 'doc.pdf')
+        with open(pdf_path, 'wb') as f:
+            f.write(b'%PDF-1.4 test document')
+        
+        cache = ExtractionCache(cache_dir, extractor_version='test')
+        key = cache.key_for(pdf_path)
+        sections = [{'document': 'doc.pdf', 'page': 2, 'section_title': 'Methods', 'heading_level': 1, 'content': 'Text', 'importance_rank': 0}]
+        
+        assert cache.get(key, 'doc.pdf') is None
+        cache.put(key, sections)
+        assert cache.get(key, 'renamed.pdf')[0]['document'] == 'renamed.pdf'
+        assert cache.get(key, 'doc.pdf') == sections
+        assert ExtractionCache(cache_dir, extractor_version='other').key_for(pdf_path) != key
+        print("✓ Cache round-trip and version keying")
+        
+        # The running size total evicts the least recently used entries once over budget
+        entry_size = os.path.getsize(cache._entry_path(key))
+        os.utime(cache._entry_path(key), (1000, 1000))
+        small = ExtractionCache(cache_dir, max_bytes=entry_size * 2, extractor_version='test')
+        for i, name in enumerate(('b', 'c', 'd'), start=2):
+            small.put(name, sections)
+            os.utime(small._entry_path(name), (i * 1000, i * 1000))
+        remaining = sorted(name for name in os.listdir(cache_dir) if name.endswith('.json.gz'))
+        assert remaining == ['c.json.gz', 'd.json.gz']
+        assert small._size == entry_size * 2
+        print("✓ Least recently used entries evicted")
+    finally:
+        shutil.rmtree(cache_dir)
+
+def test_section_store():
+    """
+    Test that the columnar section store round-trips sections and their keyword matchers
+    through memory and disk
+    """
+    print("\n" + "="*50)
+    print("Testing section store...")
+    
+    sections = [
+        {'document': 'a.pdf', 'page': 1, 'section_title': 'Résumé', 'heading_level': 1, 'content': 'Naïve café text.'},
+        {'document': 'b.pdf', 'page': 4, 'section_title': '', 'heading_level': None, 'content': 'Untitled content.'},
+        {'document': 'a.pdf', 'page': 7, 'section_title': 'Methods', 'heading_level': 2, 'content': 'Layers and weights.'}
+    ]
+    
+    store_dir = tempfile.mkdtemp()
+    try:
+        store = SectionStore.from_sections(iter(sections))
+        store.save(store_dir)
+        loaded = SectionStore.load(store_dir)
+        print(f"Documents: {loaded.documents}, sections: {len(loaded)}")
+        
+        assert loaded.documents == ['a.pdf', 'b.pdf']
+        assert [{k: s[k] for k in sections[0]} for s in loaded] == sections
+        assert list(loaded.texts()) == [f"{s['section_title']} {s['content']}" for s in sections]
+        
+        # Matchers are saved with the store and follow it through slicing and joining
+        keyword_lists = [['café', 'layers'], ['content', 'naïve', 'weights']]
+        joined = SectionStore.concat([loaded.select(1, 3), SectionStore.from_sections(sections[:1])])
+        for part in (loaded, loaded.select(1, 3), joined):
+            assert part.keyword_matchers is not None
+            assert part.keyword_matchers[0].counts(keyword_lists).tolist() == \
+                keyword_match_counts(list(part.texts()), keyword_lists).tolist()
+            assert part.keyword_matchers[1].counts(keyword_lists).tolist() == \
+                keyword_match_counts(list(part.titles()), keyword_lists).tolist()
+    finally:
+        shutil.rmtree(store_dir)
+
+def test_corpus_index():
+    """
+    Test that a persisted index scores queries like the freshly fitted one
+    """
+    print("\n" + "="*50)
+    print("Testing persistent corpus index...")
+    
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    
+    sections = [
+        {'document': 'a.pdf', 'page': 1, 'section_title': 'Neural Networks', 'content': 'Layers of neurons learn weights from data.'},
+        {'document': 'a.pdf', 'page': 2, 'section_title': 'Drug Discovery', 'content': 'Molecular compounds are screened against targets.'},
+        {'document': 'b.pdf', 'page': 1, 'section_title': 'Conclusion', 'content': 'Future work will improve accuracy.'}
+    ]
+    queries = ["how do neural networks learn", "molecular drug screening"]
+    
+    index_dir = tempfile.mkdtemp()
+    try:
+        index = CorpusIndex.build(['a.pdf', 'b.pdf'], sections, TfidfVectorizer(max_features=1000, stop_words='english'))
+        index.save(index_dir)
+        loaded = CorpusIndex.load(index_dir)
+        
+        expected = index.similarity(queries)
+        actual = loaded.similarity(queries)
+        print(f"Best sections per query: {actual.argmax(axis=1).tolist()}")
+        
+        assert loaded.documents == ['a.pdf', 'b.pdf']
+        assert [(s['document'], s['page'], s['section_title'], s['content']) for s in loaded.sections] == \
+            [(s['document'], s['page'], s['section_title'], s['content']) for s in sections]
+        assert abs(expected - actual).max() < 1e-12
+        assert actual.argmax(axis=1).tolist() == [0, 1]
+    finally:
+        shutil.rmtree(index_dir)
+
+def test_incremental_index():
+    """
+    Test that incremental updates only extract changed files and match an index fitted from scratch
+    """
+    print("\n" + "="*50)
+    print("Testing incremental index updates...")
+    
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    
+    work_dir = tempfile.mkdtemp()
+    input_dir = os.path.join(work_dir, 'input')
+    index_dir = os.path.join(work_dir, 'index')
+    os.makedirs(input_dir)
+    
+    # Each fake PDF holds one section per line
+    def write(filename, lines):
+        with open(os.path.join(input_dir, filename), 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines))
+    
+    extracted = []
+    def extract(pdf_paths):
+        extracted.extend(os.path.basename(path) for path in pdf_paths)
+        documents_data = []
+        for path in pdf_paths:
+            with open(path, 'r', encoding='utf-8') as f:
+                lines = f.read().split('\n')
+            documents_data.append({'filename': os.path.basename(path), 'sections': [
+                {'document': os.path.basename(path), 'page': i + 1, 'section_title': line.split()[0],
+                 'heading_level': 1, 'content': line}
+                for i, line in enumerate(lines)
+            ]})
+        return documents_data
+    
+    vectorizer = TfidfVectorizer(max_features=8, stop_words='english')
+    queries = ["neural network training", "molecular drug screening"]
+    
+    def update_and_compare():
+        del extracted[:]
+        pdf_paths = [os.path.join(input_dir, name) for name in sorted(os.listdir(input_dir))]
+        index, counts = IncrementalIndex(index_dir, vectorizer).update(pdf_paths, extract)
+        
+        sections = [section for doc_data in extract(pdf_paths) for section in doc_data['sections']]
+        expected = CorpusIndex.build(sorted(os.listdir(input_dir)), sections, vectorizer)
+        
+        assert index.vectorizer.vocabulary_ == expected.vectorizer.vocabulary_
+        assert abs(index.matrix - expected.matrix).max() < 1e-12
+        assert abs(CorpusIndex.load(index_dir).similarity(queries) - expected.similarity(queries)).max() < 1e-12
+        assert [s['content'] for s in index.sections] == [s['content'] for s in sections]
+        
+        # Keyword matchers carried across updates still match the current sections
+        loaded = CorpusIndex.load(index_dir).sections
+        keyword_lists = [['neural', 'drug'], ['screen', 'networks']]
+        assert loaded.keyword_matchers[0].counts(keyword_lists).tolist() == \
+            keyword_match_counts(list(loaded.texts()), keyword_lists).tolist()
+        return counts, extracted[:len(extracted) - len(pdf_paths)]
+    
+    try:
+        write('a.pdf', ['Neural networks learn weights', 'Training data for neural models'])
+        write('b.pdf', ['Molecular compounds screened against targets'])
+        counts, updated = update_and_compare()
+        assert counts['added'] == 2 and updated == ['a.pdf', 'b.pdf']
+        
+        write('c.pdf', ['Drug screening pipelines', 'Accuracy benchmarks and datasets'])
+        os.remove(os.path.join(input_dir, 'b.pdf'))
+        os.utime(os.path.join(input_dir, 'a.pdf'), ns=(0, 0))
+        counts, updated = update_and_compare()
+        print(f"Second update: {counts}, extracted {updated}")
+        
+        # a.pdf only got a new timestamp, so its content hash keeps it from being extracted again
+        assert counts == {'added': 1, 'modified': 0, 'removed': 1, 'unchanged': 1}
+        assert updated == ['c.pdf']
+        
+        write('a.pdf', ['Convolutional networks for images'])
+        counts, updated = update_and_compare()
+        assert counts['modified'] == 1 and updated == ['a.pdf']
+    finally:
+        shutil.rmtree(work_dir)
+
+def test_hashing_index():
+    """
+    Test that hashed sections streamed in chunks score like a store indexed at once, before and after saving
+    """
+    print("\n" + "="*50)
+    print("Testing hashing ranking backend...")
+    
+    sections = [
+        {'document': 'a.pdf', 'page': 1, 'section_title': 'Neural Networks', 'content': 'Layers of neurons learn weights from data.'},
+        {'document': 'a.pdf', 'page': 2, 'section_title': 'Drug Discovery', 'content': 'Molecular compounds are screened against targets.'},
+        {'document': 'b.pdf', 'page': 1, 'section_title': 'Conclusion', 'content': 'Future work will improve accuracy.'}
+    ]
+    queries = ["how do neural networks learn", "molecular drug screening"]
+    
+    index_dir = tempfile.mkdtemp()
+    try:
+        streamed = HashingIndex.build(['a.pdf', 'b.pdf'], iter(sections), n_features=2 ** 12, chunk_size=2)
+        stored = HashingIndex.build(['a.pdf', 'b.pdf'], SectionStore.from_sections(sections), n_features=2 ** 12)
+        streamed.save(index_dir)
+        loaded = load_index(index_dir)
+        
+        expected = stored.similarity(queries)
+        print(f"Best sections per query: {expected.argmax(axis=1).tolist()}")
+        
+        assert isinstance(loaded, HashingIndex)
+        assert [s['content'] for s in streamed.sections] == [s['content'] for s in sections]
+        assert abs(streamed.similarity(queries) - expected).max() < 1e-12
+        assert abs(loaded.similarity(queries) - expected).max() < 1e-12
+        assert expected.argmax(axis=1).tolist() == [0, 1]
+        
+        analyzer = PersonaDrivenAnalyzer(ranking_backend='hashing', hash_features=2 ** 12, fast_start=True)
+        ranked = analyzer._rank_sections(sections, ['molecular'], ['drug'], 'molecular drug screening')
+        assert ranked[0]['section_title'] == 'Drug Discovery'
+    finally:
+        shutil.rmtree(index_dir)
+
+def test_bm25_index():
+    """
+    Test that pruned BM25 top-k queries return exactly the best sections of an exhaustive scoring
+    """
+    print("\n" + "="*50)
+    print("Testing BM25 inverted index...")
+    
+    import random
+    import numpy as np
+    from nltk.stem import PorterStemmer
+    
+    rng = random.Random(7)
+    words = ['network', 'learning', 'molecular', 'protein', 'training', 'dataset', 'analysis', 'results',
+             'method', 'compound', 'screening', 'accuracy', 'benchmark', 'layers', 'neurons', 'review']
+    sections = [
+        {'document': f'doc{i % 3}.pdf', 'page': i + 1, 'section_title': rng.choice(words).title(),
+         'content': ' '.join(rng.choices(words, weights=range(len(words), 0, -1), k=rng.randint(3, 40)))}
+        for i in range(300)
+    ]
+    stemmer = PorterStemmer()
+    
+    index_dir = tempfile.mkdtemp()
+    try:
+        index = BM25Index.build(['doc0.pdf', 'doc1.pdf', 'doc2.pdf'], iter(sections), stemmer.stem, set())
+        index.save(index_dir)
+        loaded = load_index(index_dir)
+        assert isinstance(loaded, BM25Index)
+        
+        for _ in range(50):
+            query = index.query_terms(rng.sample(words, rng.randint(1, 5)), stemmer.stem)
+            scores = index.scores(query)
+            for k in (1, 10, 50):
+                expected = [i for i in np.lexsort((np.arange(len(scores)), -scores)) if scores[i] > 0][:k]
+                best, best_scores = loaded.top_k(query, k)
+                assert best.tolist() == expected
+                assert abs(best_scores - scores[expected]).max() < 1e-12
+        
+        analyzer = PersonaDrivenAnalyzer(ranking_backend='bm25', fast_start=True)
+        ranked = analyzer._rank_sections(sections[:3] + [
+            {'document': 'd.pdf', 'page': 1, 'section_title': 'Drug Discovery', 'content': 'Molecular compounds are screened.'}
+        ], ['molecular'], ['screen'], 'molecular screening', top_k=2)
+        print(f"Top BM25 section: {ranked[0]['section_title']}")
+        assert ranked[0]['section_title'] == 'Drug Discovery' and len(ranked) == 2
+    finally:
+        shutil.rmtree(index_dir)
+
+def test_sharded_collection():
+    """
+    Test that ranking a sharded collection with global IDF matches one index over all of its sections
+    """
+    print("\n" + "="*50)
+    print("Testing sharded collections...")
+    
+    assert parse_collection_spec("papers=/data/papers") == ('papers', '/data/papers')
+    assert parse_collection_spec("reports") == ('reports', None)
+    try:
+        parse_collection_spec("../escape")
+        assert False, "path-like collection names must be rejected"
+    except ValueError:
+        pass
+    
+    texts = [
+        "Neural networks predict protein structure from sequence data.",
+        "Quarterly revenue grew with stable operating margins.",
+        "Drug discovery pipelines screen molecular compounds with neural networks.",
+        "Protein folding benchmarks compare deep learning methods.",
+        "Office relocation schedule and parking allocation.",
+        "Graph neural networks model molecular interactions for drug discovery."
+    ]
+    sections = [
+        {'document': f"doc{i // 2}.pdf", 'page': i % 2 + 1, 'section_title': f"Section {i}", 'content': text}
+        for i, text in enumerate(texts)
+    ]
+    documents = ['doc0.pdf', 'doc1.pdf', 'doc2.pdf']
+    persona, job = "Researcher in Computational Biology", "Review neural networks for drug discovery"
+    analyzer = PersonaDrivenAnalyzer(fast_start=True, ranking_backend='hashing', hash_features=2 ** 12)
+    keywords = (analyzer._extract_persona_keywords(persona), analyzer._extract_job_keywords(job))
+    
+    whole = HashingIndex.build(documents, sections, n_features=2 ** 12)
+    expected = analyzer._rank_sections(whole.sections, *keywords, job, whole, top_k=4)
+    
+    collections_dir = tempfile.mkdtemp()
+    try:
+        collection = ShardedCollection.create(collections_dir, 'papers', 2 ** 12)
+        for shard_documents in (documents[:2], documents[2:]):
+            collection.add_shard(HashingIndex.build(
+                shard_documents, [s for s in sections if s['document'] in shard_documents], n_features=2 ** 12
+            ))
+        
+        loaded = ShardedCollection.load(collections_dir, 'papers')
+        assert loaded.documents == documents and loaded.section_count == len(sections)
+        statistics = ShardedCollection.term_statistics([loaded])
+        assert abs(ShardedCollection.idf(*statistics, 2 ** 12) - whole.idf).max() < 1e-12
+        
+        # Shards keep their keyword token data, so ranking them does not tokenize their sections again
+        shards = [(shard_dir, '') for shard_dir in loaded.shard_dirs()]
+        assert all(HashingIndex.load(shard_dir).sections.keyword_matchers is not None for shard_dir, _ in shards)
+        actual = analyzer._rank_shards(shards, statistics, *keywords, job)[:4]
+        print(f"Top sections: {[s['section_title'] for s in actual]}")
+        assert [s['section_title'] for s in actual] == [s['section_title'] for s in expected]
+        assert all(abs(a['relevance_score'] - b['relevance_score']) < 1e-9 for a, b in zip(actual, expected))
+        assert [s['importance_rank'] for s in actual] == [1, 2, 3, 4]
+        
+        output_file = os.path.join(collections_dir, 'analysis.json')
+        analyzer.query_collections(['papers'], collections_dir, persona, job, output_file)
+        with open(output_file, 'r', encoding='utf-8') as f:
+            output = json.load(f)
+        assert output['metadata']['input_documents'] == documents
+        assert output['extracted_sections'][0]['section_title'] == expected[0]['section_title']
+        
+        # Two-stage ranking of shards larger than the candidate count still merges in score order
+        sections = synthetic_sections(4, 6, seed=17)
+        documents = sorted({s['document'] for s in sections})
+        whole = HashingIndex.build(documents, sections, n_features=2 ** 12)
+        expected = analyzer._rank_sections(whole.sections, *keywords, job, whole, top_k=5)
+        
+        collection = ShardedCollection.create(collections_dir, 'synthetic', 2 ** 12)
+        for shard_documents in (documents[:2], documents[2:]):
+            collection.add_shard(HashingIndex.build(
+                shard_documents, [s for s in sections if s['document'] in shard_documents], n_features=2 ** 12
+            ))
+        assert min(shard['sections'] for shard in collection.shards) > 10
+        
+        two_stage = PersonaDrivenAnalyzer(fast_start=True, ranking_backend='hashing', hash_features=2 ** 12,
+                                          rerank_candidates=10)
+        statistics = ShardedCollection.term_statistics([collection])
+        shards = [(shard_dir, '') for shard_dir in collection.shard_dirs()]
+        actual = two_stage._rank_shards(shards, statistics, *keywords, job)
+        scores = [s['relevance_score'] for s in actual]
+        print(f"Two-stage shards: {len(sections)} sections, top scores {[round(s, 3) for s in scores[:5]]}")
+        assert len(actual) == two_stage._ranked_count
+        assert all(a >= b for a, b in zip(scores, scores[1:]))
+        assert [s['importance_rank'] for s in actual] == list(range(1, len(actual) + 1))
+        assert [(s['document'], s['page'], s['section_title']) for s in actual[:5]] == \
+            [(s['document'], s['page'], s['section_title']) for s in expected]
+    finally:
+        shutil.rmtree(collections_dir)
+
+def test_pipeline_metrics():
+    """
+    Test stage timings, the metrics block of the output and the opt-in profilers
+    """
+    print("\n" + "="*50)
+    print("Testing pipeline metrics...")
+    
+    metrics = PipelineMetrics()
+    for _ in range(2):
+        with metrics.stage('extraction'):
+            sum(range(10000))
+    metrics.record_document('a.pdf', 3, 5, 0.25)
+    metrics.record_document('b.pdf', None, 2, 0.0, cached=True)
+    
+    snapshot = metrics.to_dict()
+    assert snapshot['stages']['extraction']['calls'] == 2
+    assert snapshot['stages']['extraction']['wall_seconds'] > 0
+    assert snapshot['totals']['pages'] == 3 and snapshot['totals']['sections'] == 7
+    
+    # Only the latest documents are listed; the totals still cover all of them
+    bounded = PipelineMetrics(max_documents=2)
+    for i in range(5):
+        bounded.record_document(f"{i}.pdf", 1, 2, 0.1)
+    snapshot = bounded.to_dict()
+    assert [document['filename'] for document in snapshot['documents']] == ['3.pdf', '4.pdf']
+    assert snapshot['totals']['documents'] == 5 and snapshot['totals']['sections'] == 10
+    
+    analyzer = PersonaDrivenAnalyzer(fast_start=True, collect_metrics=True)
+    sections = SectionStore.from_sections([
+        {'document': 'a.pdf', 'page': 1, 'section_title': 'Neural Networks',
+         'content': 'Neural networks learn weights. Training uses data. Layers stack neurons.'}
+    ])
+    output = analyzer.analyze_sections([{'filename': 'a.pdf'}], sections, 'Student', 'Learn neural networks')
+    print(f"Stages: {sorted(output['metrics']['stages'])}")
+    assert {'keywords', 'ranking', 'subsections'} <= set(output['metrics']['stages'])
+    assert output['metrics']['counters']['sections'] == 1
+    json.dumps(output)
+    
+    work_dir = tempfile.mkdtemp()
+    try:
+        metrics.save(os.path.join(work_dir, 'metrics.json'))
+        with open(os.path.join(work_dir, 'metrics.json'), 'r', encoding='utf-8') as f:
+            assert json.load(f)['documents'][0]['filename'] == 'a.pdf'
+        
+        for profiler, filename in (('cprofile', 'run.prof'), ('tracemalloc', 'run.txt')):
+            with profiled(profiler, os.path.join(work_dir, filename), limit=3):
+                sorted(str(i) for i in range(1000))
+            assert os.path.getsize(os.path.join(work_dir, filename)) > 0
+    finally:
+        shutil.rmtree(work_dir)
+
+def test_synthetic_corpus():
+    """
+    Test that generated benchmark PDFs are deterministic and yield sections with both heading detectors
+    """
+    print("\n" + "="*50)
+    print("Testing synthetic benchmark corpus...")
+    
+    work_dir = tempfile.mkdtemp()
+    try:
+        first = generate_corpus(os.path.join(work_dir, 'a'), 2, 2, seed=7)
+        second = generate_corpus(os.path.join(work_dir, 'b'), 2, 2, seed=7)
+        for path_a, path_b in zip(first, second):
+            with open(path_a, 'rb') as fa, open(path_b, 'rb') as fb:
+                assert fa.read() == fb.read()
+        
+        for heading_detector in ('regex', 'layout'):
+            analyzer = PersonaDrivenAnalyzer(fast_start=True, heading_detector=heading_detector)
+            document = analyzer._extract_document_content(first[0])
+            print(f"{heading_detector}: {len(document['sections'])} sections from {document['stats']['pages']} pages")
+            assert document['stats']['pages'] == 2
+            assert len(document['sections']) >= 4
+    finally:
+        shutil.rmtree(work_dir)
+
+class FailingAnalyzer(PersonaDrivenAnalyzer):
+    # Raises in the worker for documents named broken*, as a crashing extraction would
+    def _extract_document_content(self, pdf_path, *args, **kwargs):
+        if os.path.basename(pdf_path).startswith('broken'):
+            raise RuntimeError("worker failed")
+        return super()._extract_document_content(pdf_path, *args, **kwargs)
+
+def test_parallel_extraction():
+    """
+    Test that extraction in a process pool matches sequential extraction and survives a failing document
+    """
+    print("\n" + "="*50)
+    print("Testing parallel extraction...")
+    
+    work_dir = tempfile.mkdtemp()
+    try:
+        pdf_paths = generate_corpus(os.path.join(work_dir, 'corpus'), 2, 2, seed=3)
+        broken_path = os.path.join(work_dir, 'corpus', 'broken.pdf')
+        shutil.copyfile(pdf_paths[0], broken_path)
+        pdf_paths = [pdf_paths[0], broken_path, pdf_paths[1]]
+        
+        sequential = FailingAnalyzer(fast_start=True)._extract_documents([pdf_paths[0], pdf_paths[2]])
+        parallel = FailingAnalyzer(fast_start=True, workers=2)._extract_documents(pdf_paths)
+        print(f"Parallel results: {[(d['filename'], len(d['sections']), d.get('error')) for d in parallel]}")
+        
+        assert [d['filename'] for d in parallel] == ['doc_0000.pdf', 'broken.pdf', 'doc_0001.pdf']
+        assert parallel[1]['sections'] == [] and parallel[1]['error'] == "worker failed"
+        for expected, document in zip(sequential, (parallel[0], parallel[2])):
+            assert document['sections'] == expected['sections'] and document['sections']
+            assert 'error' not in document
+    finally:
+        shutil.rmtree(work_dir)
+
+def test_extraction_budget():
+    """
+    Test page ranges, the global page budget and skim mode on a synthetic corpus
+    """
+    print("\n" + "="*50)
+    print("Testing budgeted extraction...")
+    
+    assert parse_page_range('1-50') == (1, 50)
+    assert parse_page_range('10-') == (10, None)
+    assert parse_page_range('3') == (1, 3)
+    for spec in ('0-5', '5-2', 'x'):
+        try:
+            parse_page_range(spec)
+            assert False, f"{spec} should be rejected"
+        except ValueError:
+            pass
+    
+    budget = ExtractionBudget(max_pages=5)
+    assert [child.pages_left for child in budget.allot([3, 0, 4, 2])] == [3, None, 2, 0]
+    assert budget.exhausted
+    
+    work_dir = tempfile.mkdtemp()
+    try:
+        pdf_paths = generate_corpus(os.path.join(work_dir, 'corpus'), 3, 3, seed=11)
+        
+        analyzer = PersonaDrivenAnalyzer(fast_start=True, page_range=(2, 3))
+        document = analyzer._extract_document_content(pdf_paths[0])
+        assert document['stats']['pages'] == 2 and document['stats']['total_pages'] == 3
+        assert 'truncated' not in document
+        assert all(section['page'] >= 2 for section in document['sections'])
+        
+        analyzer = PersonaDrivenAnalyzer(fast_start=True)
+        budget = ExtractionBudget(max_pages=4)
+        documents = analyzer._extract_documents(pdf_paths, budget)
+        print(f"Pages per document with a budget of 4: {[d['stats']['pages'] for d in documents]}")
+        assert [d['stats']['pages'] for d in documents] == [3, 1, 0]
+        assert [d.get('truncated', False) for d in documents] == [False, True, True]
+        assert budget.to_dict()['budget_exhausted']
+        
+        output_file = os.path.join(work_dir, 'skim.json')
+        analyzer = PersonaDrivenAnalyzer(fast_start=True, skim_pages=1, skim_deepen=1)
+        analyzer.process_documents(os.path.join(work_dir, 'corpus'), "PhD Researcher",
+                                   "Review drug discovery benchmarks", output_file)
+        with open(output_file, 'r', encoding='utf-8') as f:
+            extraction = json.load(f)['extraction']
+        print(f"Deepened: {extraction['deepened_documents']}")
+        assert len(extraction['deepened_documents']) == 1
+        assert len(extraction['partial_documents']) == 2
+        
+        # Skimmed pages of a deepened document are charged once: 3 skimmed pages plus 2 more fit a budget of 5
+        analyzer = PersonaDrivenAnalyzer(fast_start=True, skim_pages=1, skim_deepen=1, page_budget=5)
+        analyzer.process_documents(os.path.join(work_dir, 'corpus'), "PhD Researcher",
+                                   "Review drug discovery benchmarks", output_file)
+        with open(output_file, 'r', encoding='utf-8') as f:
+            extraction = json.load(f)['extraction']
+        partial = [document['document'] for document in extraction['partial_documents']]
+        assert extraction['pages_extracted'] == 5
+        assert extraction['deepened_documents'][0] not in partial and len(partial) == 2
+        
+        # Pages before the first bookmark are never read, in worker processes as in the serial run
+        body = "Molecular docking screens compound libraries against protein targets."
+        pages = [[(body, False)], [("1. Background", True), (body, False)], [("2. Methods", True), (body, False)]]
+        bookmarked = [os.path.join(work_dir, f'bookmarked_{i}.pdf') for i in range(2)]
+        for pdf_path in bookmarked:
+            write_pdf(pdf_path, pages, bookmarks=True)
+        pdf_paths = bookmarked + pdf_paths[:1]
+        
+        runs = []
+        for workers in (1, 2):
+            analyzer = PersonaDrivenAnalyzer(fast_start=True, workers=workers)
+            documents = analyzer._extract_documents_uncached(pdf_paths, ExtractionBudget(max_pages=5))
+            runs.append([(d['stats']['pages'], d.get('truncated', False), d['sections']) for d in documents])
+        print(f"Budgeted pages, serial and pooled: {[[run[0] for run in r] for r in runs]}")
+        assert [run[0] for run in runs[0]] == [2, 2, 1]
+        assert runs[0] == runs[1]
+    finally:
+        shutil.rmtree(work_dir)
+
+def test_outline_sections():
+    """
+    Test that bookmarks define sections when present, including headings the heuristics miss,
+    and that an unbookmarked bibliography still ends the last outlined section
+    """
+    print("\n" + "="*50)
+    print("Testing outline-driven sections...")
+    
+    body = "Gradient descent converges on convex problems under mild assumptions."
+    pages = [
+        [("1. Background", True), (body, False), ("Why neural networks generalize", True), (body, False)],
+        [("2. Methods", True), (body, False), (body, False), ("References", False), ("Smith, J. Learning. 2020.", False)]
+    ]
+    
+    work_dir = tempfile.mkdtemp()
+    try:
+        bookmarked = os.path.join(work_dir, 'bookmarked.pdf')
+        plain = os.path.join(work_dir, 'plain.pdf')
+        write_pdf(bookmarked, pages, bookmarks=True)
+        write_pdf(plain, pages)
+        
+        import pdfplumber
+        with pdfplumber.open(bookmarked) as pdf:
+            outline = DocumentOutline.from_pdf(pdf)
+            assert [(entry.page_index, entry.title) for entry in outline.entries] == [
+                (0, '1. Background'), (0, 'Why neural networks generalize'), (1, '2. Methods')
+            ]
+        with pdfplumber.open(plain) as pdf:
+            assert DocumentOutline.from_pdf(pdf) is None
+        
+        analyzer = PersonaDrivenAnalyzer(fast_start=True)
+        sections = analyzer._extract_document_content(bookmarked)['sections']
+        print(f"Outline sections: {[(s['page'], s['section_title']) for s in sections]}")
+        assert [s['section_title'] for s in sections] == [
+            '1. Background', 'Why neural networks generalize', '2. Methods', 'References'
+        ]
+        assert sections[0]['content'] == body and sections[2]['page'] == 2
+        assert sections[2]['content'] == f"{body} {body}"
+        
+        # Without bookmarks (or with them ignored) the unnumbered mixed-case heading is body text
+        for pdf_path, use_outline in ((plain, True), (bookmarked, False)):
+            analyzer = PersonaDrivenAnalyzer(fast_start=True, use_outline=use_outline)
+            sections = analyzer._extract_document_content(pdf_path)['sections']
+            assert [s['section_title'] for s in sections] == ['1. Background', '2. Methods', 'References']
+    finally:
+        shutil.rmtree(work_dir)
+
+def test_near_duplicates():
+    """
+    Test that near-duplicate sections are collapsed into the first copy with their provenance kept
+    """
+    print("\n" + "="*50)
+    print("Testing near-duplicate deduplication...")
+    
+    abstract = ("Deep neural networks learn hierarchical representations of molecular data through many layers "
+                "of nonlinear units trained with backpropagation on large labelled drug discovery datasets.")
+    license_text = "This article is distributed under the terms of the Creative Commons Attribution License " * 3
+    sections = [
+        {'document': 'a.pdf', 'page': 1, 'section_title': 'Abstract', 'content': abstract},
+        {'document': 'a.pdf', 'page': 9, 'section_title': 'License', 'content': license_text},
+        {'document': 'b.pdf', 'page': 1, 'section_title': 'Abstract', 'content': abstract + " Version 2."},
+        {'document': 'b.pdf', 'page': 3, 'section_title': 'Methods', 'content': 'Gradient boosting ranks compounds.'},
+        {'document': 'c.pdf', 'page': 12, 'section_title': 'License', 'content': license_text}
+    ]
+    
+    near_duplicates = NearDuplicateFilter(threshold=0.8)
+    kept = list(near_duplicates.filter(iter(sections)))
+    print(f"Kept {len(kept)} of {len(sections)} sections, copies: {near_duplicates.copies}")
+    assert [(s['document'], s['page']) for s in kept] == [('a.pdf', 1), ('a.pdf', 9), ('b.pdf', 3)]
+    assert near_duplicates.copies == {
+        0: [{'document': 'b.pdf', 'page': 1, 'section_title': 'Abstract'}],
+        1: [{'document': 'c.pdf', 'page': 12, 'section_title': 'License'}]
+    }
+    
+    analyzer = PersonaDrivenAnalyzer(fast_start=True)
+    store, near_duplicates = analyzer._deduplicated(iter(sections))
+    store = SectionStore.from_sections(store)
+    analyzer._record_duplicates(store, near_duplicates)
+    output = analyzer.analyze_sections([{'filename': name} for name in ('a.pdf', 'b.pdf', 'c.pdf')], store,
+                                        "PhD Researcher", "Review neural networks for drug discovery")
+    top = output['extracted_sections'][0]
+    assert top['section_title'] == 'Abstract'
+    assert top['duplicates'] == [{'document': 'b.pdf', 'page_number': 1, 'section_title': 'Abstract'}]
+    
+    store_dir = tempfile.mkdtemp()
+    try:
+        store.save(store_dir)
+        loaded = SectionStore.load(store_dir)
+        assert loaded.duplicates == store.duplicates
+        assert SectionStore.concat([loaded.select(0, 1), loaded.select(1, 3)]).duplicates == store.duplicates
+        assert loaded.select(1, 3).duplicates == {0: store.duplicates[1]}
+    finally:
+        shutil.rmtree(store_dir)
+    
+    # Incremental updates collapse the same near-duplicates as a fresh build, also once an original is removed
+    work_dir = tempfile.mkdtemp()
+    try:
+        input_dir = os.path.join(work_dir, 'input')
+        pdf_paths = generate_corpus(input_dir, 2, 2, seed=9)
+        shutil.copyfile(pdf_paths[0], os.path.join(input_dir, 'doc_0002.pdf'))
+        persona, job = "PhD Researcher", "Review drug discovery benchmarks"
+        
+        def analysis(index_dir):
+            output_file = os.path.join(work_dir, 'analysis.json')
+            analyzer.query_index(index_dir, persona, job, output_file)
+            with open(output_file, 'r', encoding='utf-8') as f:
+                output = json.load(f)
+            output['metadata'].pop('processing_timestamp')
+            return output
+        
+        # Signatures are saved with the index, so an update only hashes the sections of changed files
+        hashed = []
+        signature = NearDuplicateFilter.signature
+        def counted_signature(near_duplicates, text):
+            hashed.append(text)
+            return signature(near_duplicates, text)
+        
+        for step in ('build', 'remove original', 'add copy'):
+            if step == 'remove original':
+                os.remove(pdf_paths[0])
+            if step == 'add copy':
+                shutil.copyfile(pdf_paths[1], os.path.join(input_dir, 'doc_0003.pdf'))
+            del hashed[:]
+            NearDuplicateFilter.signature = counted_signature
+            try:
+                analyzer.update_index(input_dir, os.path.join(work_dir, 'incremental'))
+            finally:
+                NearDuplicateFilter.signature = signature
+            if step == 'remove original':
+                assert hashed == []
+            elif step == 'add copy':
+                assert len(hashed) == len(analyzer._extract_document_content(pdf_paths[1])['sections'])
+            analyzer.build_index(input_dir, os.path.join(work_dir, step))
+            updated, built = analysis(os.path.join(work_dir, 'incremental')), analysis(os.path.join(work_dir, step))
+            duplicates = [s for s in updated['extracted_sections'] if 'duplicates' in s]
+            print(f"{step}: {len(duplicates)} ranked sections with near-duplicates")
+            assert updated == built
+            assert bool(duplicates) == (step != 'remove original')
+    finally:
+        shutil.rmtree(work_dir)
+
+def test_output_writer():
+    """
+    Test that streamed output matches json.dump, and the compact and JSON Lines encodings and output limits
+    """
+    print("\n" + "="*50)
+    print("Testing streaming output writer...")
+    
+    metadata = {'input_documents': ['a.pdf'], 'persona': 'Ph.D. Forscher', 'job_to_be_done': 'Review'}
+    entries = [
+        ({'document': 'a.pdf', 'page_number': 1, 'section_title': 'Intro', 'importance_rank': 1},
+         [{'document': 'a.pdf', 'refined_text': 'Über alles.', 'page_number': 1}]),
+        ({'document': 'a.pdf', 'page_number': 2, 'section_title': 'Methods', 'importance_rank': 2}, []),
+        ({'document': 'a.pdf', 'page_number': 3, 'section_title': 'Results', 'importance_rank': 3},
+         [{'document': 'a.pdf', 'refined_text': 'One.', 'page_number': 3},
+          {'document': 'a.pdf', 'refined_text': 'Two.', 'page_number': 3}])
+    ]
+    expected = {
+        'metadata': metadata,
+        'extracted_sections': [section for section, _ in entries],
+        'sub_section_analysis': [sub_section for _, sub_sections in entries for sub_section in sub_sections],
+        'metrics': {'stages': {}}
+    }
+    
+    output_dir = tempfile.mkdtemp()
+    try:
+        for output_format, sections in (('json', entries), ('json', []), ('compact', entries), ('jsonl', entries)):
+            output_file = os.path.join(output_dir, f"result.{output_format}")
+            with OutputWriter(output_file, output_format) as writer:
+                writer.begin(metadata)
+                for section, sub_sections in sections:
+                    writer.add_section(section, sub_sections)
+                writer.close({'metrics': {'stages': {}}})
+            
+            with open(output_file, 'r', encoding='utf-8') as f:
+                text = f.read()
+            if output_format == 'jsonl':
+                records = [json.loads(line) for line in text.splitlines()]
+                assert [next(iter(record)) for record in records] == [
+                    'metadata', 'extracted_section', 'sub_section', 'extracted_section',
+                    'extracted_section', 'sub_section', 'sub_section', 'metrics'
+                ]
+                assert records[-2] == {'sub_section': expected['sub_section_analysis'][-1]}
+            elif sections:
+                assert json.loads(text) == expected
+                assert text == json.dumps(expected, indent=2 if output_format == 'json' else None,
+                                          separators=None if output_format == 'json' else (',', ':'),
+                                          ensure_ascii=False)
+            else:
+                empty = {**expected, 'extracted_sections': [], 'sub_section_analysis': []}
+                assert text == json.dumps(empty, indent=2, ensure_ascii=False)
+        assert sorted(os.listdir(output_dir)) == ['result.compact', 'result.json', 'result.jsonl']
+        
+        # A failed run leaves no partial output behind
+        try:
+            with OutputWriter(os.path.join(output_dir, 'failed.json')) as writer:
+                writer.begin(metadata)
+                raise RuntimeError("ranking failed")
+        except RuntimeError:
+            pass
+        assert 'failed.json' not in os.listdir(output_dir) and 'failed.json.tmp' not in os.listdir(output_dir)
+    finally:
+        shutil.rmtree(output_dir)
+    
+    sections = SectionStore.from_sections([
+        {'document': 'a.pdf', 'page': i, 'section_title': f"Neural networks {i}",
+         'content': "Neural networks learn representations. " * 30}
+        for i in range(1, 41)
+    ])
+    analyzer = PersonaDrivenAnalyzer(fast_start=True, top_sections=5, output_sections=30, subsection_results=1,
+                                     refined_text_chars=50)
+    output = analyzer.analyze_sections([{'filename': 'a.pdf'}], sections, 'Student', 'Learn neural networks')
+    assert len(output['extracted_sections']) == 30
+    assert len(output['sub_section_analysis']) == 30
+    assert all(len(entry['refined_text']) == 53 for entry in output['sub_section_analysis'])
+
+def test_batch_query_loading():
+    """
+    Test parsing of batch query files in JSON and JSON Lines form
+    """
+    print("\n" + "="*50)
+    print("Testing batch query loading...")
+    
+    work_dir = tempfile.mkdtemp()
+    try:
+        jsonl_path = os.path.join(work_dir, 'queries.jsonl')
+        with open(jsonl_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'id': 'bio review', 'persona': 'Biologist', 'job': 'Review methods'}) + '\n')
+            f.write(json.dumps({'persona': 'Student', 'job_to_be_done': 'Exam preparation'}) + '\n')
+            f.write(json.dumps({'persona': 'Analyst'}) + '\n')
+        
+        json_path = os.path.join(work_dir, 'queries.json')
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump([{'persona': 'Analyst', 'job': 'Revenue trends'}], f)
+        
+        queries = PersonaDrivenAnalyzer._load_queries(jsonl_path)
+        print(f"Loaded queries: {[q['id'] for q in queries]}")
+        
+        assert [q['id'] for q in queries] == ['bio_review', 'query_002']
+        assert queries[1]['job_to_be_done'] == 'Exam preparation'
+        assert PersonaDrivenAnalyzer._load_queries(json_path)[0]['job_to_be_done'] == 'Revenue trends'
+        
+        # Two queries sharing an id against one corpus both get their own output
+        pdf_dir = os.path.join(work_dir, 'corpus')
+        generate_corpus(pdf_dir, 2, 2, seed=5)
+        batch = [
+            {'id': 'review', 'persona': 'PhD Researcher', 'job': 'Review drug discovery benchmarks'},
+            {'id': 'review', 'persona': 'Student', 'job': 'Prepare an exam on kinetics'}
+        ]
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(batch, f)
+        
+        analyzer = PersonaDrivenAnalyzer(fast_start=True)
+        analyzer.process_batch(json_path, os.path.join(work_dir, 'batch'), input_dir=pdf_dir)
+        assert sorted(os.listdir(os.path.join(work_dir, 'batch'))) == ['review.json', 'review_2.json']
+        
+        for query, filename in zip(batch, ('review.json', 'review_2.json')):
+            single_file = os.path.join(work_dir, 'single.json')
+            analyzer.process_documents(pdf_dir, query['persona'], query['job'], single_file)
+            outputs = []
+            for path in (os.path.join(work_dir, 'batch', filename), single_file):
+                with open(path, 'r', encoding='utf-8') as f:
+                    output = json.load(f)
+                output['metadata'].pop('processing_timestamp')
+                outputs.append(output)
+            assert outputs[0]['metadata']['persona'] == query['persona']
+            assert outputs[0] == outputs[1]
+        print("✓ Duplicate ids get separate outputs matching single queries")
+    finally:
+        shutil.rmtree(work_dir)
+
+def test_keyword_matcher():
+    """
+    Test that vectorized keyword counts and the direct scan match plain substring counting
+    """
+    print("\n" + "="*50)
+    print("Testing keyword matcher...")
+    
+    texts = [
+        "Neural Networks learn representations",
+        "Protein folding and drug-target binding",
+        "",
+        "networking events for analysts"
+    ]
+    keyword_lists = [['network', 'learn', 'learn'], ['drug', 'bind', 'folding and'], []]
+    
+    counts = KeywordMatcher(texts).counts(keyword_lists)
+    expected = [[sum(1 for keyword in keywords if keyword in text.lower()) for keywords in keyword_lists]
+                for text in texts]
+    print(f"Counts: {counts.tolist()}")
+    
+    assert counts.tolist() == expected
+    assert keyword_match_counts(texts, keyword_lists).tolist() == expected
+    
+    keywords = ['network', 'folding and', 'xyz']
+    assert keyword_presence(texts, keywords).tolist() == KeywordMatcher(texts).presence(keywords).tolist()
+
+def test_analysis_server():
+    """
+    Test the analysis server over a Unix socket against a persisted index
+    """
+    print("\n" + "="*50)
+    print("Testing analysis server...")
+    
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    
+    sections = [
+        {'document': 'a.pdf', 'page': 1, 'section_title': 'Neural Networks', 'content': 'Layers of neurons learn weights from data.'},
+        {'document': 'b.pdf', 'page': 2, 'section_title': 'Drug Discovery', 'content': 'Molecular compounds are screened against targets.'}
+    ]
+    
+    def http_request(method, path, body=None):
+        payload = json.dumps(body).encode('utf-8') if body is not None else b''
+        return f"{method} {path} HTTP/1.1\r\nContent-Length: {len(payload)}\r\n\r\n".encode('latin-1') + payload
+    
+    async def exchange(server, socket_path, requests):
+        responses = []
+        async with await asyncio.start_unix_server(server.handle_connection, path=socket_path):
+            for request in requests:
+                reader, writer = await asyncio.open_unix_connection(socket_path)
+                writer.write(request)
+                await writer.drain()
+                head, _, body = (await reader.read()).partition(b'\r\n\r\n')
+                writer.close()
+                responses.append((int(head.split()[1]), json.loads(body)))
+        return responses
+    
+    work_dir = tempfile.mkdtemp()
+    server = AnalysisServer(PersonaDrivenAnalyzer(fast_start=True))
+    try:
+        index_dir = os.path.join(work_dir, 'index')
+        CorpusIndex.build(['a.pdf', 'b.pdf'], sections, TfidfVectorizer(stop_words='english')).save(index_dir)
+        
+        query = {'persona': 'Student', 'job': 'Study neural networks', 'index_dir': index_dir}
+        responses = asyncio.run(exchange(server, os.path.join(work_dir, 'server.sock'), [
+            http_request('POST', '/analyze', query),
+            http_request('POST', '/analyze', {**query, 'persona': 'Chemist'}),
+            http_request('POST', '/analyze', {'persona': 'Student'}),
+            http_request('POST', '/analyze', {'persona': 'Student', 'job': 'Study', 'documents': 'a.pdf'}),
+            http_request('POST', '/analyze', {'persona': 'Student', 'job': 'Study', 'input_dir': [work_dir]}),
+            http_request('GET', '/missing')
+        ]))
+        print(f"Statuses: {[status for status, _ in responses]}")
+        
+        assert [status for status, _ in responses] == [200, 200, 400, 400, 400, 404]
+        assert responses[3][1]['error'] == "documents must be a list of paths"
+        assert responses[0][1]['extracted_sections'][0]['section_title'] == 'Neural Networks'
+        assert responses[0][1]['metadata']['input_documents'] == ['a.pdf', 'b.pdf']
+        assert len(server.corpora) == 1
+    finally:
+        server.executor.shutdown()
+        shutil.rmtree(work_dir)
+
 def validate_output_format():
     """
     Validate output JSON format matches requirements
@@ -236,8 +1374,30 @@ def main():
     
     try:
         test_keyword_extraction()
+        test_keyword_memoization()
         test_heading_detection()
         test_section_ranking()
+        test_top_k_ranking()
+        test_two_stage_ranking()
+        test_subsection_engine()
+        test_layout_heading_detection()
+        test_extraction_cache()
+        test_section_store()
+        test_corpus_index()
+        test_incremental_index()
+        test_hashing_index()
+        test_bm25_index()
+        test_sharded_collection()
+        test_pipeline_metrics()
+        test_synthetic_corpus()
+        test_parallel_extraction()
+        test_extraction_budget()
+        test_outline_sections()
+        test_near_duplicates()
+        test_output_writer()
+        test_batch_query_loading()
+        test_keyword_matcher()
+        test_analysis_server()
         validate_output_format()
         run_performance_test()
         
@@ -0,0 +1,139 @@
+import threading
+from collections import OrderedDict
+from typing import List, Set, Tuple
+
+# NLTK's English stopword list, vendored so no corpus download is needed
+ENGLISH_STOP_WORDS = frozenset("""
+i me my myself we our ours ourselves you you're you've you'll you'd your yours yourself yourselves
+he him his himself she she's her hers herself it it's its itself they them their theirs themselves
+what which who whom this that that'll these those am is are was were be been being have has had
+having do does did doing a an the and but if or because as until while of at by for with about
+against between into through during before after above below to from up down in out on off over
+under again further then once here there when where why how all any both each few more most other
+some such no nor not only own same so than too very s t can will just don don't should should've
+now d ll m o re ve y ain aren aren't couldn couldn't didn didn't doesn doesn't hadn hadn't hasn
+hasn't haven haven't isn isn't ma mightn mightn't mustn mustn't needn needn't shan shan't shouldn
+shouldn't wasn wasn't weren weren't won won't wouldn wouldn't
+""".split())
+
+# Abbreviations that do not end a sentence, used as parameters of the vendored Punkt splitter
+PUNKT_ABBREVIATIONS = frozenset("""
+e.g i.e etc al fig figs eq eqs ref refs sec ch vol no nos pp ed eds cf vs resp approx ca
+dr mr mrs ms prof jr sr st inc ltd co corp dept est univ
+jan feb mar apr jun jul aug sep sept oct nov dec
+u.s u.k ph.d
+""".split())
+
+
+class TextResources:
+    """
+    Stopwords, sentence splitting, word tokenization and stemming, each loaded on first use.
+    Installed NLTK data is preferred unless vendored_only is set; missing data falls back to the
+    vendored stopword list and sentence splitter. Nothing is ever downloaded.
+    Stems are memoized in a bounded LRU cache, since the same words are stemmed again for every query.
+    """
+    
+    def __init__(self, vendored_only: bool = False, stem_cache_size: int = 65536):
+        self.vendored_only = vendored_only
+        self.stem_cache_size = stem_cache_size
+        self._stop_words = None
+        self._sentence_tokenizer = None
+        self._word_tokenizer = None
+        self._stemmer = None
+        self._stems = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def __getstate__(self):
+        # Copies sent to worker processes start with an empty stem cache
+        state = self.__dict__.copy()
+        state['_stems'] = OrderedDict()
+        del state['_lock']
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+    
+    @property
+    def stop_words(self) -> Set[str]:
+        if self._stop_words is None:
+            if self._has_nltk_data('corpora/stopwords'):
+                from nltk.corpus import stopwords
+                self._stop_words = set(stopwords.words('english'))
+            else:
+                self._stop_words = set(ENGLISH_STOP_WORDS)
+        return self._stop_words
+    
+    @property
+    def stemmer(self):
+        if self._stemmer is None:
+            from nltk.stem import PorterStemmer
+            self._stemmer = PorterStemmer()
+        return self._stemmer
+    
+    def stem(self, word: str) -> str:
+        """
+        Porter stem of a word, cached
+        """
+        with self._lock:
+            stem = self._stems.get(word)
+            if stem is not None:
+                self._stems.move_to_end(word)
+                return stem
+        
+        stem = self.stemmer.stem(word)
+        
+        with self._lock:
+            self._stems[word] = stem
+            if len(self._stems) > self.stem_cache_size:
+                self._stems.popitem(last=False)
+        
+        return stem
+    
+    @property
+    def sentence_tokenizer(self):
+        if self._sentence_tokenizer is None:
+            if self._has_nltk_data('tokenizers/punkt'):
+                import nltk
+                self._sentence_tokenizer = nltk.data.load('tokenizers/punkt/english.pickle')
+            else:
+                from nltk.tokenize.punkt import PunktParameters, PunktSentenceTokenizer
+                params = PunktParameters()
+                params.abbrev_types = set(PUNKT_ABBREVIATIONS)
+                self._sentence_tokenizer = PunktSentenceTokenizer(params)
+        return self._sentence_tokenizer
+    
+    def sentence_spans(self, text: str) -> List[Tuple[int, int]]:
+        """
+        (start, end) offsets of the sentences of a text
+        """
+        return list(self.sentence_tokenizer.span_tokenize(text))
+    
+    def word_tokenize(self, text: str) -> List[str]:
+        """
+        Split text into words the way nltk.word_tokenize does: sentences first, then Treebank-style words
+        """
+        if self._word_tokenizer is None:
+            from nltk.tokenize.destructive import NLTKWordTokenizer
+            self._word_tokenizer = NLTKWordTokenizer()
+        
+        return [
+            token
+            for start, end in self.sentence_spans(text)
+            for token in self._word_tokenizer.tokenize(text[start:end])
+        ]
+    
+    def _has_nltk_data(self, resource: str) -> bool:
+        """
+        Whether an NLTK data package is installed locally (never downloads it)
+        """
+        if self.vendored_only:
+            return False
+        
+        import nltk
+        try:
+            nltk.data.find(resource)
+            return True
+        except LookupError:
+            print(f"NLTK data '{resource}' is not installed; using the vendored copy")
+            return False